@@ -0,0 +1,232 @@
+# testquest/analytics.py
+"""Classical item analysis of a test's graded answers.
+
+Each student's latest graded attempt becomes one row of a dense
+student x question 0/1 score matrix, built from a single answer query.
+Every statistic is then a NumPy reduction over that matrix:
+
+* p-value: share of students answering the question correctly;
+* discrimination: point-biserial correlation between the question and the
+  rest of the test (total score minus that question, so an item does not
+  correlate with itself);
+* distractors: how often each choice was picked and the mean total score
+  of the students who picked it;
+* KR-20 reliability of the whole test.
+
+A latest result with no answers counts as all incorrect, except for legacy
+results completed before answers were linked to results (migration 1),
+whose answers the result_id backfill could not place: those are left out
+of the statistics and counted in ``unlinked_results``.
+
+Reports are cached per (test, version, latest result id), so a new
+submission or an edit to the test yields a fresh report and anything else
+is served from memory.
+"""
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import String, func, or_, text
+from sqlmodel import Session, select
+
+from cache import LRUCache
+from models import Question, QuestionChoice, StudentAnswer, Test, TestResult
+
+ANALYTICS_CACHE_SIZE = int(os.getenv("TESTQUEST_ANALYTICS_CACHE_SIZE", "64"))
+
+# ASCII unit separator; cannot appear in an authored choice label
+LABEL_SEPARATOR = "\x1f"
+
+# (test_id, test.version, latest result id) -> item analysis report
+analytics_cache = LRUCache(maxsize=ANALYTICS_CACHE_SIZE)
+
+
+def _rounded(values: np.ndarray) -> List[Optional[float]]:
+    # Undefined statistics (e.g. no variance) come out as None
+    return [None if np.isnan(value) else round(value, 4) for value in values.tolist()]
+
+
+def latest_results(test_id: int):
+    """Subquery of each student's latest result id for the test."""
+    return (
+        select(func.max(TestResult.id).label("result_id"))
+        .where(TestResult.test_id == test_id)
+        .group_by(TestResult.student_id)
+        .subquery()
+    )
+
+
+def is_legacy_result():
+    """Whether a TestResult predates StudentAnswer.result_id, so its answers may be unlinked."""
+    linked_since = text("(SELECT applied_at FROM schema_migration WHERE version = 1)")
+    return or_(TestResult.completed_at.is_(None), TestResult.completed_at < linked_since)
+
+
+def count_unlinked_results(session: Session, test_id: int) -> int:
+    """Latest results from before answers were linked to results that have no linked answers."""
+    latest = latest_results(test_id)
+    return session.execute(
+        select(func.count())
+        .select_from(latest)
+        .join(TestResult, TestResult.id == latest.c.result_id)
+        .where(
+            is_legacy_result(),
+            ~select(StudentAnswer.id).where(StudentAnswer.result_id == latest.c.result_id).exists(),
+        )
+    ).scalar_one()
+
+
+def load_responses(session: Session, test_id: int) -> Tuple[int, Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """Answers of each student's latest attempt as parallel arrays.
+
+    Returns the number of students and (student index, question_id,
+    is_correct, selected_choice), one entry per answer. Students whose
+    attempt has no answers have an index but no entries.
+
+    SQLite concatenates each attempt's answers into one row, so Python
+    builds one row per student rather than one tuple per answer, which is
+    what dominates the cost at a few hundred thousand answers.
+    """
+    latest = latest_results(test_id)
+    answer_count = func.count(StudentAnswer.id)
+    rows = session.execute(
+        select(
+            answer_count,
+            func.group_concat(StudentAnswer.question_id, " ", type_=String),
+            func.group_concat(StudentAnswer.is_correct, "", type_=String),
+            func.group_concat(func.coalesce(StudentAnswer.selected_choice, ""), LABEL_SEPARATOR, type_=String),
+        )
+        .select_from(latest)
+        .join(TestResult, TestResult.id == latest.c.result_id)
+        .outerjoin(StudentAnswer, StudentAnswer.result_id == latest.c.result_id)
+        .group_by(latest.c.result_id)
+        # Unlinked legacy results are reported, not graded as empty
+        .having(or_(answer_count > 0, ~is_legacy_result()))
+    ).all()
+    answered = [row for row in rows if row[0]]
+    if not answered:
+        empty = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool), np.zeros(0, dtype=str)
+        return len(rows), empty
+
+    counts = [row[0] for row in rows]
+    _, question_ids, correct, choices = zip(*answered)
+    return len(rows), (
+        np.repeat(np.arange(len(rows)), counts),
+        np.fromstring(" ".join(question_ids), dtype=np.int64, sep=" "),
+        np.frombuffer("".join(correct).encode(), dtype=np.uint8) == ord("1"),
+        np.array(LABEL_SEPARATOR.join(choices).split(LABEL_SEPARATOR)),
+    )
+
+
+def analyse(
+    question_ids: Sequence[int],
+    choices: Dict[int, List[dict]],
+    correct: Dict[int, str],
+    n_students: int,
+    responses: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+) -> dict:
+    """Item statistics from the values returned by ``load_responses``."""
+    question_ids = np.asarray(question_ids, dtype=np.int64)
+    n_questions = len(question_ids)
+    student_col, question_col, correct_col, choice_col = responses
+
+    # Answers to questions since removed from the test are ignored; their
+    # students stay in, with those questions unanswered
+    keep = np.isin(question_col, question_ids)
+    order = np.argsort(question_ids)
+    question_idx = order[np.searchsorted(question_ids, question_col[keep], sorter=order)]
+    student_idx = student_col[keep]
+    correct_col, choice_col = correct_col[keep], choice_col[keep]
+
+    scores = np.zeros((n_students, n_questions))
+    scores[student_idx, question_idx] = correct_col
+    answered = np.bincount(question_idx, minlength=n_questions)
+    totals = scores.sum(axis=1)
+
+    p_values = discrimination = np.full(n_questions, np.nan)
+    kr20 = np.nan
+    if n_students:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            p_values = scores.mean(axis=0)
+            item_variance = p_values * (1 - p_values)
+            rest = totals[:, None] - scores
+            covariance = (scores * rest).mean(axis=0) - p_values * rest.mean(axis=0)
+            discrimination = covariance / np.sqrt(item_variance * rest.var(axis=0))
+            if n_questions > 1:
+                kr20 = n_questions / (n_questions - 1) * (1 - item_variance.sum() / totals.var())
+
+    # Count picks and sum pickers' totals per (question, label) in one pass each
+    labels, label_idx = np.unique(choice_col, return_inverse=True)
+    picks = np.zeros((n_questions, len(labels)))
+    picker_totals = np.zeros((n_questions, len(labels)))
+    np.add.at(picks, (question_idx, label_idx), 1)
+    np.add.at(picker_totals, (question_idx, label_idx), totals[student_idx])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = picks / answered[:, None]
+        mean_totals = picker_totals / picks
+    label_index = {label: i for i, label in enumerate(labels.tolist())}
+
+    p_values, discrimination = _rounded(p_values), _rounded(discrimination)
+    items = []
+    for i, question_id in enumerate(question_ids.tolist()):
+        item_choices = []
+        for choice in choices.get(question_id, []):
+            j = label_index.get(choice["label"])
+            item_choices.append({
+                "label": choice["label"],
+                "text": choice["text"],
+                "is_correct": choice["label"] == correct.get(question_id),
+                "count": 0 if j is None else int(picks[i, j]),
+                "share": 0.0 if j is None or not answered[i] else round(float(shares[i, j]), 4),
+                "mean_total": None if j is None or not picks[i, j] else round(float(mean_totals[i, j]), 4),
+            })
+        items.append({
+            "question_id": question_id,
+            "answered": int(answered[i]),
+            "p_value": p_values[i],
+            "discrimination": discrimination[i],
+            "choices": item_choices,
+        })
+
+    return {
+        "students": n_students,
+        "questions": n_questions,
+        "mean_total": round(float(totals.mean()), 4) if n_students else None,
+        "kr20": None if np.isnan(kr20) else round(float(kr20), 4),
+        "items": items,
+    }
+
+
+def load_item_analysis(session: Session, test: Test) -> dict:
+    questions = session.exec(
+        select(Question.id, Question.correct_choice).where(Question.test_id == test.id).order_by(Question.order)
+    ).all()
+    choices: Dict[int, List[dict]] = {question_id: [] for question_id, _ in questions}
+    for question_id, label, text in session.exec(
+        select(QuestionChoice.question_id, QuestionChoice.label, QuestionChoice.text)
+        .join(Question, Question.id == QuestionChoice.question_id)
+        .where(Question.test_id == test.id)
+        .order_by(QuestionChoice.question_id, QuestionChoice.position)
+    ):
+        choices[question_id].append({"label": label, "text": text})
+
+    report = analyse(
+        [question_id for question_id, _ in questions],
+        choices,
+        dict(questions),
+        *load_responses(session, test.id),
+    )
+    # Unlinked legacy results are left out of every statistic; reported so a
+    # skewed or empty analysis is not silent
+    unlinked = count_unlinked_results(session, test.id)
+    return {"test_id": test.id, "version": test.version, "unlinked_results": unlinked, **report}
+
+
+def get_item_analysis(session: Session, test: Test) -> dict:
+    """Return the cached item analysis for the test's current version and results."""
+    latest_result = session.exec(
+        select(func.max(TestResult.id)).where(TestResult.test_id == test.id)
+    ).one()
+    return analytics_cache.get_or_build(
+        (test.id, test.version, latest_result), lambda: load_item_analysis(session, test)
+    )
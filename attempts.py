@@ -0,0 +1,196 @@
+# testquest/attempts.py
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from autosave import autosave_buffer, upsert_answers
+from grading import allocate_attempt_number, get_answer_key, grade_answers, save_result, score_percentage
+from models import Attempt, AttemptAnswer, AttemptCounter, Question, Test, TestResult
+from shuffling import attempt_seed
+from payloads import question_order
+
+# Slack for requests in flight when the clock runs out
+ATTEMPT_GRACE_SECONDS = int(os.getenv("TESTQUEST_ATTEMPT_GRACE_SECONDS", "5"))
+
+
+def get_own_attempt(session: Session, attempt_id: int, student_id: int) -> Attempt:
+    attempt = session.get(Attempt, attempt_id)
+    if not attempt or attempt.student_id != student_id:
+        raise HTTPException(status_code=404, detail="Attempt not found")
+    return attempt
+
+
+def attempt_deadline(test: Test, started_at: datetime) -> Optional[datetime]:
+    """When an attempt started at ``started_at`` must be closed, or None if it is untimed."""
+    deadlines = []
+    if test.is_timed and test.duration_minutes:
+        deadlines.append(started_at + timedelta(minutes=test.duration_minutes))
+    if test.available_until:
+        deadlines.append(test.available_until)
+    return min(deadlines) if deadlines else None
+
+
+def require_open_window(test: Test, grace_seconds: int = 0) -> None:
+    """Reject work on a test outside its available_from/available_until window."""
+    now = datetime.utcnow()
+    if test.available_from and now < test.available_from:
+        raise HTTPException(status_code=409, detail="Test is not open yet")
+    if test.available_until and now > test.available_until + timedelta(seconds=grace_seconds):
+        raise HTTPException(status_code=409, detail="Test is closed")
+
+
+def require_in_progress(attempt: Attempt) -> None:
+    if attempt.status != "in_progress":
+        raise HTTPException(status_code=409, detail=f"Attempt is already {attempt.status}")
+    # Reads the loaded row only; the expiry scheduler closes the attempt itself
+    if attempt.deadline and datetime.utcnow() > attempt.deadline + timedelta(seconds=ATTEMPT_GRACE_SECONDS):
+        raise HTTPException(status_code=409, detail="Attempt time limit has passed")
+
+
+def open_attempt(session: Session, student_id: int, test_id: int) -> Optional[Attempt]:
+    return session.exec(
+        select(Attempt).where(
+            Attempt.student_id == student_id,
+            Attempt.test_id == test_id,
+            Attempt.status == "in_progress",
+        )
+    ).first()
+
+
+def start_attempt(session: Session, student_id: int, test: Test) -> Attempt:
+    """Resume the student's in-progress attempt at ``test`` or open a new one (caller commits).
+
+    A unique index allows one open attempt per (student, test); when a
+    concurrent start wins the race, its attempt is returned and the
+    attempt number allocated here is rolled back. If that attempt was
+    already closed again, the start is rejected with 409 and may be retried.
+    """
+    test_id = test.id
+    attempt = open_attempt(session, student_id, test_id)
+    if attempt:
+        return attempt
+
+    # Checked before allocating, so a closed test never costs an attempt
+    require_open_window(test)
+    # Starting an attempt uses one of the test's max_attempts
+    attempt_number = allocate_attempt_number(session, student_id, test)
+    started_at = datetime.utcnow()
+    attempt = Attempt(
+        student_id=student_id,
+        test_id=test.id,
+        attempt_number=attempt_number,
+        seed=attempt_seed(student_id, test.id, attempt_number),
+        started_at=started_at,
+        deadline=attempt_deadline(test, started_at),
+    )
+    session.add(attempt)
+    try:
+        session.flush()
+    except IntegrityError:
+        session.rollback()
+        attempt = open_attempt(session, student_id, test_id)
+        if not attempt:
+            raise HTTPException(status_code=409, detail="An attempt was started concurrently; try again")
+    return attempt
+
+
+async def shuffle_seed(session: AsyncSession, test: Test, student_id: int, attempt_id: Optional[int] = None) -> int:
+    """Seed of the attempt the student is viewing ``test`` in.
+
+    Without an explicit attempt this is the open attempt's seed, or the one
+    the student's next attempt will get, so the order never changes between
+    viewing the test and starting it.
+    """
+    if attempt_id is not None:
+        attempt = await session.get(Attempt, attempt_id)
+        if not attempt or attempt.student_id != student_id or attempt.test_id != test.id:
+            raise HTTPException(status_code=404, detail="Attempt not found")
+        return attempt.seed
+
+    attempt = (await session.exec(
+        select(Attempt).where(
+            Attempt.student_id == student_id,
+            Attempt.test_id == test.id,
+            Attempt.status == "in_progress",
+        )
+    )).first()
+    if attempt:
+        return attempt.seed
+    counter = await session.get(AttemptCounter, (student_id, test.id))
+    return attempt_seed(student_id, test.id, (counter.last_attempt if counter else 0) + 1)
+
+
+def attempt_question_order(session: Session, test: Test, attempt: Attempt) -> List[int]:
+    """Question ids in the order this attempt showed them."""
+    question_ids = session.exec(
+        select(Question.id).where(Question.test_id == test.id).order_by(Question.order)
+    ).all()
+    return question_order(question_ids, test, attempt.seed)
+
+
+def saved_answers(session: Session, attempt: Attempt) -> Dict[int, Optional[str]]:
+    """Answers as the student last left them: persisted rows overlaid with unflushed updates."""
+    rows = session.exec(
+        select(AttemptAnswer.question_id, AttemptAnswer.selected_choice).where(AttemptAnswer.attempt_id == attempt.id)
+    ).all()
+    answers = dict(rows)
+    # Updates buffered after a finished attempt was claimed are never written
+    if attempt.status == "in_progress":
+        answers.update(autosave_buffer.pending(attempt.id))
+    return answers
+
+
+def finalize_attempt(session: Session, attempt: Attempt, test: Test, status: str = "submitted") -> TestResult:
+    """Grade the answers of an in-progress attempt and record the result (caller commits).
+
+    ``status`` is "submitted" for a student's submit and "expired" when the
+    deadline closed the attempt. The attempt's pending autosaves are written
+    in the same transaction as the claim; answers buffered after the claim
+    are dropped by the autosave flusher.
+    """
+    # A flush already holding this attempt's answers finishes before we claim
+    with autosave_buffer.paused():
+        submitted_at = datetime.utcnow()
+        claimed = session.execute(
+            update(Attempt)
+            .where(Attempt.id == attempt.id, Attempt.status == "in_progress")
+            .values(status=status, submitted_at=submitted_at)
+        ).rowcount
+        if not claimed:
+            raise HTTPException(status_code=409, detail="Attempt was already submitted")
+
+        # Left in the buffer, so a rollback loses nothing
+        pending = autosave_buffer.rows(attempt.id)
+        if pending:
+            upsert_answers(session, pending, claimed_attempt_id=attempt.id)
+
+    answer_key = get_answer_key(session, test)
+    answers = [
+        answer
+        for answer in session.exec(
+            select(AttemptAnswer).where(
+                AttemptAnswer.attempt_id == attempt.id,
+                AttemptAnswer.selected_choice.is_not(None),
+            )
+        ).all()
+        # Questions removed from the test since they were answered are not graded
+        if answer.question_id in answer_key
+    ]
+    score, graded = grade_answers(answer_key, answers)
+
+    result = save_result(
+        session,
+        student_id=attempt.student_id,
+        test_id=attempt.test_id,
+        score=score_percentage(score, len(answer_key)),
+        attempt_number=attempt.attempt_number,
+        graded=graded,
+    )
+    session.execute(update(Attempt).where(Attempt.id == attempt.id).values(result_id=result.id))
+    return result
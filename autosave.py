@@ -0,0 +1,165 @@
+# testquest/autosave.py
+"""Write-coalescing buffer for in-progress attempt answers.
+
+Autosave requests only touch memory: each update overwrites the pending
+answer for its (attempt, question). A background thread writes everything
+pending every AUTOSAVE_FLUSH_SECONDS as one executemany upsert, so a student
+clicking through ten answers costs one write instead of ten, and a burst
+from a whole class costs one transaction. Submit flushes its own attempt
+under its claim, so grading always sees the latest answers; anything
+recorded after the claim is dropped rather than written to a finished
+attempt.
+
+The buffer lives in the memory of one process, so the app must run as a
+single worker (see database.acquire_worker_lock): a submit handled by
+another worker would never see answers buffered here.
+"""
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import ContextManager, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, exists, or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session
+
+from database import engine
+from models import Attempt, AttemptAnswer
+
+logger = logging.getLogger(__name__)
+
+AUTOSAVE_FLUSH_SECONDS = float(os.getenv("TESTQUEST_AUTOSAVE_FLUSH_SECONDS", "2"))
+
+# attempt_id -> {question_id: (selected_choice, updated_at)}
+Pending = Dict[int, Dict[int, Tuple[Optional[str], datetime]]]
+
+
+def upsert_answers(session: Session, rows: List[dict], claimed_attempt_id: Optional[int] = None) -> None:
+    """Write buffered answers of attempts still in progress (or the one the caller just claimed)."""
+    answers, attempts = AttemptAnswer.__table__, Attempt.__table__
+    attempt_id = bindparam("attempt_id")
+    writable = attempts.c.status == "in_progress"
+    if claimed_attempt_id is not None:
+        writable = or_(writable, attempts.c.id == claimed_attempt_id)
+    values = select(
+        attempt_id,
+        bindparam("question_id"),
+        bindparam("selected_choice"),
+        bindparam("updated_at", type_=answers.c.updated_at.type),
+    ).where(exists().where(attempts.c.id == attempt_id, writable))
+
+    statement = sqlite_insert(answers).from_select(
+        [answers.c.attempt_id, answers.c.question_id, answers.c.selected_choice, answers.c.updated_at], values
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[answers.c.attempt_id, answers.c.question_id],
+        set_={
+            "selected_choice": statement.excluded.selected_choice,
+            "updated_at": statement.excluded.updated_at,
+        },
+        # An older buffered write must never overwrite a newer one
+        where=answers.c.updated_at <= statement.excluded.updated_at,
+    )
+    session.execute(statement, rows)
+
+
+def _as_rows(pending: Pending) -> List[dict]:
+    return [
+        {"attempt_id": aid, "question_id": qid, "selected_choice": choice, "updated_at": updated_at}
+        for aid, answers in pending.items()
+        for qid, (choice, updated_at) in answers.items()
+    ]
+
+
+class AutosaveBuffer:
+    def __init__(self, flush_interval: float = AUTOSAVE_FLUSH_SECONDS):
+        self.flush_interval = flush_interval
+        self._pending: Pending = {}
+        self._lock = threading.Lock()
+        # Held for a whole take-and-write, so a flush that returns has seen
+        # every earlier write land. Reentrant so a caller holding it through
+        # paused() can still claim attempts one by one.
+        self._flush_lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, attempt_id: int, answers: Iterable[Tuple[int, Optional[str]]]) -> int:
+        now = datetime.utcnow()
+        with self._lock:
+            pending = self._pending.setdefault(attempt_id, {})
+            count = 0
+            for question_id, selected_choice in answers:
+                pending[question_id] = (selected_choice, now)
+                count += 1
+        return count
+
+    def pending(self, attempt_id: int) -> Dict[int, Optional[str]]:
+        with self._lock:
+            return {qid: choice for qid, (choice, _) in self._pending.get(attempt_id, {}).items()}
+
+    def rows(self, attempt_id: int) -> List[dict]:
+        """The attempt's pending answers as upsert rows, left in the buffer."""
+        with self._lock:
+            answers = dict(self._pending.get(attempt_id, {}))
+        return _as_rows({attempt_id: answers})
+
+    def _take(self, attempt_id: Optional[int]) -> List[dict]:
+        with self._lock:
+            if attempt_id is None:
+                taken, self._pending = self._pending, {}
+            else:
+                answers = self._pending.pop(attempt_id, None)
+                taken = {attempt_id: answers} if answers else {}
+        return _as_rows(taken)
+
+    def _requeue(self, rows: List[dict]) -> None:
+        with self._lock:
+            for row in rows:
+                pending = self._pending.setdefault(row["attempt_id"], {})
+                current = pending.get(row["question_id"])
+                if current is None or current[1] < row["updated_at"]:
+                    pending[row["question_id"]] = (row["selected_choice"], row["updated_at"])
+
+    def paused(self) -> ContextManager:
+        """Hold off flushes, e.g. while an attempt is claimed and its pending answers written."""
+        return self._flush_lock
+
+    def flush(self, attempt_id: Optional[int] = None) -> int:
+        """Write pending answers (all, or one attempt's) in one transaction; returns rows written."""
+        with self._flush_lock:
+            rows = self._take(attempt_id)
+            if not rows:
+                return 0
+            try:
+                with Session(engine) as session:
+                    upsert_answers(session, rows)
+                    session.commit()
+            except Exception:
+                # Keep the answers for the next flush rather than dropping them
+                self._requeue(rows)
+                raise
+            return len(rows)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Autosave flush failed; will retry")
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="autosave-flush", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+autosave_buffer = AutosaveBuffer()
@@ -0,0 +1,105 @@
+# testquest/benchmarks/bench_item_analysis.py
+"""Time the item-analysis report on a large synthetic test.
+
+Seeds a throwaway SQLite database with one test and a graded attempt per
+student, then times ``analytics.load_item_analysis`` (query plus NumPy
+statistics) and a cached ``get_item_analysis`` hit.
+
+Usage:
+    python benchmarks/bench_item_analysis.py [--students 2000] [--questions 100] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix="testquest-bench-")
+os.environ.setdefault("TESTQUEST_DATABASE_URL", f"sqlite:///{WORKDIR}/bench.db")
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import insert  # noqa: E402
+from sqlmodel import Session, select  # noqa: E402
+
+from analytics import get_item_analysis, load_item_analysis  # noqa: E402
+from database import engine  # noqa: E402
+from migrations import migrate  # noqa: E402
+from models import Question, SQLModel, StudentAnswer, Test, TestResult, User  # noqa: E402
+
+LABELS = "ABCD"
+
+
+def seed(students: int, questions: int) -> Test:
+    now = datetime.utcnow()
+    rng = random.Random(0)
+    with Session(engine) as session:
+        teacher = User(username="teacher", password="pw", role="teacher")
+        session.add(teacher)
+        session.flush()
+        test = Test(name="Bench", created_by=teacher.id, max_attempts=1)
+        session.add(test)
+        session.flush()
+        session.execute(insert(Question), [
+            {"test_id": test.id, "question_text": f"Q{i}", "choices": json.dumps({label: label for label in LABELS}),
+             "correct_choice": "A", "explanation": "", "order": i, "requires_manual_grading": False}
+            for i in range(questions)
+        ])
+        session.execute(insert(User), [
+            {"username": f"student{i}", "password": "pw", "role": "student", "token_generation": 0, "created_at": now}
+            for i in range(students)
+        ])
+        question_ids = session.exec(select(Question.id).where(Question.test_id == test.id)).all()
+        student_ids = session.exec(select(User.id).where(User.role == "student")).all()
+        session.execute(insert(TestResult), [
+            {"student_id": student_id, "test_id": test.id, "score": 0.0, "completed_at": now, "attempt_number": 1}
+            for student_id in student_ids
+        ])
+        results = session.exec(select(TestResult.id, TestResult.student_id)).all()
+
+        answers = []
+        for result_id, student_id in results:
+            ability = rng.random()
+            for question_id in question_ids:
+                choice = "A" if rng.random() < ability else rng.choice(LABELS[1:])
+                answers.append({"student_id": student_id, "question_id": question_id, "result_id": result_id,
+                                "selected_choice": choice, "is_correct": choice == "A", "submitted_at": now})
+        session.execute(insert(StudentAnswer), answers)
+        session.commit()
+        session.refresh(test)
+        return test
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    SQLModel.metadata.create_all(engine)
+    migrate(engine)
+    test = seed(args.students, args.questions)
+    with Session(engine) as session:
+        load_item_analysis(session, test)  # warm up
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            report = load_item_analysis(session, test)
+        cold_ms = (time.perf_counter() - start) / args.repeat * 1000
+
+        get_item_analysis(session, test)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            get_item_analysis(session, test)
+        cached_ms = (time.perf_counter() - start) / args.repeat * 1000
+
+    print(f"{args.students} students x {args.questions} questions, KR-20 {report['kr20']}")
+    print(f"full analysis {cold_ms:>9.2f} ms")
+    print(f"cached        {cached_ms:>9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
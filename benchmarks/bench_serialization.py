@@ -0,0 +1,113 @@
+# testquest/benchmarks/bench_serialization.py
+"""Compare the default FastAPI serialization path with the orjson fast path.
+
+Seeds a throwaway SQLite database, then times the list endpoints that opt in
+to ``serialization.fast_json`` with the fast path switched off and on.
+
+Usage:
+    python benchmarks/bench_serialization.py [--rows 5000] [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix="testquest-bench-")
+os.environ.setdefault("TESTQUEST_DATABASE_URL", f"sqlite:///{WORKDIR}/bench.db")
+os.environ.setdefault("TESTQUEST_UPLOAD_DIR", os.path.join(WORKDIR, "uploads"))
+sys.path.insert(0, ROOT)
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+from sqlmodel import Session, select  # noqa: E402
+
+import serialization  # noqa: E402
+from database import engine  # noqa: E402
+from grading import rebuild_score_summaries  # noqa: E402
+from main import app  # noqa: E402
+from models import (  # noqa: E402
+    Classroom, ClassroomStudentLink, ClassroomTeacherLink, ClassroomTestAssignment, Test, TestResult, User,
+)
+from pagination import MAX_PAGE_SIZE  # noqa: E402
+from security import issue_token  # noqa: E402
+
+
+def seed(rows: int) -> dict:
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        session.execute(insert(User), [
+            {"username": f"user{i}", "password": "pw", "role": "student" if i else "admin",
+             "first_name": f"First{i}", "last_name": f"Last{i}", "email": f"user{i}@example.com",
+             "token_generation": 0, "created_at": now}
+            for i in range(rows)
+        ])
+        session.execute(insert(User), [{"username": "teacher", "password": "pw", "role": "teacher",
+                                        "token_generation": 0, "created_at": now}])
+        teacher = session.exec(select(User).where(User.username == "teacher")).one()
+        session.execute(insert(Test), [
+            {"name": f"Test {i}", "description": "Lorem ipsum dolor sit amet " * 8, "created_by": teacher.id,
+             "is_timed": False, "max_attempts": 3, "is_published": True, "show_results_immediately": True,
+             "allow_back_navigation": True, "shuffle_questions": False, "graded_by": "auto",
+             "version": 1, "created_at": now}
+            for i in range(rows)
+        ])
+        session.add(Classroom(id=1, name="Bench"))
+        session.add(ClassroomTeacherLink(classroom_id=1, teacher_id=teacher.id))
+        session.add(ClassroomTestAssignment(classroom_id=1, test_id=1))
+        session.execute(insert(ClassroomStudentLink), [
+            {"classroom_id": 1, "student_id": i} for i in range(2, rows + 1)
+        ])
+        session.execute(insert(TestResult), [
+            {"student_id": i, "test_id": 1, "score": float(i % 100), "completed_at": now, "attempt_number": 1}
+            for i in range(2, rows + 1)
+        ])
+        session.commit()
+        rebuild_score_summaries(session)
+        session.commit()
+        admin = session.get(User, 1)
+        return {
+            "admin": {"Authorization": f"Bearer {issue_token(admin)[0]}"},
+            "teacher": {"Authorization": f"Bearer {issue_token(teacher)[0]}"},
+        }
+
+
+def timed(client: TestClient, path: str, headers: dict, repeat: int) -> float:
+    client.get(path, headers=headers).raise_for_status()  # warm up caches
+    start = time.perf_counter()
+    for _ in range(repeat):
+        client.get(path, headers=headers).raise_for_status()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    page = f"limit={MAX_PAGE_SIZE}"
+    endpoints = [
+        ("admin", f"/admin/tests?{page}"),
+        ("admin", f"/admin/users/all?{page}"),
+        ("teacher", f"/tests?{page}"),
+        ("admin", f"/test/1/rankings?{page}"),
+        ("admin", f"/classroom/1/rankings?{page}"),
+        ("teacher", "/teacher/students"),
+    ]
+
+    with TestClient(app) as client:
+        headers = seed(args.rows)
+        print(f"{'endpoint':<36} {'default ms':>11} {'fast ms':>9} {'speedup':>8}")
+        for role, path in endpoints:
+            serialization.FAST_JSON = False
+            default_ms = timed(client, path, headers[role], args.repeat)
+            serialization.FAST_JSON = True
+            fast_ms = timed(client, path, headers[role], args.repeat)
+            print(f"{path:<36} {default_ms:>11.2f} {fast_ms:>9.2f} {default_ms / fast_ms:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
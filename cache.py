@@ -0,0 +1,117 @@
+# testquest/cache.py
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """Thread-safe mapping that drops the least recently used entry past ``maxsize``.
+
+    With ``maxbytes`` set, entries are also evicted while the summed
+    ``sizeof`` of the cached values exceeds it.
+    """
+
+    def __init__(self, maxsize: int = 128, maxbytes: Optional[int] = None, sizeof: Callable[[Any], int] = len):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.currbytes = 0
+        self._sizeof = sizeof
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._discard(key)
+            self._data[key] = value
+            if self.maxbytes is not None:
+                self.currbytes += self._sizeof(value)
+            while len(self._data) > self.maxsize or (
+                self.maxbytes is not None and self.currbytes > self.maxbytes
+            ):
+                self._discard(next(iter(self._data)))
+
+    def _discard(self, key: Hashable) -> Any:
+        # Caller holds the lock
+        value = self._data.pop(key, None)
+        if value is not None and self.maxbytes is not None:
+            self.currbytes -= self._sizeof(value)
+        return value
+
+    def _claim(self, key: Hashable):
+        """Return (cached, value) on a hit, else (False, (owner, future)) for the build."""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return True, self._data[key]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            return False, (owner, future)
+
+    def _finish(self, key: Hashable, future: Future, value: Any = None, exc: Optional[BaseException] = None) -> None:
+        if exc is None:
+            self.put(key, value)
+        with self._lock:
+            del self._inflight[key]
+        if exc is None:
+            future.set_result(value)
+        else:
+            future.set_exception(exc)
+
+    def get_or_build(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        """Return the cached value, building it at most once for concurrent misses."""
+        cached, value = self._claim(key)
+        if cached:
+            return value
+        owner, future = value
+        if not owner:
+            return future.result()
+
+        try:
+            value = build()
+        except BaseException as exc:
+            self._finish(key, future, exc=exc)
+            raise
+        self._finish(key, future, value)
+        return value
+
+    async def get_or_build_async(self, key: Hashable, build: Callable[[], Awaitable[Any]]) -> Any:
+        """Async variant of get_or_build; waiters await the owner without blocking the loop."""
+        cached, value = self._claim(key)
+        if cached:
+            return value
+        owner, future = value
+        if not owner:
+            return await asyncio.wrap_future(future)
+
+        try:
+            value = await build()
+        except BaseException as exc:
+            self._finish(key, future, exc=exc)
+            raise
+        self._finish(key, future, value)
+        return value
+
+    def pop(self, key: Hashable) -> Any:
+        with self._lock:
+            return self._discard(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.currbytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
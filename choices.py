@@ -0,0 +1,93 @@
+# testquest/choices.py
+"""Structured answer choices.
+
+``Question.choices`` stays the authored JSON object (label -> text) so
+existing clients keep working, but it is parsed exactly once: SQLite
+triggers (installed by migrations.add_question_choices) mirror it into
+``QuestionChoice`` rows on every insert and update, whichever code path
+wrote the question. Readers use those rows instead of ``json.loads``.
+"""
+import json
+from collections import defaultdict
+from typing import Dict, List
+
+from sqlalchemy import Select, and_, func
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from models import Question, QuestionChoice, StudentAnswer
+
+# Malformed or non-object choices simply produce no rows
+_INSERT_CHOICES = (
+    "INSERT INTO questionchoice (question_id, label, text, position) "
+    "SELECT {source}.id, choice.key, CAST(choice.value AS TEXT), "
+    "row_number() OVER (PARTITION BY {source}.id ORDER BY choice.id) "
+    "FROM {tables}json_each(CASE WHEN json_valid({source}.choices) AND json_type({source}.choices) = 'object' "
+    "THEN {source}.choices ELSE '{{}}' END) AS choice"
+)
+
+CHOICE_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS question_choices_ai AFTER INSERT ON question BEGIN "
+    + _INSERT_CHOICES.format(source="new", tables="") + "; END",
+    "CREATE TRIGGER IF NOT EXISTS question_choices_au AFTER UPDATE OF choices ON question BEGIN "
+    "DELETE FROM questionchoice WHERE question_id = old.id; "
+    + _INSERT_CHOICES.format(source="new", tables="") + "; END",
+    "CREATE TRIGGER IF NOT EXISTS question_choices_ad AFTER DELETE ON question BEGIN "
+    "DELETE FROM questionchoice WHERE question_id = old.id; END",
+    "CREATE INDEX IF NOT EXISTS ix_studentanswer_question_choice ON studentanswer (question_id, selected_choice)",
+    # Backfill existing questions
+    "DELETE FROM questionchoice",
+    _INSERT_CHOICES.format(source="question", tables="question, "),
+]
+
+
+def parse_choices(value) -> Dict[str, str]:
+    """Validate authored choices (JSON text or object) into a label -> text dict."""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise ValueError("choices must be a JSON object")
+    if not isinstance(value, dict) or not value:
+        raise ValueError("choices must be a non-empty JSON object")
+    return {str(label): str(text) for label, text in value.items()}
+
+
+def check_correct_choice(choices: Dict[str, str], correct_choice: str, requires_manual_grading: bool) -> None:
+    if not requires_manual_grading and correct_choice not in choices:
+        raise ValueError(f"correct_choice {correct_choice!r} is not one of the choices: {', '.join(choices)}")
+
+
+async def load_test_choices(session: AsyncSession, test_id: int) -> Dict[int, List[dict]]:
+    """question_id -> [{label, text}, ...] in authored order, in one query."""
+    rows = (await session.exec(
+        select(QuestionChoice.question_id, QuestionChoice.label, QuestionChoice.text)
+        .join(Question, Question.id == QuestionChoice.question_id)
+        .where(Question.test_id == test_id)
+        .order_by(QuestionChoice.question_id, QuestionChoice.position)
+    )).all()
+    choices = defaultdict(list)
+    for question_id, label, text in rows:
+        choices[question_id].append({"label": label, "text": text})
+    return choices
+
+
+def choice_counts_query(test_id: int) -> Select:
+    """One row per (question, choice) with how many answers picked it, including unpicked choices."""
+    return (
+        select(
+            Question.id,
+            Question.correct_choice,
+            QuestionChoice.label,
+            QuestionChoice.text,
+            func.count(StudentAnswer.id),
+        )
+        .join(QuestionChoice, QuestionChoice.question_id == Question.id)
+        .outerjoin(StudentAnswer, and_(
+            StudentAnswer.question_id == QuestionChoice.question_id,
+            StudentAnswer.selected_choice == QuestionChoice.label,
+        ))
+        .where(Question.test_id == test_id)
+        .group_by(Question.id, QuestionChoice.label)
+        .order_by(Question.order, Question.id, QuestionChoice.position)
+    )
@@ -1,9 +1,119 @@
 # testquest/database.py
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from sqlalchemy import event, make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in {"1", "true", "yes", "on"}
+
+
+# Engine profile; every setting can be overridden from the environment
+DATABASE_URL = os.getenv("TESTQUEST_DATABASE_URL", "sqlite:///./testquest.db")
+ASYNC_DATABASE_URL = os.getenv(
+    "TESTQUEST_ASYNC_DATABASE_URL", DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+)
+DB_ECHO = env_flag("TESTQUEST_DB_ECHO")
+DB_JOURNAL_MODE = os.getenv("TESTQUEST_DB_JOURNAL_MODE", "WAL")
+DB_SYNCHRONOUS = os.getenv("TESTQUEST_DB_SYNCHRONOUS", "NORMAL")
+DB_BUSY_TIMEOUT_MS = int(os.getenv("TESTQUEST_DB_BUSY_TIMEOUT_MS", "5000"))
+DB_MMAP_SIZE = int(os.getenv("TESTQUEST_DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_CACHE_SIZE_KB = int(os.getenv("TESTQUEST_DB_CACHE_SIZE_KB", str(64 * 1024)))
+DB_POOL_SIZE = int(os.getenv("TESTQUEST_DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("TESTQUEST_DB_MAX_OVERFLOW", "10"))
+DB_READ_POOL_SIZE = int(os.getenv("TESTQUEST_DB_READ_POOL_SIZE", "20"))
+DB_READ_MAX_OVERFLOW = int(os.getenv("TESTQUEST_DB_READ_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("TESTQUEST_DB_POOL_TIMEOUT", "30"))
+# Held by the one app process serving the database; defaults to "<database>.lock"
+_database_file = make_url(DATABASE_URL).database
+WORKER_LOCK_PATH = os.getenv("TESTQUEST_WORKER_LOCK_PATH") or (
+    f"{_database_file}.lock" if _database_file not in {None, "", ":memory:"} else None
+)
+_worker_lock = None
+
+
+def apply_pragmas(dbapi_connection, read_only: bool = False) -> None:
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode = {DB_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    # Negative cache_size is in KiB rather than pages
+    cursor.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+    if read_only:
+        cursor.execute("PRAGMA query_only = ON")
+    cursor.close()
+
+
+def make_engine(pool_size: int, max_overflow: int, read_only: bool = False, is_async: bool = False):
+    new_engine = (create_async_engine if is_async else create_engine)(
+        ASYNC_DATABASE_URL if is_async else DATABASE_URL,
+        echo=DB_ECHO,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=DB_POOL_TIMEOUT,
+        connect_args={"check_same_thread": False, "timeout": DB_BUSY_TIMEOUT_MS / 1000},
+    )
+    event.listen(
+        new_engine.sync_engine if is_async else new_engine,
+        "connect",
+        lambda dbapi_connection, connection_record: apply_pragmas(dbapi_connection, read_only),
+    )
+    return new_engine
+
 
-DATABASE_URL = "sqlite:///./testquest.db"
-engine = create_engine(DATABASE_URL, echo=True)
+# Writes (and anything that may write) go through `engine`; GET endpoints use
+# the separate read-only pool so readers never wait behind a writer in WAL mode.
+engine = make_engine(DB_POOL_SIZE, DB_MAX_OVERFLOW)
+read_engine = make_engine(DB_READ_POOL_SIZE, DB_READ_MAX_OVERFLOW, read_only=True)
+
+# Async (aiosqlite) read pool for hot read endpoints declared with `async def`,
+# so they are limited by the database rather than by the threadpool size
+async_read_engine = make_engine(DB_READ_POOL_SIZE, DB_READ_MAX_OVERFLOW, read_only=True, is_async=True)
 
 def get_session():
     with Session(engine) as session:
         yield session
+
+def get_read_session():
+    with Session(read_engine) as session:
+        yield session
+
+async def get_async_session():
+    async with AsyncSession(async_read_engine) as session:
+        yield session
+
+
+def acquire_worker_lock() -> None:
+    """Refuse to start a second app process against the same database.
+
+    Autosaved answers and attempt deadlines are kept in process memory
+    (autosave.py, expiry.py), so the app must run as a single worker;
+    scale with threads and the async read pool instead.
+    """
+    global _worker_lock
+    if _worker_lock is not None or WORKER_LOCK_PATH is None or fcntl is None:
+        return
+    lock_file = open(WORKER_LOCK_PATH, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        raise RuntimeError(
+            f"Another testquest worker already holds {WORKER_LOCK_PATH}; run a single worker per database"
+        )
+    # Kept open (and locked) for the life of the process
+    _worker_lock = lock_file
+
+
+def holds_worker_lock() -> bool:
+    """Whether this process is the database's single worker (always true where locking is unavailable)."""
+    return _worker_lock is not None or WORKER_LOCK_PATH is None or fcntl is None
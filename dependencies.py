@@ -1,17 +1,23 @@
 # testquest/dependencies.py
-from fastapi import Header, HTTPException, Depends
-from sqlmodel import Session, select
-from database import get_session
+from typing import Optional
+
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from models import User
+from security import verify_token
+
+bearer_scheme = HTTPBearer(auto_error=False)
 
-def get_current_user(
-    x_user_id: int = Header(...),
-    x_user_role: str = Header(...),
-    session: Session = Depends(get_session),
+async def get_current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
 ) -> User:
-    user = session.exec(
-        select(User).where(User.id == x_user_id, User.role == x_user_role)
-    ).first()
-    if not user:
-        raise HTTPException(status_code=401, detail="Invalid user or role in headers")
-    return user
+    # Tokens are verified from their signature alone: no database round trip,
+    # and no threadpool hop since this dependency never blocks
+    claims = verify_token(credentials.credentials) if credentials else None
+    if not claims:
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid or expired session token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return User(id=claims.user_id, role=claims.role)
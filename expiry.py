@@ -0,0 +1,136 @@
+# testquest/expiry.py
+"""Closes timed attempts when their deadline passes.
+
+Deadlines live in one in-process min-heap, so the scheduler thread sleeps
+until exactly the earliest deadline instead of polling the attempt table.
+Everything due at once is graded as "expired" in batches of
+EXPIRY_BATCH_SIZE per transaction. Entries for attempts that were
+submitted in the meantime are skipped when they come due.
+
+The heap only holds attempts this process loaded at startup or started
+itself, and expiring grades the answers buffered in this process, so the
+scheduler relies on the app running as a single worker. The lifespan takes
+database.acquire_worker_lock before starting it.
+"""
+import heapq
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlmodel import Session, select
+
+from attempts import ATTEMPT_GRACE_SECONDS, finalize_attempt
+from autosave import autosave_buffer
+from database import engine, holds_worker_lock
+from models import Attempt, Test
+
+logger = logging.getLogger(__name__)
+
+EXPIRY_BATCH_SIZE = int(os.getenv("TESTQUEST_EXPIRY_BATCH_SIZE", "200"))
+EXPIRY_RETRY_SECONDS = 30
+
+
+class ExpiryScheduler:
+    def __init__(self, batch_size: int = EXPIRY_BATCH_SIZE, grace_seconds: int = ATTEMPT_GRACE_SECONDS):
+        self.batch_size = batch_size
+        self.grace = timedelta(seconds=grace_seconds)
+        self._heap: List[Tuple[datetime, int]] = []
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, attempt_id: int, deadline: Optional[datetime]) -> None:
+        if deadline is not None:
+            self._push(deadline + self.grace, attempt_id)
+
+    def _push(self, due_at: datetime, attempt_id: int) -> None:
+        with self._cond:
+            heapq.heappush(self._heap, (due_at, attempt_id))
+            # Only a new earliest entry changes how long the thread sleeps
+            if self._heap[0] == (due_at, attempt_id):
+                self._cond.notify()
+
+    def load(self, session: Session) -> int:
+        """Schedule every open timed attempt, e.g. after a restart of the (single) worker."""
+        rows = session.exec(
+            select(Attempt.id, Attempt.deadline).where(
+                Attempt.status == "in_progress", Attempt.deadline.is_not(None)
+            )
+        ).all()
+        for attempt_id, deadline in rows:
+            self.schedule(attempt_id, deadline)
+        return len(rows)
+
+    def _pop_due(self) -> List[int]:
+        # Caller holds the lock
+        now = datetime.utcnow()
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            due.append(heapq.heappop(self._heap)[1])
+        return due
+
+    def _seconds_until_next(self) -> Optional[float]:
+        if not self._heap:
+            return None
+        return max((self._heap[0][0] - datetime.utcnow()).total_seconds(), 0)
+
+    def expire(self, attempt_ids: List[int]) -> int:
+        """Grade and close the given attempts if they are still open; returns how many were closed."""
+        closed = 0
+        # One pause for the batch; each claim writes its attempt's pending answers
+        with autosave_buffer.paused(), Session(engine) as session:
+            attempts = session.exec(
+                select(Attempt).where(Attempt.id.in_(attempt_ids), Attempt.status == "in_progress")
+            ).all()
+            tests = {test.id: test for test in session.exec(
+                select(Test).where(Test.id.in_({attempt.test_id for attempt in attempts}))
+            )}
+            for attempt in attempts:
+                try:
+                    finalize_attempt(session, attempt, tests[attempt.test_id], status="expired")
+                    closed += 1
+                except HTTPException:
+                    # Submitted by the student meanwhile
+                    continue
+            session.commit()
+        return closed
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopping and not (self._heap and self._seconds_until_next() == 0):
+                    self._cond.wait(self._seconds_until_next())
+                if self._stopping:
+                    return
+                due = self._pop_due()
+            try:
+                closed = self.expire(due)
+                logger.info("Expired %d of %d due attempts", closed, len(due))
+            except Exception:
+                logger.exception("Expiring attempts failed; retrying in %ss", EXPIRY_RETRY_SECONDS)
+                retry_at = datetime.utcnow() + timedelta(seconds=EXPIRY_RETRY_SECONDS)
+                for attempt_id in due:
+                    self._push(retry_at, attempt_id)
+
+    def start(self) -> None:
+        if self._thread is None:
+            # Another worker would never schedule the attempts started here
+            if not holds_worker_lock():
+                raise RuntimeError("The expiry scheduler must run in the single worker holding the database lock")
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="attempt-expiry", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            with self._cond:
+                self._stopping = True
+                self._cond.notify()
+            self._thread.join()
+            self._thread = None
+
+
+expiry_scheduler = ExpiryScheduler()
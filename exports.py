@@ -0,0 +1,97 @@
+# testquest/exports.py
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterator, List
+
+from sqlalchemy import Select
+from sqlmodel import Session, select
+
+from database import read_engine
+from models import Question, StudentAnswer, Test, TestResult, User
+
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+RESULT_COLUMNS = [
+    TestResult.id.label("result_id"),
+    TestResult.student_id,
+    User.username,
+    User.first_name,
+    User.last_name,
+    TestResult.test_id,
+    Test.name.label("test_name"),
+    TestResult.attempt_number,
+    TestResult.score,
+    TestResult.completed_at,
+]
+
+ANSWER_COLUMNS = [
+    StudentAnswer.question_id,
+    Question.order.label("question_order"),
+    StudentAnswer.selected_choice,
+    StudentAnswer.is_correct,
+]
+
+
+def gradebook_query(include_answers: bool = False) -> Select:
+    """Base query with one row per attempt, or per answer when include_answers is set."""
+    columns = RESULT_COLUMNS + (ANSWER_COLUMNS if include_answers else [])
+    statement = (
+        select(*columns)
+        .join(User, User.id == TestResult.student_id)
+        .join(Test, Test.id == TestResult.test_id)
+    )
+    if include_answers:
+        statement = (
+            statement
+            .outerjoin(StudentAnswer, StudentAnswer.result_id == TestResult.id)
+            .outerjoin(Question, Question.id == StudentAnswer.question_id)
+            .order_by(TestResult.id, Question.order, StudentAnswer.id)
+        )
+    else:
+        statement = statement.order_by(TestResult.id)
+    return statement
+
+
+def _format_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _encode_batch(fieldnames: List[str], rows, fmt: str, header: bool) -> str:
+    buffer = io.StringIO()
+    if fmt == "csv":
+        writer = csv.writer(buffer)
+        if header:
+            writer.writerow(fieldnames)
+        writer.writerows([_format_value(value) for value in row] for row in rows)
+    else:
+        for row in rows:
+            buffer.write(json.dumps(
+                {name: _format_value(value) for name, value in zip(fieldnames, row)},
+                separators=(",", ":"),
+            ))
+            buffer.write("\n")
+    return buffer.getvalue()
+
+
+def stream_export(statement: Select, fmt: str) -> Iterator[str]:
+    """Yield the encoded rows of ``statement`` batch by batch from a server-side cursor.
+
+    The generator opens its own session because it keeps running after the
+    request's dependencies have been torn down.
+    """
+    with Session(read_engine) as session:
+        result = session.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        fieldnames = list(result.keys())
+        header = True
+        for rows in result.partitions():
+            yield _encode_batch(fieldnames, rows, fmt, header)
+            header = False
+        if header and fmt == "csv":
+            yield _encode_batch(fieldnames, [], fmt, header)
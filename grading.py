@@ -0,0 +1,232 @@
+# testquest/grading.py
+import os
+from collections import Counter
+from datetime import datetime
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Tuple, Union
+
+from fastapi import HTTPException
+from sqlalchemy import event, func, insert, text, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import Session, select
+
+from cache import LRUCache
+from models import AttemptCounter, Question, StudentAnswer, StudentScoreSummary, StudentTestSummary, Test, TestResult
+from payloads import student_payload_cache
+
+ANSWER_KEY_CACHE_SIZE = int(os.getenv("TESTQUEST_ANSWER_KEY_CACHE_SIZE", "256"))
+
+# (test_id, test.version) -> read-only {question_id: correct_choice}
+answer_key_cache = LRUCache(maxsize=ANSWER_KEY_CACHE_SIZE)
+# Session.info key for (test_id, version) cache entries to drop on commit
+_STALE_TEST_VERSIONS = "stale_test_versions"
+
+
+def load_answer_key(session: Session, test_id: int) -> Dict[int, str]:
+    rows = session.exec(
+        select(Question.id, Question.correct_choice).where(Question.test_id == test_id)
+    ).all()
+    return {question_id: correct_choice for question_id, correct_choice in rows}
+
+
+def get_answer_key(session: Session, test: Test) -> Mapping[int, str]:
+    """Return the cached answer key snapshot for this version of the test."""
+    return answer_key_cache.get_or_build(
+        (test.id, test.version), lambda: MappingProxyType(load_answer_key(session, test.id))
+    )
+
+
+def bump_test_version(session: Session, test: Test) -> None:
+    """Mark the test as changed so cached snapshots of the old version are never reused (caller commits).
+
+    The increment happens in SQL, so concurrent edits each get their own
+    version; the old version's cache entries are evicted once the edit
+    has committed.
+    """
+    version = session.execute(
+        update(Test).where(Test.id == test.id).values(version=Test.version + 1).returning(Test.version)
+    ).scalar_one()
+    set_committed_value(test, "version", version)
+    session.info.setdefault(_STALE_TEST_VERSIONS, []).append((test.id, version - 1))
+
+
+@event.listens_for(Session, "after_commit")
+def _evict_stale_test_versions(session) -> None:
+    for key in session.info.pop(_STALE_TEST_VERSIONS, ()):
+        answer_key_cache.pop(key)
+        student_payload_cache.pop(key)
+
+
+@event.listens_for(Session, "after_rollback")
+def _keep_test_versions(session) -> None:
+    session.info.pop(_STALE_TEST_VERSIONS, None)
+
+
+def grade_answers(answer_key: Mapping[int, str], answers) -> Tuple[int, List[dict]]:
+    """Grade answers in memory; every question must belong to the answer key's test and be answered once."""
+    unknown = [ans.question_id for ans in answers if ans.question_id not in answer_key]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Question ID(s) {', '.join(map(str, unknown))} not found in this test.",
+        )
+    counts = Counter(ans.question_id for ans in answers)
+    repeated = [question_id for question_id, count in counts.items() if count > 1]
+    if repeated:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Question ID(s) {', '.join(map(str, repeated))} answered more than once.",
+        )
+
+    score = 0
+    graded = []
+    for ans in answers:
+        is_correct = answer_key[ans.question_id] == ans.selected_choice
+        if is_correct:
+            score += 1
+        graded.append({
+            "question_id": ans.question_id,
+            "selected_choice": ans.selected_choice,
+            "is_correct": is_correct,
+        })
+    return score, graded
+
+
+def score_percentage(score: int, questions: int) -> float:
+    """Percentage of the test's questions answered correctly; unanswered ones count as wrong."""
+    if not questions:
+        return 0
+    return round((score / questions) * 100)
+
+
+def allocate_attempt_number(session: Session, student_id: int, test: Test) -> int:
+    """Atomically take the student's next attempt number at ``test`` (caller commits).
+
+    A single upsert increments the (student, test) counter only while it is
+    below ``test.max_attempts``, so concurrent requests can never share a
+    number or exceed the limit. Raises 403 once every attempt is used.
+    """
+    counter = AttemptCounter.__table__
+    statement = sqlite_insert(counter).values(student_id=student_id, test_id=test.id, last_attempt=1)
+    statement = statement.on_conflict_do_update(
+        index_elements=[counter.c.student_id, counter.c.test_id],
+        set_={"last_attempt": counter.c.last_attempt + 1},
+        # No limit when max_attempts is unset
+        where=counter.c.last_attempt < test.max_attempts if test.max_attempts else None,
+    ).returning(counter.c.last_attempt)
+
+    attempt_number = session.execute(statement).scalar()
+    if attempt_number is None:
+        raise HTTPException(status_code=403, detail="Maximum number of attempts reached for this test.")
+    return attempt_number
+
+
+def save_result(
+    session: Session,
+    student_id: int,
+    test_id: int,
+    score: float,
+    attempt_number: int,
+    graded: List[dict],
+) -> TestResult:
+    """Write the result and all of its answers in one transaction (caller commits)."""
+    completed_at = datetime.utcnow()
+    result = TestResult(
+        student_id=student_id,
+        test_id=test_id,
+        score=score,
+        completed_at=completed_at,
+        attempt_number=attempt_number,
+    )
+    session.add(result)
+    session.flush()
+    update_score_summary(session, student_id, test_id, score, completed_at)
+
+    if graded:
+        session.execute(
+            insert(StudentAnswer),
+            [
+                {
+                    **row,
+                    "student_id": student_id,
+                    "result_id": result.id,
+                    "submitted_at": completed_at,
+                }
+                for row in graded
+            ],
+        )
+    return result
+
+
+def update_score_summary(
+    session: Session, student_id: int, test_id: int, score: float, completed_at: datetime
+) -> None:
+    """Fold one new attempt into the student's (student_id, test_id) and overall summary rows."""
+    summary = StudentTestSummary.__table__
+    statement = sqlite_insert(summary).values(
+        student_id=student_id,
+        test_id=test_id,
+        attempt_count=1,
+        total_score=score,
+        best_score=score,
+        latest_score=score,
+        average_score=score,
+        last_completed_at=completed_at,
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[summary.c.student_id, summary.c.test_id],
+        set_={
+            "attempt_count": summary.c.attempt_count + 1,
+            "total_score": summary.c.total_score + statement.excluded.total_score,
+            "best_score": func.max(summary.c.best_score, statement.excluded.best_score),
+            "latest_score": statement.excluded.latest_score,
+            "average_score": (summary.c.total_score + statement.excluded.total_score)
+            / (summary.c.attempt_count + 1),
+            "last_completed_at": statement.excluded.last_completed_at,
+        },
+    )
+    session.execute(statement)
+
+    overall = StudentScoreSummary.__table__
+    statement = sqlite_insert(overall).values(
+        student_id=student_id, attempt_count=1, total_score=score, average_score=score
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[overall.c.student_id],
+        set_={
+            "attempt_count": overall.c.attempt_count + 1,
+            "total_score": overall.c.total_score + statement.excluded.total_score,
+            "average_score": (overall.c.total_score + statement.excluded.total_score)
+            / (overall.c.attempt_count + 1),
+        },
+    )
+    session.execute(statement)
+
+
+def rebuild_score_summaries(session: Union[Session, Connection]) -> None:
+    """Recompute every summary row from TestResult (caller commits)."""
+    session.execute(text("DELETE FROM studenttestsummary"))
+    session.execute(text("""
+        INSERT INTO studenttestsummary (
+            student_id, test_id, attempt_count, total_score, best_score,
+            latest_score, average_score, last_completed_at
+        )
+        SELECT
+            r.student_id, r.test_id, COUNT(*), SUM(r.score), MAX(r.score),
+            (SELECT latest.score FROM testresult AS latest
+             WHERE latest.student_id = r.student_id AND latest.test_id = r.test_id
+             ORDER BY latest.completed_at DESC, latest.id DESC LIMIT 1),
+            AVG(r.score), MAX(r.completed_at)
+        FROM testresult AS r
+        GROUP BY r.student_id, r.test_id
+    """))
+    session.execute(text("DELETE FROM studentscoresummary"))
+    session.execute(text("""
+        INSERT INTO studentscoresummary (student_id, attempt_count, total_score, average_score)
+        SELECT student_id, COUNT(*), SUM(score), AVG(score)
+        FROM testresult
+        GROUP BY student_id
+    """))
+
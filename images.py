@@ -0,0 +1,120 @@
+# testquest/images.py
+"""Resized WebP derivatives of uploaded question images.
+
+Derivatives are rendered in a process pool after the upload has been
+stored, so the request never waits on image decoding. They live next to the
+original as ``<sha256>.<variant>.webp``; the original is always kept.
+"""
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+from typing import Dict, Optional
+
+from storage import UPLOAD_URL_PREFIX, StoredFile, stored_path, stored_url
+
+logger = logging.getLogger(__name__)
+
+# variant -> longest side in pixels; images are never upscaled
+IMAGE_VARIANTS = {
+    "display": 1280,
+    "thumb": 320,
+}
+IMAGE_QUALITY = int(os.getenv("TESTQUEST_IMAGE_QUALITY", "80"))
+IMAGE_WORKERS = int(os.getenv("TESTQUEST_IMAGE_WORKERS", "2"))
+# Forking a server that already runs threads can deadlock the child, so
+# workers start from a clean interpreter instead
+IMAGE_WORKER_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# Animated GIFs would lose their animation, so they are served as uploaded
+DERIVABLE_EXTENSIONS = {".png", ".jpg", ".webp"}
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def variant_name(name: str, variant: str) -> str:
+    return f"{os.path.splitext(name)[0]}.{variant}.webp"
+
+
+def render_variants(source: str) -> Dict[str, str]:
+    """Write every missing derivative of ``source``; runs in a worker process."""
+    # Imported here so the web process never loads Pillow
+    from PIL import Image, ImageOps
+
+    written = {}
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+        for variant, size in IMAGE_VARIANTS.items():
+            path = os.path.join(os.path.dirname(source), variant_name(os.path.basename(source), variant))
+            if not os.path.exists(path):
+                resized = image.copy()
+                resized.thumbnail((size, size), Image.Resampling.LANCZOS)
+                temp_path = f"{path}.tmp"
+                resized.save(temp_path, "WEBP", quality=IMAGE_QUALITY, method=4)
+                os.replace(temp_path, path)
+            written[variant] = path
+    return written
+
+
+def _variants_done(image_url: str, future: Future) -> None:
+    # Imported here: payloads imports this module, and workers never need a database
+    from sqlmodel import Session, select
+
+    from database import read_engine
+    from models import Question, Test
+    from payloads import student_payload_cache
+
+    if future.exception():
+        logger.error("Rendering image variants failed", exc_info=future.exception())
+        return
+    # Payloads cached before the variants existed still point at the original
+    with Session(read_engine) as session:
+        stale = session.exec(
+            select(Test.id, Test.version)
+            .join(Question, Question.test_id == Test.id)
+            .where(Question.image_url == image_url)
+            .distinct()
+        ).all()
+    for test_id, version in stale:
+        student_payload_cache.pop((test_id, version))
+
+
+def schedule_variants(stored: StoredFile) -> Optional[Future]:
+    """Queue derivative rendering for a newly stored upload."""
+    global _executor
+    if os.path.splitext(stored.path)[1] not in DERIVABLE_EXTENSIONS:
+        return None
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context(IMAGE_WORKER_START_METHOD)
+        )
+    future = _executor.submit(render_variants, stored.path)
+    future.add_done_callback(partial(_variants_done, stored.url))
+    return future
+
+
+def shutdown_image_workers() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+def image_variants(image_url: Optional[str]) -> Optional[Dict[str, str]]:
+    """URLs of the rendered derivatives of a stored image, plus the original."""
+    prefix = f"{UPLOAD_URL_PREFIX}/"
+    if not image_url or not image_url.startswith(prefix):
+        return None
+    name = os.path.basename(image_url)
+    variants = {
+        variant: stored_url(variant_name(name, variant))
+        for variant in IMAGE_VARIANTS
+        if os.path.exists(stored_path(variant_name(name, variant)))
+    }
+    if not variants:
+        return None
+    variants["original"] = image_url
+    return variants
@@ -0,0 +1,90 @@
+# testquest/importers.py
+import codecs
+import csv
+import json
+from itertools import islice
+from typing import Iterable, Iterator, List, Tuple, TypeVar
+
+from fastapi import HTTPException, UploadFile
+from pydantic import ValidationError
+
+T = TypeVar("T")
+
+IMPORT_BATCH_SIZE = 500
+
+
+def upload_format(upload: UploadFile) -> str:
+    filename = (upload.filename or "").lower()
+    content_type = (upload.content_type or "").lower()
+    if filename.endswith(".csv") or "csv" in content_type:
+        return "csv"
+    if filename.endswith((".ndjson", ".jsonl")) or "ndjson" in content_type:
+        return "ndjson"
+    if filename.endswith(".json") or "json" in content_type:
+        return "json"
+    raise HTTPException(status_code=415, detail="Upload a .csv, .json or .ndjson file")
+
+
+def validation_message(exc: ValidationError) -> str:
+    """The errors of a failed row as "field: message"; errors from model validators name no field."""
+    return "; ".join(
+        f"{'.'.join(map(str, err['loc']))}: {err['msg']}" if err["loc"] else err["msg"] for err in exc.errors()
+    )
+
+
+def iter_records(upload: UploadFile) -> Iterator[Tuple[int, dict]]:
+    """Yield (row_number, record) pairs from an uploaded CSV, JSON array or NDJSON file.
+
+    Records are whatever the file contained; callers validate that each one is
+    a dict of the expected shape.
+
+    CSV and NDJSON are decoded incrementally, so the whole upload is never
+    held in memory as parsed rows.
+    """
+    fmt = upload_format(upload)
+    upload.file.seek(0)
+    lines = codecs.getreader("utf-8-sig")(upload.file)
+    # Decoding and CSV parsing fail lazily, part way through the import
+    try:
+        yield from _parse_records(fmt, lines)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="File is not valid UTF-8 text")
+    except csv.Error as exc:
+        raise HTTPException(status_code=400, detail=f"Invalid CSV: {exc}")
+
+
+def _parse_records(fmt: str, lines) -> Iterator[Tuple[int, dict]]:
+    if fmt == "csv":
+        # Row 1 is the header line
+        for row_number, record in enumerate(csv.DictReader(lines), start=2):
+            yield row_number, {
+                key: value for key, value in record.items() if key is not None and value not in ("", None)
+            }
+    elif fmt == "ndjson":
+        for row_number, line in enumerate(lines, start=1):
+            if line.strip():
+                yield row_number, parse_json_record(line)
+    else:
+        try:
+            records = json.load(lines)
+        except UnicodeDecodeError:
+            raise
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON: {exc}")
+        if not isinstance(records, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of records")
+        yield from enumerate(records, start=1)
+
+
+def parse_json_record(line: str):
+    # Malformed lines become None and are reported as per-row errors by the caller
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+def batched(items: Iterable[T], size: int = IMPORT_BATCH_SIZE) -> Iterator[List[T]]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
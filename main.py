@@ -1,19 +1,47 @@
 # testquest/main.py
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from routers import auth, student, teacher, admin, classroom, test
+from routers import auth, student, teacher, admin, classroom, test, uploads
 import models
-from database import engine
-from fastapi.staticfiles import StaticFiles
+from autosave import autosave_buffer
+from database import acquire_worker_lock, engine, async_read_engine
+from expiry import expiry_scheduler
+from images import shutdown_image_workers
+from migrations import migrate
+from security import load_token_generations
+from shuffling import load_shuffle_key
+from storage import ensure_upload_dir
+from sqlmodel import Session
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    acquire_worker_lock()
+    models.SQLModel.metadata.create_all(engine)
+    migrate(engine)
+    ensure_upload_dir()
 
-app = FastAPI()
+    with Session(engine) as session:
+        load_token_generations(session)
+        load_shuffle_key(session)
+        session.commit()
+        expiry_scheduler.load(session)
+    autosave_buffer.start()
+    expiry_scheduler.start()
+    yield
+    expiry_scheduler.stop()
+    autosave_buffer.stop()
+    shutdown_image_workers()
+    await async_read_engine.dispose()
 
-app.mount("/uploaded_images", StaticFiles(directory="/Users/xed/Downloads/uploaded_images"), name="uploaded_images")
 
-models.SQLModel.metadata.create_all(engine)
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(auth.router)
 app.include_router(student.router)
 app.include_router(teacher.router)
 app.include_router(admin.router)
 app.include_router(classroom.router)
-app.include_router(test.router)
\ No newline at end of file
+app.include_router(test.router)
+app.include_router(uploads.router)
@@ -0,0 +1,369 @@
+# testquest/migrations.py
+"""Versioned schema migrations for an existing testquest database.
+
+``SQLModel.metadata.create_all`` only creates missing tables; it never alters
+existing ones or adds indexes to them. Every schema change after the initial
+tables is recorded here as a numbered migration and applied exactly once.
+
+Usage:
+    python migrations.py                # apply pending migrations
+    python migrations.py --check-plans  # fail if a hot query does a full table scan
+"""
+import re
+import sys
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[Connection], None]
+
+
+def column_names(conn: Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(text(f'PRAGMA table_info("{table}")'))]
+
+
+def add_column_if_missing(conn: Connection, table: str, column: str, ddl: str) -> None:
+    if column not in column_names(conn, table):
+        conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {ddl}'))
+
+
+def add_model_columns(conn: Connection) -> None:
+    add_column_if_missing(conn, "test", "version", "version INTEGER NOT NULL DEFAULT 1")
+    add_column_if_missing(conn, "user", "token_generation", "token_generation INTEGER NOT NULL DEFAULT 0")
+    add_column_if_missing(
+        conn, "studentanswer", "result_id", "result_id INTEGER REFERENCES testresult (id)"
+    )
+
+
+HOT_PATH_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_testresult_student_test ON testresult (student_id, test_id)",
+    "CREATE INDEX IF NOT EXISTS ix_studentanswer_student_question ON studentanswer (student_id, question_id)",
+    "CREATE INDEX IF NOT EXISTS ix_studentanswer_result ON studentanswer (result_id)",
+    'CREATE INDEX IF NOT EXISTS ix_question_test_order ON question (test_id, "order")',
+    "CREATE INDEX IF NOT EXISTS ix_classroomtestassignment_classroom_test "
+    "ON classroomtestassignment (classroom_id, test_id)",
+    "CREATE INDEX IF NOT EXISTS ix_classroomtestassignment_test ON classroomtestassignment (test_id)",
+    "CREATE INDEX IF NOT EXISTS ix_classroomteacherlink_teacher ON classroomteacherlink (teacher_id, classroom_id)",
+    "CREATE INDEX IF NOT EXISTS ix_classroomstudentlink_student ON classroomstudentlink (student_id, classroom_id)",
+    "CREATE INDEX IF NOT EXISTS ix_studenttestsummary_test_best ON studenttestsummary (test_id, best_score DESC)",
+    "CREATE INDEX IF NOT EXISTS ix_test_created_by ON test (created_by)",
+]
+
+
+def add_hot_path_indexes(conn: Connection) -> None:
+    for statement in HOT_PATH_INDEXES:
+        conn.execute(text(statement))
+
+
+def backfill_score_summaries(conn: Connection) -> None:
+    from grading import rebuild_score_summaries
+
+    if not conn.execute(text("SELECT 1 FROM studenttestsummary LIMIT 1")).first():
+        rebuild_score_summaries(conn)
+
+
+def add_export_indexes(conn: Connection) -> None:
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_testresult_test ON testresult (test_id)"))
+
+
+def add_search_indexes(conn: Connection) -> None:
+    from search import FTS_INDEXES, fts_ddl
+
+    for name in FTS_INDEXES:
+        for statement in fts_ddl(name):
+            conn.execute(text(statement))
+
+
+def add_question_choices(conn: Connection) -> None:
+    from choices import CHOICE_DDL
+
+    for statement in CHOICE_DDL:
+        conn.execute(text(statement))
+
+
+def add_attempt_indexes(conn: Connection) -> None:
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_attempt_student_test_status ON attempt (student_id, test_id, status)"
+    ))
+
+
+def add_shuffle_columns(conn: Connection) -> None:
+    add_column_if_missing(conn, "test", "shuffle_choices", "shuffle_choices BOOLEAN NOT NULL DEFAULT 0")
+    add_column_if_missing(conn, "attempt", "seed", "seed INTEGER NOT NULL DEFAULT 0")
+    backfill_attempt_seeds(conn)
+
+
+def backfill_attempt_seeds(conn: Connection) -> None:
+    # Open attempts from before the seed column would all share seed 0 and
+    # so the same "shuffled" order; give each the seed it would have had
+    from shuffling import attempt_seed, load_shuffle_key
+
+    load_shuffle_key(conn)
+    rows = conn.execute(text(
+        "SELECT id, student_id, test_id, attempt_number FROM attempt WHERE status = 'in_progress' AND seed = 0"
+    )).all()
+    if rows:
+        conn.execute(
+            text("UPDATE attempt SET seed = :seed WHERE id = :id"),
+            [{"id": attempt_id, "seed": attempt_seed(student_id, test_id, attempt_number)}
+             for attempt_id, student_id, test_id, attempt_number in rows],
+        )
+
+
+def add_attempt_deadlines(conn: Connection) -> None:
+    add_column_if_missing(conn, "attempt", "deadline", "deadline DATETIME")
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_attempt_status_deadline ON attempt (status, deadline)"))
+
+
+def add_attempt_counters(conn: Connection) -> None:
+    # Concurrent submits could share an attempt number; renumber those
+    # (student, test) histories in completion order before enforcing uniqueness
+    conn.execute(text("""
+        UPDATE testresult SET attempt_number = (
+            SELECT COUNT(*) FROM testresult AS earlier
+            WHERE earlier.student_id = testresult.student_id
+              AND earlier.test_id = testresult.test_id
+              AND earlier.id <= testresult.id
+        )
+        WHERE (student_id, test_id) IN (
+            SELECT student_id, test_id FROM testresult
+            GROUP BY student_id, test_id
+            HAVING COUNT(*) != COUNT(DISTINCT attempt_number)
+        )
+    """))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_testresult_attempt ON testresult (student_id, test_id, attempt_number)"
+    ))
+    conn.execute(text("""
+        INSERT OR REPLACE INTO attemptcounter (student_id, test_id, last_attempt)
+        SELECT student_id, test_id, MAX(attempt_number) FROM (
+            SELECT student_id, test_id, attempt_number FROM testresult
+            UNION ALL
+            SELECT student_id, test_id, attempt_number FROM attempt
+        )
+        GROUP BY student_id, test_id
+    """))
+
+
+def add_user_autoincrement(conn: Connection) -> None:
+    # SQLite reuses the largest rowid after a delete, so a new user could
+    # inherit a deleted user's id together with their still-signed tokens.
+    # AUTOINCREMENT needs a table rebuild; indexes and triggers are recreated.
+    table_sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'user'")).scalar()
+    if "AUTOINCREMENT" not in table_sql.upper():
+        rebuilt_sql, replaced = re.subn(r",\s*PRIMARY KEY \(id\)", "", table_sql)
+        rebuilt_sql, replaced_id = re.subn(
+            r"^CREATE TABLE \"?user\"? \(\s*id INTEGER NOT NULL",
+            'CREATE TABLE user_rebuild (id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT',
+            rebuilt_sql,
+        )
+        if not (replaced and replaced_id):
+            raise RuntimeError(f"Unexpected user table definition: {table_sql}")
+        dependents = conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE tbl_name = 'user' AND type IN ('index', 'trigger') AND sql IS NOT NULL"
+        )).scalars().all()
+        conn.execute(text(rebuilt_sql))
+        conn.execute(text('INSERT INTO user_rebuild SELECT * FROM "user"'))
+        conn.execute(text('DROP TABLE "user"'))
+        conn.execute(text('ALTER TABLE user_rebuild RENAME TO "user"'))
+        for statement in dependents:
+            conn.execute(text(statement))
+
+    # Revocations used to live only in memory; keep the ones still on record
+    conn.execute(text(
+        "INSERT OR IGNORE INTO tokenrevocation (user_id, min_generation) "
+        'SELECT id, token_generation FROM "user" WHERE token_generation > 0'
+    ))
+
+
+def backfill_answer_results(conn: Connection) -> None:
+    # Answers written before result_id existed were saved in the same request
+    # as their result, just before it; link each one to the earliest result of
+    # its student and test completed at or after it. Answers to questions that
+    # have since been deleted cannot be placed and stay unlinked.
+    conn.execute(text("""
+        UPDATE studentanswer SET result_id = (
+            SELECT testresult.id FROM testresult
+            JOIN question ON question.test_id = testresult.test_id
+            WHERE question.id = studentanswer.question_id
+              AND testresult.student_id = studentanswer.student_id
+              AND testresult.completed_at >= studentanswer.submitted_at
+            ORDER BY testresult.completed_at, testresult.id
+            LIMIT 1
+        )
+        WHERE result_id IS NULL
+    """))
+
+
+def narrow_search_update_triggers(conn: Connection) -> None:
+    # The FTS update triggers fired on every update of their source row
+    from search import FTS_INDEXES, fts_update_trigger
+
+    for name in FTS_INDEXES:
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {name}_au"))
+        conn.execute(text(fts_update_trigger(name)))
+
+
+def add_open_attempt_index(conn: Connection) -> None:
+    # Concurrent starts could each open an attempt; keep the oldest open one
+    # per (student, test) before enforcing uniqueness. The closed duplicates
+    # were never graded and keep their autosaved answers.
+    conn.execute(text("""
+        UPDATE attempt SET status = 'expired'
+        WHERE status = 'in_progress' AND id NOT IN (
+            SELECT MIN(id) FROM attempt WHERE status = 'in_progress' GROUP BY student_id, test_id
+        )
+    """))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_attempt_open ON attempt (student_id, test_id) "
+        "WHERE status = 'in_progress'"
+    ))
+
+
+def add_student_score_summaries(conn: Connection) -> None:
+    from grading import rebuild_score_summaries
+
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_studentscoresummary_average "
+        "ON studentscoresummary (average_score DESC, student_id DESC)"
+    ))
+    rebuild_score_summaries(conn)
+
+
+def store_legacy_images(conn: Connection) -> None:
+    # Images uploaded before content addressing sit flat under the upload
+    # root by their original name; store each under its digest and relink
+    # the questions so they are served with immutable caching. The
+    # originals stay put for links outside the question table.
+    import os
+
+    from storage import UPLOAD_URL_PREFIX, legacy_path, store_legacy_file
+
+    prefix = f"{UPLOAD_URL_PREFIX}/"
+    urls = conn.execute(text("SELECT DISTINCT image_url FROM question WHERE image_url IS NOT NULL")).scalars()
+    for url in [url for url in urls if url.startswith(prefix)]:
+        path = legacy_path(url[len(prefix):])
+        if not path or not os.path.isfile(path):
+            continue
+        stored = store_legacy_file(path)
+        if stored:
+            conn.execute(
+                text("UPDATE question SET image_url = :new WHERE image_url = :old"), {"new": stored.url, "old": url}
+            )
+
+
+MIGRATIONS = [
+    Migration(1, "add_model_columns", add_model_columns),
+    Migration(2, "add_hot_path_indexes", add_hot_path_indexes),
+    Migration(3, "backfill_score_summaries", backfill_score_summaries),
+    Migration(4, "add_export_indexes", add_export_indexes),
+    Migration(5, "add_search_indexes", add_search_indexes),
+    Migration(6, "add_question_choices", add_question_choices),
+    Migration(7, "add_attempt_indexes", add_attempt_indexes),
+    Migration(8, "add_shuffle_columns", add_shuffle_columns),
+    Migration(9, "add_attempt_deadlines", add_attempt_deadlines),
+    Migration(10, "add_attempt_counters", add_attempt_counters),
+    Migration(11, "add_user_autoincrement", add_user_autoincrement),
+    Migration(12, "backfill_answer_results", backfill_answer_results),
+    Migration(13, "narrow_search_update_triggers", narrow_search_update_triggers),
+    Migration(14, "add_open_attempt_index", add_open_attempt_index),
+    Migration(15, "add_student_score_summaries", add_student_score_summaries),
+    # Databases that applied migration 8 before it backfilled seeds
+    Migration(16, "backfill_attempt_seeds", backfill_attempt_seeds),
+    Migration(17, "store_legacy_images", store_legacy_images),
+]
+
+
+def migrate(engine: Engine) -> List[int]:
+    """Apply every pending migration, each in its own transaction; returns applied versions."""
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migration ("
+            "version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at DATETIME NOT NULL)"
+        ))
+        applied = {row[0] for row in conn.execute(text("SELECT version FROM schema_migration"))}
+
+    newly_applied = []
+    for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+        if migration.version in applied:
+            continue
+        with engine.begin() as conn:
+            migration.apply(conn)
+            conn.execute(
+                text("INSERT INTO schema_migration (version, name, applied_at) VALUES (:v, :n, :at)"),
+                {"v": migration.version, "n": migration.name, "at": datetime.utcnow()},
+            )
+        newly_applied.append(migration.version)
+    return newly_applied
+
+
+# Queries on the request hot path; none of them may scan a whole table.
+HOT_QUERIES: List[Tuple[str, str]] = [
+    ("answer key", "SELECT id, correct_choice FROM question WHERE test_id = 1"),
+    ("student payload", 'SELECT * FROM question WHERE test_id = 1 ORDER BY "order"'),
+    ("attempt counter", "SELECT last_attempt FROM attemptcounter WHERE student_id = 1 AND test_id = 1"),
+    ("latest test result", "SELECT max(id) FROM testresult WHERE test_id = 1"),
+    ("student answers", "SELECT * FROM studentanswer WHERE student_id = 1 AND question_id = 1"),
+    ("answers by attempt", "SELECT * FROM studentanswer WHERE result_id = 1"),
+    ("student classrooms", "SELECT classroom_id FROM classroomstudentlink WHERE student_id = 1"),
+    ("teacher classrooms", "SELECT classroom_id FROM classroomteacherlink WHERE teacher_id = 1"),
+    ("classroom roster", "SELECT student_id FROM classroomstudentlink WHERE classroom_id = 1"),
+    ("classroom tests", "SELECT test_id FROM classroomtestassignment WHERE classroom_id = 1"),
+    ("test assignment", "SELECT id FROM classroomtestassignment WHERE classroom_id = 1 AND test_id = 1"),
+    ("test classrooms", "SELECT classroom_id FROM classroomtestassignment WHERE test_id = 1"),
+    ("test rankings", "SELECT * FROM studenttestsummary WHERE test_id = 1 ORDER BY best_score DESC LIMIT 10"),
+    ("top students", "SELECT student_id, average_score FROM studentscoresummary WHERE EXISTS ("
+                     "SELECT 1 FROM user WHERE user.id = student_id AND role = 'student') "
+                     "ORDER BY average_score DESC, student_id DESC LIMIT 10"),
+    ("teacher tests", "SELECT * FROM test WHERE created_by = 1"),
+    ("question choices", "SELECT * FROM questionchoice WHERE question_id = 1"),
+    ("open attempt", "SELECT * FROM attempt WHERE student_id = 1 AND test_id = 1 AND status = 'in_progress'"),
+    ("open deadlines", "SELECT id, deadline FROM attempt WHERE status = 'in_progress' AND deadline IS NOT NULL"),
+    ("attempt answers", "SELECT * FROM attemptanswer WHERE attempt_id = 1"),
+    ("choice counts", "SELECT count(*) FROM studentanswer WHERE question_id = 1 AND selected_choice = 'A'"),
+]
+
+
+# Hot query name -> tables it may scan, e.g. an index walked in order and cut short by LIMIT
+ALLOWED_SCANS: Dict[str, Tuple[str, ...]] = {
+    "top students": ("studentscoresummary",),
+}
+
+
+def full_scans(conn: Connection, sql: str, allowed: Tuple[str, ...] = ()) -> List[str]:
+    """Plan rows that read a whole table, including "SCAN t USING (COVERING) INDEX" walks."""
+    plan = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+    return [
+        row[-1] for row in plan
+        if row[-1].startswith("SCAN") and row[-1].split()[1] not in allowed
+    ]
+
+
+def check_query_plans(engine: Engine) -> List[str]:
+    """Return a description of every hot query whose plan scans a table it is not allowed to."""
+    failures = []
+    with engine.connect() as conn:
+        for name, sql in HOT_QUERIES:
+            for detail in full_scans(conn, sql, ALLOWED_SCANS.get(name, ())):
+                failures.append(f"{name}: {detail} ({sql})")
+    return failures
+
+
+if __name__ == "__main__":
+    import models
+    from database import engine
+
+    models.SQLModel.metadata.create_all(engine)
+    print(f"Applied migrations: {migrate(engine) or 'none'}")
+
+    if "--check-plans" in sys.argv:
+        failures = check_query_plans(engine)
+        for failure in failures:
+            print(f"FULL SCAN {failure}")
+        sys.exit(1 if failures else 0)
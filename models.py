@@ -4,6 +4,9 @@ from datetime import datetime
 
 
 class User(SQLModel, table=True):
+    # AUTOINCREMENT: a deleted user's id (and so their tokens) is never handed out again
+    __table_args__ = {"sqlite_autoincrement": True}
+
     id: Optional[int] = Field(default=None, primary_key=True)
     username: str = Field(index=True, nullable=False, unique=True)
     password: str  # plaintext for MVP only; use hashed in production
@@ -11,9 +14,22 @@ class User(SQLModel, table=True):
     first_name: Optional[str] = Field(default=None)
     last_name: Optional[str] = Field(default=None)
     email: Optional[str] = Field(default=None)
+    token_generation: int = Field(default=0, description="Bumped to revoke previously issued session tokens")
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+class TokenRevocation(SQLModel, table=True):
+    """Oldest token generation still accepted per user; kept after the user is deleted."""
+    user_id: int = Field(primary_key=True)
+    min_generation: int = Field(nullable=False)
+
+
+class ServerSecret(SQLModel, table=True):
+    """Random keys generated once per database, so derived values survive restarts."""
+    name: str = Field(primary_key=True)
+    value: str = Field(nullable=False)
+
+
 class Test(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str = Field(nullable=False)
@@ -31,8 +47,10 @@ class Test(SQLModel, table=True):
     show_results_immediately: bool = Field(default=True)
     allow_back_navigation: bool = Field(default=True)
     shuffle_questions: bool = Field(default=False)
+    shuffle_choices: bool = Field(default=False, description="Also shuffle each question's choices per attempt")
     pass_score: Optional[float] = Field(default=None, description="Pass mark as percentage (e.g., 70.0)")
     graded_by: str = Field(default="auto", description="auto or manual")
+    version: int = Field(default=1, description="Bumped whenever the test or its questions change")
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
@@ -48,10 +66,19 @@ class Question(SQLModel, table=True):
     image_url: Optional[str] = Field(default=None, description="Optional URL to image file")
 
 
+class QuestionChoice(SQLModel, table=True):
+    # Kept in sync with Question.choices by triggers (see choices.py)
+    question_id: int = Field(foreign_key="question.id", primary_key=True)
+    label: str = Field(primary_key=True)
+    text: str = Field(nullable=False)
+    position: int = Field(default=0, description="Order of the choice within the question")
+
+
 class StudentAnswer(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     student_id: int = Field(foreign_key="user.id", nullable=False)
     question_id: int = Field(foreign_key="question.id", nullable=False)
+    result_id: Optional[int] = Field(default=None, foreign_key="testresult.id", description="Attempt this answer was graded in")
     selected_choice: str = Field(nullable=False)
     is_correct: bool = Field(default=False)
     submitted_at: datetime = Field(default_factory=datetime.utcnow)
@@ -68,6 +95,53 @@ class TestResult(SQLModel, table=True):
     attempt_number: Optional[int] = Field(default=1)
 
 
+class Attempt(SQLModel, table=True):
+    """A test being taken; answers are autosaved to AttemptAnswer until it is submitted."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    student_id: int = Field(foreign_key="user.id", nullable=False)
+    test_id: int = Field(foreign_key="test.id", nullable=False)
+    attempt_number: int = Field(default=1)
+    seed: int = Field(default=0, description="Seeds the question/choice shuffle shown in this attempt")
+    status: str = Field(default="in_progress", description="in_progress, submitted or expired")
+    started_at: datetime = Field(default_factory=datetime.utcnow)
+    deadline: Optional[datetime] = Field(default=None, description="Closed automatically at this time if still open")
+    submitted_at: Optional[datetime] = Field(default=None)
+    result_id: Optional[int] = Field(default=None, foreign_key="testresult.id", description="Set once graded")
+
+
+class AttemptCounter(SQLModel, table=True):
+    """Last attempt number handed out per (student, test); see grading.allocate_attempt_number."""
+    student_id: int = Field(foreign_key="user.id", primary_key=True)
+    test_id: int = Field(foreign_key="test.id", primary_key=True)
+    last_attempt: int = Field(default=0)
+
+
+class AttemptAnswer(SQLModel, table=True):
+    attempt_id: int = Field(foreign_key="attempt.id", primary_key=True)
+    question_id: int = Field(foreign_key="question.id", primary_key=True)
+    selected_choice: Optional[str] = Field(default=None, description="None when the student cleared the answer")
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class StudentTestSummary(SQLModel, table=True):
+    student_id: int = Field(foreign_key="user.id", primary_key=True)
+    test_id: int = Field(foreign_key="test.id", primary_key=True)
+    attempt_count: int = Field(default=0)
+    total_score: float = Field(default=0, description="Sum of all attempt scores")
+    best_score: float = Field(nullable=False)
+    latest_score: float = Field(nullable=False)
+    average_score: float = Field(nullable=False)
+    last_completed_at: Optional[datetime] = Field(default=None)
+
+
+class StudentScoreSummary(SQLModel, table=True):
+    """Each student's attempts over all tests; orders the student rankings."""
+    student_id: int = Field(foreign_key="user.id", primary_key=True)
+    attempt_count: int = Field(default=0)
+    total_score: float = Field(default=0, description="Sum of all attempt scores")
+    average_score: float = Field(nullable=False)
+
+
 class Classroom(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str = Field(nullable=False)
@@ -0,0 +1,126 @@
+# testquest/pagination.py
+"""Keyset (cursor) pagination shared by the list endpoints.
+
+A page is requested with ``?limit=&cursor=``. List bodies are unchanged; the
+opaque cursor for the next page is returned in the ``X-Next-Cursor`` header
+(absent on the last page), and ``?include_total=true`` adds an
+``X-Total-Count`` header served from a short-lived count cache.
+
+Every page is a ``WHERE (sort_key, id) > (:last_sort_key, :last_id) ...
+LIMIT n`` range scan, so page 1000 costs the same as page 1.
+"""
+import base64
+import json
+import os
+import time
+from typing import Any, Callable, List, NamedTuple, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Query, Response
+from sqlalchemy import Select, func, tuple_
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from cache import LRUCache
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+COUNT_CACHE_TTL_SECONDS = float(os.getenv("TESTQUEST_COUNT_CACHE_TTL_SECONDS", "30"))
+
+# compiled count SQL + params -> (expires_at, total)
+count_cache = LRUCache(maxsize=1024)
+
+
+class PageParams(NamedTuple):
+    cursor: Optional[str]
+    limit: int
+    include_total: bool
+
+
+def page_params(
+    cursor: Optional[str] = Query(None, description="Value of X-Next-Cursor from the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    include_total: bool = Query(False, description="Return X-Total-Count (cached for a few seconds)"),
+) -> PageParams:
+    return PageParams(cursor, limit, include_total)
+
+
+def encode_cursor(key: Sequence[Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key), separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> Tuple[Any, ...]:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        key = None
+    if (
+        not isinstance(key, list)
+        or len(key) != size
+        # Only scalars can be bound as sort keys
+        or not all(value is None or isinstance(value, (str, int, float)) for value in key)
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return tuple(key)
+
+
+def keyset(statement: Select, page: PageParams, *columns, descending: bool = False, having: bool = False) -> Select:
+    """Order ``statement`` by ``columns`` (last one unique) and restrict it to one page.
+
+    ``having`` applies the cursor condition to aggregated sort keys.
+    """
+    if page.cursor:
+        key = decode_cursor(page.cursor, len(columns))
+        condition = tuple_(*columns) < tuple_(*key) if descending else tuple_(*columns) > tuple_(*key)
+        statement = statement.having(condition) if having else statement.where(condition)
+    ordering = [column.desc() if descending else column.asc() for column in columns]
+    # One extra row tells us whether there is a next page
+    return statement.order_by(*ordering).limit(page.limit + 1)
+
+
+def finish_page(
+    rows: Sequence[Any],
+    page: PageParams,
+    response: Response,
+    key: Callable[[Any], Sequence[Any]],
+    total: Optional[int] = None,
+) -> List[Any]:
+    """Trim the look-ahead row and set the pagination headers."""
+    rows = list(rows)
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(key(rows[-1]))
+    if total is not None:
+        response.headers["X-Total-Count"] = str(total)
+    return rows
+
+
+def count_query(statement: Select) -> Tuple[Select, Tuple[str, str]]:
+    count_statement = select(func.count()).select_from(statement.order_by(None).limit(None).subquery())
+    compiled = count_statement.compile()
+    return count_statement, (str(compiled), repr(sorted(compiled.params.items())))
+
+
+def cached_total(cache_key) -> Optional[int]:
+    entry = count_cache.get(cache_key)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    return None
+
+
+def count_total(session: Session, statement: Select) -> int:
+    """COUNT(*) of an unpaginated statement, cached for COUNT_CACHE_TTL_SECONDS."""
+    count_statement, cache_key = count_query(statement)
+    total = cached_total(cache_key)
+    if total is None:
+        total = session.exec(count_statement).one()
+        count_cache.put(cache_key, (time.monotonic() + COUNT_CACHE_TTL_SECONDS, total))
+    return total
+
+
+async def count_total_async(session: AsyncSession, statement: Select) -> int:
+    count_statement, cache_key = count_query(statement)
+    total = cached_total(cache_key)
+    if total is None:
+        total = (await session.exec(count_statement)).one()
+        count_cache.put(cache_key, (time.monotonic() + COUNT_CACHE_TTL_SECONDS, total))
+    return total
@@ -0,0 +1,98 @@
+# testquest/payloads.py
+import os
+from typing import List, NamedTuple, Optional
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from cache import LRUCache
+from choices import load_test_choices
+from images import image_variants
+from models import Question, Test
+from serialization import dumps
+from shuffling import shuffled
+
+PAYLOAD_CACHE_SIZE = int(os.getenv("TESTQUEST_PAYLOAD_CACHE_SIZE", "128"))
+
+# Fields students must never see while taking a test
+HIDDEN_QUESTION_FIELDS = {"correct_choice", "explanation"}
+
+# (test_id, test.version) -> StudentPayload of the student-facing test
+student_payload_cache = LRUCache(maxsize=PAYLOAD_CACHE_SIZE)
+
+
+class QuestionFragment(NamedTuple):
+    question_id: int
+    head: bytes  # the question object, without "order", up to its "choices" array
+    choices: List[bytes]  # one encoded {"label", "text"} object per choice
+
+
+class StudentPayload(NamedTuple):
+    """Pre-encoded pieces of the payload, shared by every student.
+
+    Shuffled orders are produced by joining the same byte fragments in a
+    different order, so nothing is re-serialized per student. Each question's
+    "order" is its 1-based position as shown, written in at render time, so
+    it never reveals the authored position of a shuffled question.
+    """
+    head: bytes
+    questions: List[QuestionFragment]
+    body: bytes  # the whole payload in authored order
+
+
+async def build_student_payload(session: AsyncSession, test: Test) -> StudentPayload:
+    questions = (await session.exec(
+        select(Question).where(Question.test_id == test.id).order_by(Question.order)
+    )).all()
+    choices = await load_test_choices(session, test.id)
+
+    head = dumps({
+        "id": test.id,
+        "name": test.name,
+        "duration_minutes": test.duration_minutes,
+        "is_timed": test.is_timed,
+    })[:-1] + b',"questions":['
+    fragments = [
+        QuestionFragment(
+            question.id,
+            dumps(student_question(question))[:-1] + b',"choices":[',
+            # Parsed choices in authored order: {"label": "A", "text": "..."}
+            [dumps(choice) for choice in choices[question.id]],
+        )
+        for question in questions
+    ]
+    return StudentPayload(head, fragments, render(head, fragments))
+
+
+def student_question(question: Question) -> dict:
+    data = question.model_dump(exclude=HIDDEN_QUESTION_FIELDS | {"choices", "order"})
+    variants = image_variants(question.image_url)
+    if variants:
+        # Serve the resized image by default; clients can pick another size
+        data["image_url"] = variants["display"]
+        data["image_variants"] = variants
+    return data
+
+
+def render(head: bytes, fragments: List[QuestionFragment], seed: Optional[int] = None, shuffle_choices: bool = False) -> bytes:
+    questions = []
+    for position, fragment in enumerate(fragments, start=1):
+        choices = shuffled(fragment.choices, seed, fragment.question_id) if shuffle_choices else fragment.choices
+        questions.append(b'{"order":%d,' % position + fragment.head[1:] + b",".join(choices) + b"]}")
+    return head + b",".join(questions) + b"]}"
+
+
+async def get_student_payload(session: AsyncSession, test: Test, seed: Optional[int] = None) -> bytes:
+    """The student-facing test as JSON bytes, in the order ``seed`` gives for this test's shuffle settings."""
+    payload = await student_payload_cache.get_or_build_async(
+        (test.id, test.version), lambda: build_student_payload(session, test)
+    )
+    if seed is None or not (test.shuffle_questions or test.shuffle_choices):
+        return payload.body
+    fragments = shuffled(payload.questions, seed) if test.shuffle_questions else payload.questions
+    return render(payload.head, fragments, seed, test.shuffle_choices)
+
+
+def question_order(question_ids: List[int], test: Test, seed: int) -> List[int]:
+    """The order an attempt with ``seed`` was shown, given question ids in authored order."""
+    return shuffled(question_ids, seed) if test.shuffle_questions else list(question_ids)
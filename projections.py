@@ -0,0 +1,79 @@
+# testquest/projections.py
+"""Sparse fieldsets for the Test and User list endpoints.
+
+``?fields=id,name`` or ``?view=summary`` narrows both the SELECT and the
+response body to the requested columns, so a dropdown that only needs ids
+and names never loads descriptions or other wide columns. Without either
+parameter the endpoint returns its full view.
+"""
+from typing import Dict, Iterable, List, Optional, Sequence, Type
+
+from fastapi import HTTPException, Query
+from pydantic import BaseModel, ConfigDict, create_model
+from sqlmodel import SQLModel
+
+from models import Test, User
+
+# Never serialized by any User view
+HIDDEN_USER_FIELDS = {"password", "token_generation"}
+
+
+def view_model(model: Type[SQLModel], hidden: Iterable[str] = ()) -> Type[BaseModel]:
+    """Response schema with every public column of ``model`` optional.
+
+    Use with ``response_model_exclude_unset=True`` so only the selected
+    columns are serialized.
+    """
+    fields = {
+        name: (Optional[info.annotation], None)
+        for name, info in model.model_fields.items()
+        if name not in hidden
+    }
+    return create_model(
+        f"{model.__name__}View", __config__=ConfigDict(from_attributes=True), **fields
+    )
+
+
+def fieldset(
+    model: Type[SQLModel],
+    views: Dict[str, Sequence[str]],
+    hidden: Iterable[str] = (),
+    default_view: str = "full",
+):
+    """Build a dependency resolving ``?fields=`` / ``?view=`` into a list of ``model`` columns."""
+    public = [name for name in model.model_fields if name not in set(hidden)]
+    views = {"full": public, **views}
+
+    def dependency(
+        fields: Optional[str] = Query(None, description=f"Comma-separated subset of: {', '.join(public)}"),
+        view: Optional[str] = Query(None, description=f"Named field set: {', '.join(views)}"),
+    ) -> List:
+        if fields:
+            names = [name.strip() for name in fields.split(",") if name.strip()]
+            unknown = sorted(set(names) - set(public))
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        else:
+            view = view or default_view
+            if view not in views:
+                raise HTTPException(status_code=400, detail=f"Unknown view: {view}")
+            names = views[view]
+        # id is always selected: cursors and clients key rows by it
+        return [getattr(model, name) for name in dict.fromkeys(["id", *names])]
+
+    return dependency
+
+
+def as_dicts(rows) -> List[dict]:
+    return [dict(row._mapping) for row in rows]
+
+
+TestView = view_model(Test)
+UserView = view_model(User, hidden=HIDDEN_USER_FIELDS)
+
+# Every public User column, for queries serialized without a view model
+USER_COLUMN_NAMES = list(UserView.model_fields)
+USER_COLUMNS = [getattr(User, name) for name in USER_COLUMN_NAMES]
+
+test_fields = fieldset(Test, {"summary": ["name", "is_published"]})
+user_fields = fieldset(User, {"summary": ["username", "role"]}, hidden=HIDDEN_USER_FIELDS)
@@ -1,13 +1,23 @@
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Path, Body
-from pydantic import BaseModel
-from sqlalchemy import func
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Path, Body, UploadFile, File, Response
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import exists, insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session, select
 
-from database import get_session
+from database import get_session, get_read_session
 from dependencies import get_current_user
-from models import User, Test, TestResult
+from importers import batched, iter_records, validation_message
+from models import User, Test, StudentScoreSummary, Classroom, ClassroomStudentLink, ClassroomTeacherLink
+from pagination import PageParams, count_total, encode_cursor, finish_page, keyset, page_params
+from projections import TestView, UserView, as_dicts, test_fields, user_fields
+from serialization import fast_json
+from search import fts_matches, fts_query, fts_rowids
+from security import revoke_tokens
 
 
 class UserCreate(BaseModel):
@@ -46,6 +56,20 @@ class PaginatedUsers(BaseModel):
     page: int
     total_pages: int
     per_page: int
+    next_cursor: Optional[str] = None
+
+
+class ImportRowError(BaseModel):
+    row: int
+    username: Optional[str] = None
+    error: str
+
+
+class UserImportResult(BaseModel):
+    total_rows: int
+    created: int
+    linked_to_classroom: int
+    errors: List[ImportRowError]
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -56,30 +80,44 @@ def admin_required(user: User = Depends(get_current_user)):
     return user
 
 
-@router.get("/tests", response_model=List[Test])
+@router.get("/tests", response_model=List[TestView], response_model_exclude_unset=True)
 def list_tests(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    columns: list = Depends(test_fields),
     current_user = Depends(admin_required),
-    session: Session = Depends(get_session)
+    session: Session = Depends(get_read_session)
 ):
-    tests = session.exec(select(Test)).all()
-    return tests
+    statement = select(*columns)
+    tests = as_dicts(session.execute(keyset(statement, page, Test.id)))
+    total = count_total(session, statement) if page.include_total else None
+    tests = finish_page(tests, page, response, key=lambda t: (t["id"],), total=total)
+    return fast_json(tests, response)
 
 
-@router.get("/users/all", response_model=List[User])
+@router.get("/users/all", response_model=List[UserView], response_model_exclude_unset=True)
 def get_all_users(
-    session: Session = Depends(get_session),
+    response: Response,
+    page: PageParams = Depends(page_params),
+    columns: list = Depends(user_fields),
+    session: Session = Depends(get_read_session),
     user: User = Depends(admin_required),
 ):
-    return session.exec(select(User)).all()
+    statement = select(*columns)
+    users = as_dicts(session.execute(keyset(statement, page, User.id)))
+    total = count_total(session, statement) if page.include_total else None
+    users = finish_page(users, page, response, key=lambda u: (u["id"],), total=total)
+    return fast_json(users, response)
 
 
 @router.get("/users", response_model=PaginatedUsers)
 def get_users(
     page: int = Query(1, ge=1),
-    per_page: int = Query(10, le=100),
+    per_page: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page; replaces page"),
     role: Optional[str] = None,
     search: Optional[str] = None,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
     user: User = Depends(get_current_user),
 ):
     if user.role == "teacher" and role != "student":
@@ -92,12 +130,22 @@ def get_users(
     if role:
         filters.append(User.role == role)
     if search:
-        filters.append(User.username.ilike(f"%{search}%"))
+        match = fts_query(search)
+        if match:
+            filters.append(User.id.in_(fts_rowids("user_fts", match)))
 
-    total = session.exec(select(func.count()).select_from(User).where(*filters)).one()
+    statement = select(User).where(*filters)
+    total = count_total(session, statement)
 
-    statement = select(User).where(*filters).offset((page - 1) * per_page).limit(per_page)
-    users = session.exec(statement).all()
+    # Cursor pages are a keyset range scan; page numbers fall back to OFFSET
+    page_request = PageParams(cursor=cursor, limit=per_page, include_total=False)
+    paged = keyset(statement, page_request, User.id)
+    if not cursor:
+        paged = paged.offset((page - 1) * per_page)
+    users = session.exec(paged).all()
+
+    next_cursor = encode_cursor((users[per_page - 1].id,)) if len(users) > per_page else None
+    users = users[:per_page]
 
     total_pages = max(1, (total + per_page - 1) // per_page)
 
@@ -107,9 +155,35 @@ def get_users(
         "page": page,
         "per_page": per_page,
         "total_pages": total_pages,
+        "next_cursor": next_cursor,
     }
 
 
+@router.get("/users/search", response_model=List[UserOut])
+def search_users(
+    q: str = Query(..., min_length=1, description="Words to match against username, name and email (prefix match)"),
+    role: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    session: Session = Depends(get_read_session),
+    user: User = Depends(get_current_user),
+):
+    if user.role == "teacher" and role != "student":
+        raise HTTPException(status_code=403, detail="Admins only")
+
+    if user.role == "student":
+        raise HTTPException(status_code=403, detail="Admins only")
+
+    match = fts_query(q)
+    if not match:
+        return []
+
+    matches = fts_matches("user_fts", match).subquery()
+    statement = select(User).join(matches, matches.c.rowid == User.id)
+    if role:
+        statement = statement.where(User.role == role)
+    return session.exec(statement.order_by(matches.c.rank).limit(limit)).all()
+
+
 @router.post("/user", response_model=User)
 def create_user(
     data: UserCreate,
@@ -130,6 +204,94 @@ def create_user(
 
 
 
+@router.post("/users/import", response_model=UserImportResult)
+def import_users(
+    file: UploadFile = File(..., description="CSV with a header row, a JSON array, or NDJSON"),
+    classroom_id: Optional[int] = Query(None, description="Also enroll imported students in this classroom"),
+    session: Session = Depends(get_session),
+    user: User = Depends(get_current_user),
+):
+    if user.role not in {"admin", "teacher"}:
+        raise HTTPException(status_code=403, detail="Admins only")
+    if classroom_id is not None:
+        if not session.get(Classroom, classroom_id):
+            raise HTTPException(status_code=404, detail="Classroom not found")
+        # Teachers may only enroll students in classrooms they teach
+        if user.role == "teacher" and not session.get(ClassroomTeacherLink, (classroom_id, user.id)):
+            raise HTTPException(status_code=403, detail="Access denied to this classroom")
+
+    total_rows = created = linked = 0
+    errors: List[ImportRowError] = []
+    seen_usernames = set()
+
+    # Batches bound memory but share one transaction: a failure part way
+    # through leaves no users behind, so the upload can simply be retried
+    for batch in batched(iter_records(file)):
+        total_rows += len(batch)
+
+        # Validate the batch row by row, collecting errors instead of failing the upload
+        valid = []
+        for row_number, record in batch:
+            if not isinstance(record, dict):
+                errors.append(ImportRowError(row=row_number, error="Row is not a valid record"))
+                continue
+            try:
+                data = UserCreate(**record)
+            except ValidationError as exc:
+                errors.append(ImportRowError(
+                    row=row_number, username=record.get("username"), error=validation_message(exc)
+                ))
+                continue
+            if user.role == "teacher" and data.role != "student":
+                errors.append(ImportRowError(row=row_number, username=data.username, error="Teachers can only import students"))
+            elif data.username in seen_usernames:
+                errors.append(ImportRowError(row=row_number, username=data.username, error="Duplicate username in upload"))
+            else:
+                seen_usernames.add(data.username)
+                valid.append((row_number, data))
+
+        # One set-based lookup against the unique username index per batch
+        taken = set(session.exec(
+            select(User.username).where(User.username.in_([data.username for _, data in valid]))
+        ).all()) if valid else set()
+
+        now = datetime.utcnow()
+        rows = []
+        for row_number, data in valid:
+            if data.username in taken:
+                errors.append(ImportRowError(row=row_number, username=data.username, error="Username already exists"))
+            else:
+                rows.append({**data.model_dump(), "token_generation": 0, "created_at": now})
+        if not rows:
+            continue
+
+        try:
+            new_users = session.execute(
+                insert(User).returning(User.id, User.role, sort_by_parameter_order=True), rows
+            ).all()
+        except IntegrityError:
+            # A username taken by a concurrent request after the lookup above
+            session.rollback()
+            raise HTTPException(status_code=409, detail="A username was created concurrently; no users were imported")
+        created += len(new_users)
+
+        if classroom_id is not None:
+            links = [
+                {"classroom_id": classroom_id, "student_id": user_id}
+                for user_id, role in new_users if role == "student"
+            ]
+            if links:
+                linked += len(session.execute(
+                    sqlite_insert(ClassroomStudentLink).on_conflict_do_nothing()
+                    .returning(ClassroomStudentLink.student_id), links
+                ).all())
+
+    session.commit()
+
+    errors.sort(key=lambda e: e.row)
+    return UserImportResult(total_rows=total_rows, created=created, linked_to_classroom=linked, errors=errors)
+
+
 @router.put("/user/{user_id}", response_model=User)
 def edit_user(
     user_id: int = Path(..., ge=1),
@@ -141,9 +303,14 @@ def edit_user(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    for key, value in data.model_dump(exclude_unset=True).items():
+    changes = data.model_dump(exclude_unset=True)
+    for key, value in changes.items():
         setattr(user, key, value)
 
+    # Sessions issued under the old credentials or role must stop working
+    if changes.keys() & {"username", "password", "role"}:
+        revoke_tokens(session, user)
+
     session.add(user)
     session.commit()
     session.refresh(user)
@@ -161,40 +328,36 @@ def delete_user(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
+    revoke_tokens(session, user, deleted=True)
     session.delete(user)
     session.commit()
     return None  # 204 No Content returns empty response
 
 
 @router.get("/rankings/top", tags=["admin"])
-def get_top_students(session: Session = Depends(get_session), user: User = Depends(get_current_user)):
+def get_top_students(session: Session = Depends(get_read_session), user: User = Depends(get_current_user)):
     if user.role != "admin":
         raise HTTPException(status_code=403, detail="Admins only")
 
-    results = session.exec(
-        select(TestResult, User.username)
-        .join(User, TestResult.student_id == User.id)
-        .where(User.role == "student")
+    # Correlated lookups rather than a join, so SQLite walks the average_score
+    # index and stops after ten students instead of sorting every summary
+    student = User.id == StudentScoreSummary.student_id
+    rows = session.exec(
+        select(
+            StudentScoreSummary.student_id,
+            select(User.username).where(student).scalar_subquery(),
+            StudentScoreSummary.average_score,
+        )
+        .where(exists().where(student, User.role == "student"))
+        .order_by(StudentScoreSummary.average_score.desc(), StudentScoreSummary.student_id.desc())
+        .limit(10)
     ).all()
 
-    student_scores = {}
-    for r, username in results:
-        if r.student_id not in student_scores:
-            student_scores[r.student_id] = {
-                "student_id": r.student_id,
-                "username": username,
-                "attempts": [],
-            }
-        student_scores[r.student_id]["attempts"].append(r.score)
-
-    leaderboard = []
-    for student in student_scores.values():
-        avg = sum(student["attempts"]) / len(student["attempts"])
-        leaderboard.append({
-            "student_id": student["student_id"],
-            "username": student["username"],
-            "average_score": round(avg, 2)
-        })
-
-    leaderboard.sort(key=lambda x: x["average_score"], reverse=True)
-    return leaderboard[:10]
+    return fast_json([
+        {
+            "student_id": student_id,
+            "username": username,
+            "average_score": round(avg, 2),
+        }
+        for student_id, username, avg in rows
+    ])
@@ -1,9 +1,12 @@
 # testquest/routers/auth.py
+from datetime import datetime
+
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from sqlmodel import Session, select
 from database import get_session
 from models import User
+from security import issue_token
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -23,6 +26,8 @@ class LoginResponse(BaseModel):
     id: int
     username: str
     role: str
+    token: str
+    expires_at: datetime
 
 class SignupRequest(BaseModel):
     username: str
@@ -51,7 +56,14 @@ def login(data: LoginRequest, session: Session = Depends(get_session)):
     if user.password != data.password:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    return LoginResponse(id=user.id, username=user.username, role=user.role)
+    token, claims = issue_token(user)
+    return LoginResponse(
+        id=user.id,
+        username=user.username,
+        role=user.role,
+        token=token,
+        expires_at=datetime.utcfromtimestamp(claims.expires_at),
+    )
 
 
 @router.post("/signup", response_model=SignupResponse)
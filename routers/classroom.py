@@ -1,14 +1,19 @@
-from typing import List
+from collections import defaultdict
+from typing import Dict, List
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from pydantic import BaseModel
+from sqlalchemy import func
 from sqlmodel import Session, select
 from starlette import status
 
 from dependencies import get_current_user
 from models import Classroom, ClassroomStudentLink, User, ClassroomTeacherLink, ClassroomTestAssignment, Test, \
-    TestResult
-from database import get_session
+    StudentScoreSummary, StudentTestSummary
+from database import get_session, get_read_session
+from pagination import PageParams, count_total, finish_page, keyset, page_params
+from projections import TestView, as_dicts, test_fields
+from serialization import fast_json
 
 router = APIRouter()
 
@@ -28,6 +33,21 @@ def teacher_required(user=Depends(get_current_user)):
     return user
 
 
+def members_by_classroom(session: Session, link_model, member_column, classroom_ids) -> Dict[int, List[dict]]:
+    """Load {classroom_id: [{id, username}]} for every classroom in one joined query."""
+    rows = session.exec(
+        select(link_model.classroom_id, User.id, User.username)
+        .join(User, User.id == member_column)
+        .where(link_model.classroom_id.in_(classroom_ids))
+        .order_by(link_model.classroom_id, User.id)
+    ).all()
+
+    members = defaultdict(list)
+    for classroom_id, user_id, username in rows:
+        members[classroom_id].append({"id": user_id, "username": username})
+    return members
+
+
 @router.post("/classrooms")
 def create_classroom(
     payload: ClassroomCreate,
@@ -130,57 +150,49 @@ def delete_classroom(
 
 @router.get("/classrooms")
 def get_classrooms(
-    session: Session = Depends(get_session),
+    response: Response,
+    page: PageParams = Depends(page_params),
+    session: Session = Depends(get_read_session),
     user: User = Depends(get_current_user)
 ):
     # Admin: see all classrooms
     if user.role == "admin":
-        classrooms = session.exec(select(Classroom)).all()
+        statement = select(Classroom)
     # Teacher: see only assigned classrooms
     elif user.role == "teacher":
-        teacher_links = session.exec(
-            select(ClassroomTeacherLink).where(ClassroomTeacherLink.teacher_id == user.id)
-        ).all()
-        classroom_ids = [link.classroom_id for link in teacher_links]
-        if not classroom_ids:
-            return []
-        classrooms = session.exec(
-            select(Classroom).where(Classroom.id.in_(classroom_ids))
-        ).all()
+        statement = (
+            select(Classroom)
+            .join(ClassroomTeacherLink, ClassroomTeacherLink.classroom_id == Classroom.id)
+            .where(ClassroomTeacherLink.teacher_id == user.id)
+        )
     else:
         raise HTTPException(status_code=403, detail="Unauthorized")
 
-    result = []
-    for cls in classrooms:
-        teacher_links = session.exec(
-            select(ClassroomTeacherLink).where(ClassroomTeacherLink.classroom_id == cls.id)
-        ).all()
-        student_links = session.exec(
-            select(ClassroomStudentLink).where(ClassroomStudentLink.classroom_id == cls.id)
-        ).all()
-
-        teachers = [
-            session.exec(select(User).where(User.id == link.teacher_id)).first()
-            for link in teacher_links
-        ]
-        students = [
-            session.exec(select(User).where(User.id == link.student_id)).first()
-            for link in student_links
-        ]
-
-        result.append({
-            "classroom": cls,
-            "teachers": [{"id": t.id, "username": t.username} for t in teachers if t],
-            "students": [{"id": s.id, "username": s.username} for s in students if s]
-        })
+    classrooms = session.exec(keyset(statement, page, Classroom.id)).all()
+    total = count_total(session, statement) if page.include_total else None
+    classrooms = finish_page(classrooms, page, response, key=lambda c: (c.id,), total=total)
+    if not classrooms:
+        return []
+
+    classroom_ids = [cls.id for cls in classrooms]
+    teachers = members_by_classroom(session, ClassroomTeacherLink, ClassroomTeacherLink.teacher_id, classroom_ids)
+    students = members_by_classroom(session, ClassroomStudentLink, ClassroomStudentLink.student_id, classroom_ids)
 
-    return result
+    return [
+        {
+            "classroom": cls,
+            "teachers": teachers[cls.id],
+            "students": students[cls.id],
+        }
+        for cls in classrooms
+    ]
 
 
-@router.get("/classrooms/{classroom_id}/tests", response_model=List[Test])
+@router.get("/classrooms/{classroom_id}/tests", response_model=List[TestView], response_model_exclude_unset=True)
 def get_classroom_tests(
     classroom_id: int,
-    session: Session = Depends(get_session),
+    columns: list = Depends(test_fields),
+    session: Session = Depends(get_read_session),
     user: User = Depends(get_current_user)
 ):
     # Permission check
@@ -219,8 +231,8 @@ def get_classroom_tests(
     if not test_ids:
         return []
 
-    tests = session.exec(select(Test).where(Test.id.in_(test_ids))).all()
-    return tests
+    tests = session.execute(select(*columns).where(Test.id.in_(test_ids)))
+    return fast_json(as_dicts(tests))
 
 
 @router.post("/assign-teachers-to-classroom")
@@ -298,46 +310,64 @@ def assign_students_to_classroom(
 
 @router.get("/classrooms-with-users")
 def get_classrooms_with_users(
-    session: Session = Depends(get_session),
+    response: Response,
+    page: PageParams = Depends(page_params),
+    session: Session = Depends(get_read_session),
     user: User = Depends(get_current_user)
 ):
     if user.role != "admin":
         return []
 
-    classrooms = session.exec(select(Classroom)).all()
-    classroom_data = []
-
-    for cls in classrooms:
-        # Get assigned teachers
-        teacher_links = session.exec(
-            select(ClassroomTeacherLink).where(ClassroomTeacherLink.classroom_id == cls.id)
-        ).all()
-        teacher_ids = [link.teacher_id for link in teacher_links]
-        teachers = session.exec(select(User).where(User.id.in_(teacher_ids))).all()
-
-        # Get first 5 students and count
-        student_links = session.exec(
-            select(ClassroomStudentLink).where(ClassroomStudentLink.classroom_id == cls.id)
-        ).all()
-        student_ids = [link.student_id for link in student_links]
-        students = session.exec(select(User).where(User.id.in_(student_ids))).all()
-        preview_students = students[:5]
-
-        classroom_data.append({
+    classrooms = session.exec(keyset(select(Classroom), page, Classroom.id)).all()
+    total = count_total(session, select(Classroom)) if page.include_total else None
+    classrooms = finish_page(classrooms, page, response, key=lambda c: (c.id,), total=total)
+    classroom_ids = [cls.id for cls in classrooms]
+
+    teachers = members_by_classroom(session, ClassroomTeacherLink, ClassroomTeacherLink.teacher_id, classroom_ids)
+
+    # First 5 students per classroom, limited in SQL
+    position = func.row_number().over(
+        partition_by=ClassroomStudentLink.classroom_id,
+        order_by=ClassroomStudentLink.student_id,
+    ).label("position")
+    ranked_links = (
+        select(ClassroomStudentLink.classroom_id, ClassroomStudentLink.student_id, position)
+        .where(ClassroomStudentLink.classroom_id.in_(classroom_ids))
+        .subquery()
+    )
+    preview_rows = session.exec(
+        select(ranked_links.c.classroom_id, User.id, User.username)
+        .join(User, User.id == ranked_links.c.student_id)
+        .where(ranked_links.c.position <= 5)
+        .order_by(ranked_links.c.classroom_id, ranked_links.c.position)
+    ).all()
+    preview_students = defaultdict(list)
+    for classroom_id, student_id, username in preview_rows:
+        preview_students[classroom_id].append({"id": student_id, "username": username})
+
+    student_counts = dict(session.exec(
+        select(ClassroomStudentLink.classroom_id, func.count())
+        .join(User, User.id == ClassroomStudentLink.student_id)
+        .where(ClassroomStudentLink.classroom_id.in_(classroom_ids))
+        .group_by(ClassroomStudentLink.classroom_id)
+    ).all())
+
+    return [
+        {
             "id": cls.id,
             "name": cls.name,
-            "teachers": [{"id": t.id, "username": t.username} for t in teachers],
-            "students": [{"id": s.id, "username": s.username} for s in preview_students],
-            "total_students": len(students)
-        })
-
-    return classroom_data
+            "teachers": teachers[cls.id],
+            "students": preview_students[cls.id],
+            "total_students": student_counts.get(cls.id, 0),
+        }
+        for cls in classrooms
+    ]
 
 
 @router.get("/classrooms/{classroom_id}/students")
 def get_students_for_classroom(
     classroom_id: int,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
     user: User = Depends(get_current_user)
 ):
     if user.role != "admin":
@@ -356,45 +386,57 @@ def get_students_for_classroom(
 
 
 @router.get("/classroom/{classroom_id}/rankings")
-def get_classroom_rankings(classroom_id: int, session: Session = Depends(get_session), current_user=Depends(get_current_user)):
-    # 1. Get students in classroom
-    student_links = session.exec(
-        select(ClassroomStudentLink.student_id).where(ClassroomStudentLink.classroom_id == classroom_id)
+def get_classroom_rankings(
+    classroom_id: int,
+    response: Response,
+    page: PageParams = Depends(page_params),
+    session: Session = Depends(get_read_session),
+    current_user=Depends(get_current_user),
+):
+    # 1. Rank the classroom's students by their average over all attempts
+    statement = (
+        select(
+            StudentScoreSummary.student_id,
+            User.username,
+            StudentScoreSummary.average_score,
+            StudentScoreSummary.attempt_count,
+        )
+        .join(User, StudentScoreSummary.student_id == User.id)
+        .join(ClassroomStudentLink, ClassroomStudentLink.student_id == StudentScoreSummary.student_id)
+        .where(ClassroomStudentLink.classroom_id == classroom_id)
+    )
+    ranked = session.exec(
+        keyset(statement, page, StudentScoreSummary.average_score, StudentScoreSummary.student_id, descending=True)
     ).all()
-    if not student_links:
+    total = count_total(session, statement) if page.include_total else None
+    ranked = finish_page(ranked, page, response, key=lambda row: (row[2], row[0]), total=total)
+    if not ranked:
         return []
 
-    student_ids = [sid for sid in student_links]
-
-    # 2. Get all test results for these students
-    results = session.exec(
-        select(TestResult, User.username)
-        .join(User, TestResult.student_id == User.id)
-        .where(TestResult.student_id.in_(student_ids))
+    # 2. Per-test breakdown for the ranked students only
+    summaries = session.exec(
+        select(StudentTestSummary)
+        .where(StudentTestSummary.student_id.in_([row[0] for row in ranked]))
+        .order_by(StudentTestSummary.test_id)
     ).all()
-
-    # 3. Aggregate per student
-    student_scores = {}
-    for r, username in results:
-        if r.student_id not in student_scores:
-            student_scores[r.student_id] = {
-                "student_id": r.student_id,
-                "username": username,
-                "attempts": [],
-            }
-        student_scores[r.student_id]["attempts"].append({
-            "test_id": r.test_id,
-            "score": r.score,
-            "completed_at": r.completed_at.isoformat()
+    tests_by_student = defaultdict(list)
+    for summary in summaries:
+        tests_by_student[summary.student_id].append({
+            "test_id": summary.test_id,
+            "attempt_count": summary.attempt_count,
+            "best_score": summary.best_score,
+            "latest_score": summary.latest_score,
+            "average_score": round(summary.average_score, 2),
+            "last_completed_at": summary.last_completed_at,
         })
 
-    # 4. Calculate averages
-    ranked = []
-    for student in student_scores.values():
-        scores = [a["score"] for a in student["attempts"]]
-        student["average_score"] = round(sum(scores) / len(scores), 2)
-        ranked.append(student)
-
-    # 5. Sort by avg score descending
-    ranked.sort(key=lambda x: x["average_score"], reverse=True)
-    return ranked
+    return fast_json([
+        {
+            "student_id": student_id,
+            "username": username,
+            "attempt_count": attempt_count,
+            "average_score": round(avg, 2),
+            "tests": tests_by_student[student_id],
+        }
+        for student_id, username, avg, attempt_count in ranked
+    ], response)
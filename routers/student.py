@@ -1,12 +1,20 @@
-from datetime import datetime
-
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy import delete
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from dependencies import get_current_user
-from database import get_session
-from models import Test, Question, StudentAnswer, TestResult, User, ClassroomStudentLink, \
-    Classroom, ClassroomTestAssignment
+from database import get_session, get_read_session, get_async_session
+from pagination import PageParams, count_total_async, finish_page, keyset, page_params
+from projections import TestView, as_dicts, test_fields
+from attempts import ATTEMPT_GRACE_SECONDS, attempt_question_order, finalize_attempt, get_own_attempt, \
+    require_in_progress, require_open_window, saved_answers, shuffle_seed, start_attempt
+from autosave import autosave_buffer
+from expiry import expiry_scheduler
+from grading import allocate_attempt_number, get_answer_key, grade_answers, save_result, score_percentage
+from serialization import fast_json
+from payloads import get_student_payload
+from models import Test, TestResult, ClassroomStudentLink, \
+    Classroom, ClassroomTestAssignment, Attempt, AttemptCounter
 from pydantic import BaseModel
 from typing import List, Optional
 
@@ -31,67 +39,90 @@ class TestSubmitRequest(BaseModel):
     test_id: int
     answers: List[AnswerRequest]
 
+class AttemptStartRequest(BaseModel):
+    test_id: int
+
+class AttemptAnswerUpdate(BaseModel):
+    question_id: int
+    selected_choice: Optional[str] = None  # None clears the answer
+
+class AttemptAnswersRequest(BaseModel):
+    answers: List[AttemptAnswerUpdate]
+
+
+def attempt_out(attempt: Attempt, answers: dict) -> dict:
+    return {
+        "id": attempt.id,
+        "test_id": attempt.test_id,
+        "attempt_number": attempt.attempt_number,
+        "status": attempt.status,
+        "started_at": attempt.started_at,
+        "deadline": attempt.deadline,
+        "submitted_at": attempt.submitted_at,
+        "answers": [
+            {"question_id": question_id, "selected_choice": choice}
+            for question_id, choice in sorted(answers.items())
+        ],
+    }
 
-@router.get("/tests", response_model=List[Test])
-def get_assigned_tests(
+
+@router.get("/tests", response_model=List[TestView], response_model_exclude_unset=True)
+async def get_assigned_tests(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    columns: list = Depends(test_fields),
     current_user=Depends(get_current_user),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
     if current_user.role not in {"student", "admin"}:
         raise HTTPException(status_code=403, detail="Only students or admins allowed")
 
-    # Get classroom IDs for this student
-    classroom_links = session.exec(
-        select(ClassroomStudentLink.classroom_id).where(ClassroomStudentLink.student_id == current_user.id)
-    ).all()
-    classroom_ids = classroom_links  # Already a list of ints
-
-    # Get test IDs assigned to those classrooms
-    if classroom_ids:
-        classroom_assignments = session.exec(
-            select(ClassroomTestAssignment.test_id).where(ClassroomTestAssignment.classroom_id.in_(classroom_ids))
-        ).all()
-        classroom_test_ids = set(classroom_assignments)
-    else:
-        classroom_test_ids = set()
-
-    if not classroom_test_ids:
-        return []
+    # Tests assigned to any classroom this student belongs to
+    classroom_ids = select(ClassroomStudentLink.classroom_id).where(
+        ClassroomStudentLink.student_id == current_user.id
+    )
+    assigned_test_ids = select(ClassroomTestAssignment.test_id).where(
+        ClassroomTestAssignment.classroom_id.in_(classroom_ids)
+    )
 
-    tests = session.exec(select(Test).where(Test.id.in_(classroom_test_ids))).all()
-    return tests
+    statement = select(*columns).where(Test.id.in_(assigned_test_ids))
+    tests = as_dicts(await session.execute(keyset(statement, page, Test.id)))
+    total = await count_total_async(session, statement) if page.include_total else None
+    tests = finish_page(tests, page, response, key=lambda t: (t["id"],), total=total)
+    return fast_json(tests, response)
 
 
 @router.get("/test/{test_id}/meta")
-def get_test_meta(test_id: int, session: Session = Depends(get_session)):
-    test = session.get(Test, test_id)
+async def get_test_meta(test_id: int, session: AsyncSession = Depends(get_async_session)):
+    test = await session.get(Test, test_id)
     if not test:
         raise HTTPException(status_code=404, detail="Test not found")
     return test
 
 
 @router.get("/test/{test_id}")
-def get_test_with_questions(test_id: int, session: Session = Depends(get_session)):
-    test = session.get(Test, test_id)
+async def get_test_with_questions(
+    test_id: int,
+    attempt_id: Optional[int] = None,
+    session: AsyncSession = Depends(get_async_session),
+    current_user=Depends(get_current_user),
+):
+    test = await session.get(Test, test_id)
     if not test:
         raise HTTPException(status_code=404, detail="Test not found")
 
-    questions = session.exec(
-        select(Question).where(Question.test_id == test_id).order_by(Question.order)
-    ).all()
-
-    return {
-        "id": test.id,
-        "name": test.name,
-        "duration_minutes": test.duration_minutes,
-        "is_timed": test.is_timed,
-        "questions": questions,
-    }
+    # Built once per test version and shared by every student taking it;
+    # shuffled tests reorder the cached fragments per attempt
+    seed = None
+    if test.shuffle_questions or test.shuffle_choices:
+        seed = await shuffle_seed(session, test, current_user.id, attempt_id)
+    payload = await get_student_payload(session, test, seed)
+    return Response(content=payload, media_type="application/json")
 
 @router.get("/test-results", response_model=List[TestResultWithName])
 def get_test_results(
     current_user=Depends(get_current_user),
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
     results = session.exec(
         select(TestResult, Test.name)
@@ -122,51 +153,105 @@ def submit_test(
     if not test:
         raise HTTPException(status_code=404, detail="Test not found.")
 
-    existing_attempts = session.exec(
-        select(TestResult).where(
-            TestResult.student_id == current_user.id,
-            TestResult.test_id == data.test_id
-        )
-    ).all()
+    # A one-shot submit carries no start time, so the clock can only be enforced on attempts
+    if test.is_timed:
+        raise HTTPException(status_code=409, detail="Timed tests must be taken through /student/attempts")
+    require_open_window(test, ATTEMPT_GRACE_SECONDS)
 
-    attempt_number = len(existing_attempts) + 1
-
-    # Grade the test
-    score = 0
-    for ans in data.answers:
-        question = session.get(Question, ans.question_id)
-        if not question:
-            raise HTTPException(status_code=400, detail=f"Question ID {ans.question_id} not found.")
-        is_correct = question.correct_choice == ans.selected_choice
-        if is_correct:
-            score += 1
-        session.add(StudentAnswer(
-            student_id=current_user.id,
-            question_id=ans.question_id,
-            selected_choice=ans.selected_choice,
-            is_correct=is_correct
-        ))
+    # Rejects the submission before grading once max_attempts is used up
+    attempt_number = allocate_attempt_number(session, current_user.id, test)
+
+    # Grade the whole submission against the test's answer key in memory
+    answer_key = get_answer_key(session, test)
+    score, graded = grade_answers(answer_key, data.answers)
 
     # Final score as percentage
-    if not data.answers:
-        percentage_score = 0
-    else:
-        percentage_score = round((score / len(data.answers)) * 100)
+    percentage_score = score_percentage(score, len(answer_key))
 
-    # Save test result
-    session.add(TestResult(
+    save_result(
+        session,
         student_id=current_user.id,
         test_id=data.test_id,
         score=round(percentage_score, 2),
-        completed_at=datetime.utcnow(),
-        attempt_number=attempt_number
-    ))
+        attempt_number=attempt_number,
+        graded=graded,
+    )
 
     session.commit()
-    return {"score": round(percentage_score, 2), "attempt": len(existing_attempts) + 1}
+    return {"score": round(percentage_score, 2), "attempt": attempt_number}
 
 
 
+@router.post("/attempts")
+def start_test_attempt(
+    data: AttemptStartRequest,
+    session: Session = Depends(get_session),
+    current_user=Depends(get_current_user),
+):
+    test = session.get(Test, data.test_id)
+    if not test:
+        raise HTTPException(status_code=404, detail="Test not found.")
+
+    # Starting twice resumes the open attempt, so a reload never loses answers
+    attempt = start_attempt(session, current_user.id, test)
+    session.commit()
+    session.refresh(attempt)
+    expiry_scheduler.schedule(attempt.id, attempt.deadline)
+    return attempt_out(attempt, saved_answers(session, attempt))
+
+
+@router.get("/attempts/{attempt_id}")
+def get_test_attempt(
+    attempt_id: int,
+    session: Session = Depends(get_read_session),
+    current_user=Depends(get_current_user),
+):
+    attempt = get_own_attempt(session, attempt_id, current_user.id)
+    response = attempt_out(attempt, saved_answers(session, attempt))
+    # Lets a review screen show questions in the order the student saw them
+    response["question_order"] = attempt_question_order(session, session.get(Test, attempt.test_id), attempt)
+    return response
+
+
+@router.put("/attempts/{attempt_id}/answers", status_code=202)
+def autosave_answers(
+    attempt_id: int,
+    data: AttemptAnswersRequest,
+    session: Session = Depends(get_read_session),
+    current_user=Depends(get_current_user),
+):
+    attempt = get_own_attempt(session, attempt_id, current_user.id)
+    require_in_progress(attempt)
+
+    answer_key = get_answer_key(session, session.get(Test, attempt.test_id))
+    unknown = [ans.question_id for ans in data.answers if ans.question_id not in answer_key]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Question ID(s) {', '.join(map(str, unknown))} not found in this test.",
+        )
+
+    # Buffered in memory; written by the autosave flusher or on submit
+    buffered = autosave_buffer.record(
+        attempt.id, [(ans.question_id, ans.selected_choice) for ans in data.answers]
+    )
+    return {"attempt_id": attempt.id, "buffered": buffered}
+
+
+@router.post("/attempts/{attempt_id}/submit")
+def submit_test_attempt(
+    attempt_id: int,
+    session: Session = Depends(get_session),
+    current_user=Depends(get_current_user),
+):
+    attempt = get_own_attempt(session, attempt_id, current_user.id)
+    require_in_progress(attempt)
+
+    result = finalize_attempt(session, attempt, session.get(Test, attempt.test_id))
+    session.commit()
+    return {"score": result.score, "attempt": result.attempt_number, "result_id": result.id}
+
+
 @router.post("/{student_id}/classrooms")
 def set_student_classrooms(
     student_id: int,
@@ -185,7 +270,7 @@ def set_student_classrooms(
 
 
 @router.get("/{student_id}/classrooms")
-def get_student_classrooms(student_id: int, session: Session = Depends(get_session)):
+def get_student_classrooms(student_id: int, session: Session = Depends(get_read_session)):
     statement = (
         select(Classroom)
         .join(ClassroomStudentLink)
@@ -195,11 +280,8 @@ def get_student_classrooms(student_id: int, session: Session = Depends(get_sessi
 
 
 @router.get("/tests/attempts/{test_id}")
-def get_attempt_count(test_id: int, session: Session = Depends(get_session), current_user=Depends(get_current_user)):
-    attempts = session.exec(
-        select(TestResult).where(
-            TestResult.student_id == current_user.id,
-            TestResult.test_id == test_id
-        )
-    ).all()
-    return {"attempt_count": len(attempts)}
+async def get_attempt_count(test_id: int, session: AsyncSession = Depends(get_async_session), current_user=Depends(get_current_user)):
+    # Attempts used so far, open and expired ones included; the same counter
+    # allocate_attempt_number checks against max_attempts
+    counter = await session.get(AttemptCounter, (current_user.id, test_id))
+    return {"attempt_count": counter.last_attempt if counter else 0}
@@ -1,12 +1,18 @@
+from collections import defaultdict
 from datetime import datetime
 
 from fastapi import APIRouter, Depends, HTTPException, Header, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlmodel import Session, select
-from database import get_session
+from database import get_session, get_read_session
 from dependencies import get_current_user
+from analytics import get_item_analysis
+from exports import EXPORT_FORMATS, gradebook_query, stream_export
 from models import User, TestResult, Test, Question, ClassroomStudentLink, ClassroomTeacherLink, \
     Classroom, ClassroomTestAssignment
+from projections import USER_COLUMN_NAMES, USER_COLUMNS, UserView
+from serialization import fast_json
 from typing import List, Optional
 
 class TestAssignmentRequest(BaseModel):
@@ -37,7 +43,7 @@ class TestResultOut(BaseModel):
 class ClassroomWithStudents(BaseModel):
     classroom_id: int
     classroom_name: str
-    students: List[User]
+    students: List[UserView]
 
 
 class TestCreate(BaseModel):
@@ -52,6 +58,7 @@ class TestCreate(BaseModel):
     show_results_immediately: bool = True
     allow_back_navigation: bool = True
     shuffle_questions: bool = False
+    shuffle_choices: bool = False
     pass_score: Optional[float] = None
     graded_by: str = "auto"
 
@@ -60,7 +67,6 @@ router = APIRouter(prefix="/teacher", tags=["teacher"])
 
 
 def teacher_required(user=Depends(get_current_user)):
-    print(user.role)
     if user.role not in ["teacher", "admin"]:
         raise HTTPException(status_code=403, detail="Teachers or admin only")
     return user
@@ -80,7 +86,7 @@ def get_current_teacher(
 @router.get("/students", response_model=List[ClassroomWithStudents])
 def get_assigned_students(
     current_user=Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: Session = Depends(get_read_session)
 ):
     if current_user.role != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can access this.")
@@ -92,21 +98,25 @@ def get_assigned_students(
         .where(ClassroomTeacherLink.teacher_id == current_user.id)
     ).all()
 
-    result = []
-    for cls in classrooms:
-        student_links = session.exec(
-            select(User)
-            .join(ClassroomStudentLink, ClassroomStudentLink.student_id == User.id)
-            .where(ClassroomStudentLink.classroom_id == cls.id)
-        ).all()
+    # Fetch the students of all of those classrooms in one query
+    student_rows = session.execute(
+        select(ClassroomStudentLink.classroom_id, *USER_COLUMNS)
+        .join(User, ClassroomStudentLink.student_id == User.id)
+        .join(ClassroomTeacherLink, ClassroomTeacherLink.classroom_id == ClassroomStudentLink.classroom_id)
+        .where(ClassroomTeacherLink.teacher_id == current_user.id)
+    ).all()
+    students_by_classroom = defaultdict(list)
+    for classroom_id, *student in student_rows:
+        students_by_classroom[classroom_id].append(dict(zip(USER_COLUMN_NAMES, student)))
 
-        result.append({
+    return fast_json([
+        {
             "classroom_id": cls.id,
             "classroom_name": cls.name,
-            "students": student_links
-        })
-
-    return result
+            "students": students_by_classroom[cls.id],
+        }
+        for cls in classrooms
+    ])
 
 
 @router.get("/student/{student_id}/history", response_model=List[TestResultWithName])
@@ -114,7 +124,7 @@ def get_test_results(
     student_id: int,
     classroom_id: Optional[int] = None,
     current_user=Depends(get_current_user),
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
     # if student_id and current_user.role not in {"teacher", "admin"}:
     #     raise HTTPException(status_code=403, detail="Not authorized")
@@ -145,4 +155,92 @@ def get_test_results(
     ]
 
 
+def can_view_test_results(session: Session, user: User, test: Test) -> bool:
+    """Admins see every test; teachers see tests they wrote or that are assigned to their classrooms."""
+    if user.role != "teacher" or test.created_by == user.id:
+        return True
+    return session.exec(
+        select(ClassroomTestAssignment.id)
+        .join(ClassroomTeacherLink, ClassroomTeacherLink.classroom_id == ClassroomTestAssignment.classroom_id)
+        .where(
+            ClassroomTestAssignment.test_id == test.id,
+            ClassroomTeacherLink.teacher_id == user.id,
+        )
+    ).first() is not None
+
+
+def export_response(statement, fmt: str, filename: str) -> StreamingResponse:
+    return StreamingResponse(
+        stream_export(statement, fmt),
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
 
+
+@router.get("/export/classroom/{classroom_id}")
+def export_classroom_gradebook(
+    classroom_id: int,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    include_answers: bool = False,
+    current_user=Depends(teacher_required),
+    session: Session = Depends(get_read_session),
+):
+    if not session.get(Classroom, classroom_id):
+        raise HTTPException(status_code=404, detail="Classroom not found")
+
+    if current_user.role == "teacher":
+        teacher_link = session.exec(
+            select(ClassroomTeacherLink).where(
+                ClassroomTeacherLink.classroom_id == classroom_id,
+                ClassroomTeacherLink.teacher_id == current_user.id,
+            )
+        ).first()
+        if not teacher_link:
+            raise HTTPException(status_code=403, detail="Access denied to this classroom")
+
+    # Every attempt by the classroom's students on the classroom's tests
+    statement = (
+        gradebook_query(include_answers)
+        .join(ClassroomStudentLink, ClassroomStudentLink.student_id == TestResult.student_id)
+        .join(
+            ClassroomTestAssignment,
+            (ClassroomTestAssignment.test_id == TestResult.test_id)
+            & (ClassroomTestAssignment.classroom_id == classroom_id),
+        )
+        .where(ClassroomStudentLink.classroom_id == classroom_id)
+    )
+    return export_response(statement, format, f"classroom-{classroom_id}-gradebook")
+
+
+@router.get("/export/test/{test_id}")
+def export_test_gradebook(
+    test_id: int,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    include_answers: bool = False,
+    current_user=Depends(teacher_required),
+    session: Session = Depends(get_read_session),
+):
+    test = session.get(Test, test_id)
+    if not test:
+        raise HTTPException(status_code=404, detail="Test not found")
+    if not can_view_test_results(session, current_user, test):
+        raise HTTPException(status_code=403, detail="Not authorized to export this test")
+
+    statement = gradebook_query(include_answers).where(TestResult.test_id == test_id)
+    return export_response(statement, format, f"test-{test_id}-gradebook")
+
+
+@router.get("/tests/{test_id}/item-analysis")
+def get_test_item_analysis(
+    test_id: int,
+    current_user=Depends(teacher_required),
+    session: Session = Depends(get_read_session),
+):
+    test = session.get(Test, test_id)
+    if not test:
+        raise HTTPException(status_code=404, detail="Test not found")
+    if not can_view_test_results(session, current_user, test):
+        raise HTTPException(status_code=403, detail="Not authorized to view this test")
+
+    # Difficulty, discrimination, distractors and KR-20 over each student's latest attempt
+    return fast_json(get_item_analysis(session, test))
@@ -1,17 +1,26 @@
-from typing import List
+import json
+from typing import List, Optional, Union
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from pydantic import BaseModel
-from sqlalchemy import delete
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError, field_validator, model_validator
+from sqlalchemy import case, delete, func, insert, literal_column, or_, update
 from sqlmodel import Session, select
 
+from choices import check_correct_choice, choice_counts_query, parse_choices
 from dependencies import get_current_user
 from models import User, Test, ClassroomTeacherLink, \
-    ClassroomTestAssignment, Question, TestResult
-from database import get_session
-from routers.teacher import TestCreate
-import shutil
-import os
+    ClassroomTestAssignment, Question, StudentTestSummary
+from database import get_session, get_read_session
+from grading import bump_test_version
+from images import schedule_variants
+from importers import iter_records, validation_message
+from pagination import PageParams, count_total, finish_page, keyset, page_params
+from projections import TestView, as_dicts, test_fields
+from search import fts_matches, fts_query
+from serialization import fast_json
+from storage import receive_upload, store_upload
+from routers.teacher import TestCreate, teacher_required
 
 
 router = APIRouter()
@@ -22,6 +31,31 @@ class TestClassroomAssignmentRequest(BaseModel):
     test_id: int
 
 
+class QuestionCreate(BaseModel):
+    question_text: str
+    choices: Union[str, dict]  # JSON object string or object mapping labels to text
+    correct_choice: str
+    explanation: str = ""
+    order: Optional[int] = None
+    requires_manual_grading: bool = False
+    image_url: Optional[str] = None
+
+    @field_validator("choices")
+    @classmethod
+    def choices_as_json(cls, value):
+        return json.dumps(parse_choices(value))
+
+    @model_validator(mode="after")
+    def correct_choice_is_a_choice(self):
+        check_correct_choice(json.loads(self.choices), self.correct_choice, self.requires_manual_grading)
+        return self
+
+
+class QuestionImportResult(BaseModel):
+    test_id: int
+    created: int
+
+
 def admin_required(user: User = Depends(get_current_user)):
     if user.role != "admin":
         raise HTTPException(status_code=403, detail="Admins only")
@@ -29,7 +63,7 @@ def admin_required(user: User = Depends(get_current_user)):
 
 
 @router.get("/tests/{test_id}", response_model=Test)
-def get_test(test_id: int, session: Session = Depends(get_session)):
+def get_test(test_id: int, session: Session = Depends(get_read_session)):
     test = session.get(Test, test_id)
     if not test:
         raise HTTPException(status_code=404, detail="Test not found")
@@ -66,6 +100,7 @@ def update_test(
 
     for field, value in data.dict().items():
         setattr(test, field, value)
+    bump_test_version(session, test)
 
     session.add(test)
     session.commit()
@@ -81,51 +116,199 @@ def add_question(test_id: int, question: Question, session: Session = Depends(ge
         raise HTTPException(status_code=404, detail="Test not found")
     if test.created_by != user.id and user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
+    try:
+        choices = parse_choices(question.choices)
+        check_correct_choice(choices, question.correct_choice, question.requires_manual_grading)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    question.choices = json.dumps(choices)
     question.test_id = test_id
+    bump_test_version(session, test)
     session.add(question)
+    session.add(test)
     session.commit()
     session.refresh(question)
     return question
 
 
-@router.get("/tests", response_model=List[Test])
-def get_all_tests(
+def get_editable_test(session: Session, test_id: int, user: User) -> Test:
+    test = session.get(Test, test_id)
+    if not test:
+        raise HTTPException(status_code=404, detail="Test not found")
+    if test.created_by != user.id and user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return test
+
+
+def insert_questions(session: Session, test: Test, questions: List[QuestionCreate]) -> int:
+    """Append questions to the test with one executemany (caller commits)."""
+    next_order = session.exec(
+        select(func.coalesce(func.max(Question.order), 0)).where(Question.test_id == test.id)
+    ).one() + 1
+
+    rows = []
+    for question in questions:
+        row = question.model_dump()
+        if row["order"] is None:
+            row["order"] = next_order
+        next_order = max(next_order, row["order"]) + 1
+        rows.append({**row, "test_id": test.id})
+
+    if rows:
+        session.execute(insert(Question), rows)
+        bump_test_version(session, test)
+        session.add(test)
+    return len(rows)
+
+
+# Add a whole question set to a test in one request
+@router.post("/tests/{test_id}/questions/bulk", response_model=QuestionImportResult)
+def add_questions_bulk(
+    test_id: int,
+    questions: List[QuestionCreate],
+    session: Session = Depends(get_session),
     user: User = Depends(get_current_user),
+):
+    test = get_editable_test(session, test_id, user)
+    created = insert_questions(session, test, questions)
+    session.commit()
+    return QuestionImportResult(test_id=test_id, created=created)
+
+
+@router.post("/tests/{test_id}/questions/import", response_model=QuestionImportResult)
+def import_questions(
+    test_id: int,
+    file: UploadFile = File(..., description="CSV with a header row, a JSON array, or NDJSON"),
     session: Session = Depends(get_session),
+    user: User = Depends(get_current_user),
 ):
-    if user.role == "admin":
-        return session.exec(select(Test)).all()
+    test = get_editable_test(session, test_id, user)
+
+    # All-or-nothing: a test should never end up with half of its questions
+    questions, errors = [], []
+    for row_number, record in iter_records(file):
+        try:
+            if not isinstance(record, dict):
+                raise ValueError("Row is not a valid record")
+            questions.append(QuestionCreate(**record))
+        except ValidationError as exc:
+            errors.append({"row": row_number, "error": validation_message(exc)})
+        except ValueError as exc:
+            errors.append({"row": row_number, "error": str(exc)})
+    if errors:
+        raise HTTPException(status_code=400, detail={"message": "No questions were imported", "errors": errors})
+
+    created = insert_questions(session, test, questions)
+    session.commit()
+    return QuestionImportResult(test_id=test_id, created=created)
 
-    if user.role == "teacher":
-        # 1. Get classrooms this teacher is assigned to
-        class_links = session.exec(
-            select(ClassroomTeacherLink).where(ClassroomTeacherLink.teacher_id == user.id)
-        ).all()
-        classroom_ids = [link.classroom_id for link in class_links]
 
-        # 2. Get all tests assigned to those classrooms
-        class_test_links = session.exec(
-            select(ClassroomTestAssignment).where(
-                ClassroomTestAssignment.classroom_id.in_(classroom_ids)
-            )
-        ).all()
-        assigned_test_ids = {link.test_id for link in class_test_links}
+@router.put("/tests/{test_id}/questions/order")
+def reorder_questions(
+    test_id: int,
+    question_ids: List[int],
+    session: Session = Depends(get_session),
+    user: User = Depends(get_current_user),
+):
+    """Set the test's question order to the given list of every question id."""
+    test = get_editable_test(session, test_id, user)
+
+    current_ids = set(session.exec(select(Question.id).where(Question.test_id == test_id)).all())
+    if len(question_ids) != len(current_ids) or set(question_ids) != current_ids:
+        raise HTTPException(status_code=400, detail="question_ids must list every question of the test exactly once")
+
+    if question_ids:
+        session.exec(
+            update(Question)
+            .where(Question.test_id == test_id)
+            .values(order=case({qid: position for position, qid in enumerate(question_ids, start=1)}, value=Question.id))
+        )
+        bump_test_version(session, test)
+        session.add(test)
+    session.commit()
+    return {"message": "Questions reordered"}
+
+
+@router.get("/tests", response_model=List[TestView], response_model_exclude_unset=True)
+def get_all_tests(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    columns: list = Depends(test_fields),
+    user: User = Depends(get_current_user),
+    session: Session = Depends(get_read_session),
+):
+    if user.role == "admin":
+        statement = select(*columns)
+    elif user.role == "teacher":
+        # Tests assigned to the teacher's classrooms plus tests they created
+        classroom_ids = select(ClassroomTeacherLink.classroom_id).where(ClassroomTeacherLink.teacher_id == user.id)
+        assigned_test_ids = select(ClassroomTestAssignment.test_id).where(
+            ClassroomTestAssignment.classroom_id.in_(classroom_ids)
+        )
+        statement = select(*columns).where(or_(Test.id.in_(assigned_test_ids), Test.created_by == user.id))
+    else:
+        raise HTTPException(status_code=403, detail="Unauthorized role")
+
+    tests = as_dicts(session.execute(keyset(statement, page, Test.id)))
+    total = count_total(session, statement) if page.include_total else None
+    tests = finish_page(tests, page, response, key=lambda t: (t["id"],), total=total)
+    return fast_json(tests, response)
+
+
+@router.get("/tests/{test_id}/choice-stats")
+def get_choice_stats(
+    test_id: int,
+    session: Session = Depends(get_read_session),
+    user: User = Depends(get_current_user),
+):
+    if user.role not in {"admin", "teacher"}:
+        raise HTTPException(status_code=403, detail="Teachers or admin only")
+    if not session.get(Test, test_id):
+        raise HTTPException(status_code=404, detail="Test not found")
 
-        # 3. Also include tests created by the teacher
-        created_tests = session.exec(
-            select(Test).where(Test.created_by == user.id)
-        ).all()
-        created_test_ids = {t.id for t in created_tests}
+    # How often each choice was picked, distractors included, in one GROUP BY
+    questions = {}
+    for question_id, correct_choice, label, text, picked in session.exec(choice_counts_query(test_id)):
+        question = questions.setdefault(question_id, {
+            "question_id": question_id,
+            "correct_choice": correct_choice,
+            "answers": 0,
+            "choices": [],
+        })
+        question["answers"] += picked
+        question["choices"].append({"label": label, "text": text, "count": picked, "is_correct": label == correct_choice})
 
-        # 4. Combine and fetch unique tests
-        all_test_ids = assigned_test_ids.union(created_test_ids)
-        if not all_test_ids:
-            return []
+    for question in questions.values():
+        for choice in question["choices"]:
+            choice["share"] = round(choice["count"] / question["answers"], 4) if question["answers"] else 0.0
+    return fast_json(list(questions.values()))
 
-        tests = session.exec(select(Test).where(Test.id.in_(all_test_ids))).all()
-        return tests
 
-    raise HTTPException(status_code=403, detail="Unauthorized role")
+@router.get("/questions/search")
+def search_questions(
+    q: str = Query(..., min_length=1, description="Words to match against question text and explanation (prefix match)"),
+    test_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    session: Session = Depends(get_read_session),
+    user: User = Depends(get_current_user),
+):
+    if user.role not in {"admin", "teacher"}:
+        raise HTTPException(status_code=403, detail="Teachers or admin only")
+
+    match = fts_query(q)
+    if not match:
+        return []
+
+    snippet = func.snippet(literal_column("question_fts"), 0, "[", "]", "…", 16).label("snippet")
+    matches = fts_matches("question_fts", match).add_columns(snippet).subquery()
+    statement = (
+        select(Question.id, Question.test_id, Question.order, Question.question_text, matches.c.snippet)
+        .join(matches, matches.c.rowid == Question.id)
+    )
+    if test_id is not None:
+        statement = statement.where(Question.test_id == test_id)
+    rows = session.exec(statement.order_by(matches.c.rank).limit(limit)).all()
+    return [row._asdict() for row in rows]
 
 
 @router.post("/assign-test-to-classroom")
@@ -143,7 +326,7 @@ def assign_test_to_classroom(data: TestClassroomAssignmentRequest, session: Sess
 
 
 @router.get("/tests/{test_id}/assigned-classrooms")
-def get_assigned_classrooms(test_id: int, session: Session = Depends(get_session), user: User = Depends(get_current_user)):
+def get_assigned_classrooms(test_id: int, session: Session = Depends(get_read_session), user: User = Depends(get_current_user)):
     links = session.exec(
         select(ClassroomTestAssignment).where(ClassroomTestAssignment.test_id == test_id)
     ).all()
@@ -171,40 +354,46 @@ class RankedResult(BaseModel):
 
 
 @router.get("/test/{test_id}/rankings")
-def get_test_rankings(test_id: int, session: Session = Depends(get_session)):
-    results = session.exec(
-        select(TestResult, User.username)
-        .join(User, TestResult.student_id == User.id)
-        .where(TestResult.test_id == test_id)
+def get_test_rankings(
+    test_id: int,
+    response: Response,
+    page: PageParams = Depends(page_params),
+    session: Session = Depends(get_read_session),
+):
+    statement = (
+        select(StudentTestSummary, User.username)
+        .join(User, StudentTestSummary.student_id == User.id)
+        .where(StudentTestSummary.test_id == test_id)
+    )
+    rows = session.exec(
+        keyset(statement, page, StudentTestSummary.best_score, StudentTestSummary.student_id, descending=True)
     ).all()
+    total = count_total(session, statement) if page.include_total else None
+    rows = finish_page(rows, page, response, key=lambda r: (r[0].best_score, r[0].student_id), total=total)
+
+    return fast_json([
+        {
+            "student_id": summary.student_id,
+            "username": username,
+            "attempt_count": summary.attempt_count,
+            "best_score": summary.best_score,
+            "latest_score": summary.latest_score,
+            "average_score": round(summary.average_score, 2),
+            "last_completed_at": summary.last_completed_at,
+        }
+        for summary, username in rows
+    ], response)
 
-    student_scores = {}
-    for r, username in results:
-        if r.student_id not in student_scores:
-            student_scores[r.student_id] = {
-                "student_id": r.student_id,
-                "username": username,
-                "attempts": [],
-            }
-        student_scores[r.student_id]["attempts"].append({
-            "score": r.score,
-            "completed_at": r.completed_at.isoformat()
-        })
-
-    return list(student_scores.values())
-
-
-UPLOAD_DIR = "/Users/xed/Downloads/uploaded_images"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 @router.post("/upload-question-image")
-def upload_image(file: UploadFile = File(...)):
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    # Return a local file path or mock URL (if not using public hosting)
-    return {"url": f"/uploaded_images/{file.filename}"}
-
-
-
+async def upload_image(request: Request, user: User = Depends(teacher_required)):
+    # Expects a multipart "file" field; parsed here so oversized bodies are cut off early
+    upload = await receive_upload(request)
+    try:
+        # Stored once per distinct content; the URL never changes meaning
+        stored = await run_in_threadpool(store_upload, upload)
+    finally:
+        await upload.close()
+    if stored.created:
+        schedule_variants(stored)
+    return {"url": stored.url, "sha256": stored.digest, "size": stored.size, "deduplicated": not stored.created}
@@ -0,0 +1,115 @@
+import mimetypes
+import os
+import re
+from typing import Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
+
+from cache import LRUCache
+from storage import UPLOAD_URL_PREFIX, legacy_path, stored_path
+
+# Hot images (an exam's diagrams) are kept in memory; bigger or colder
+# files are streamed from disk by FileResponse.
+IMAGE_CACHE_BYTES = int(os.getenv("TESTQUEST_IMAGE_CACHE_BYTES", str(256 * 1024 * 1024)))
+IMAGE_CACHE_MAX_FILE_BYTES = int(os.getenv("TESTQUEST_IMAGE_CACHE_MAX_FILE_BYTES", str(4 * 1024 * 1024)))
+
+# Stored names are content hashes, so a URL's bytes never change
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Legacy uploads are named by the client and can be overwritten in place
+REVALIDATE = "no-cache"
+STORED_NAME = re.compile(r"^[0-9a-f]{64}(\.[a-z]+)?\.(png|jpg|gif|webp)$")
+
+# stored name -> file bytes
+image_cache = LRUCache(maxsize=4096, maxbytes=IMAGE_CACHE_BYTES)
+
+router = APIRouter(prefix=UPLOAD_URL_PREFIX, tags=["uploads"])
+
+
+def read_file(path: str) -> bytes:
+    try:
+        with open(path, "rb") as handle:
+            return handle.read()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+
+def byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single ``bytes=`` range into inclusive (start, end); None means serve everything."""
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        # Multi-range requests get the whole file, which RFC 9110 allows
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start, end = int(first), int(last) if last else size - 1
+        else:
+            start, end = max(size - int(last), 0), size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, min(end, size - 1)
+
+
+@router.api_route("/{shard}/{name}", methods=["GET", "HEAD"])
+async def serve_image(shard: str, name: str, request: Request):
+    if not STORED_NAME.match(name) or shard != name[:2]:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    etag = f'"{name}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE, "Accept-Ranges": "bytes"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    path = stored_path(name)
+    content = image_cache.get(name)
+    if content is None:
+        try:
+            size = os.stat(path).st_size
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Image not found")
+        if size > IMAGE_CACHE_MAX_FILE_BYTES:
+            # Handles Range itself and uses zero-copy sends where the server supports them
+            return FileResponse(path, media_type=media_type, headers=headers)
+        content = await image_cache.get_or_build_async(name, lambda: run_in_threadpool(read_file, path))
+
+    status_code = 200
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", etag) == etag:
+        selected = byte_range(range_header, len(content))
+        if selected:
+            start, end = selected
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(content)}"
+            content = content[start:end + 1]
+            status_code = 206
+
+    headers["Content-Length"] = str(len(content))
+    body = b"" if request.method == "HEAD" else content
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
+
+
+@router.api_route("/{name}", methods=["GET", "HEAD"])
+async def serve_legacy_image(name: str, request: Request):
+    """Files uploaded before content addressing, under their original names.
+
+    The bytes behind such a name may change, so clients revalidate against
+    the ETag FileResponse derives from the file's size and mtime.
+    """
+    path = legacy_path(name)
+    media_type = mimetypes.guess_type(name)[0] or ""
+    if not path or not media_type.startswith("image/") or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Image not found")
+    stat_result = os.stat(path)
+
+    headers = {"Cache-Control": REVALIDATE, "X-Content-Type-Options": "nosniff"}
+    response = FileResponse(path, media_type=media_type, headers=headers, stat_result=stat_result)
+    etag = response.headers["etag"]
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={**headers, "ETag": etag})
+    return response
@@ -0,0 +1,75 @@
+# testquest/search.py
+import re
+from typing import Optional
+
+from sqlalchemy import Select, column, literal_column, select, table
+
+# SQLite FTS5 indexes over the user directory and the question bank. The
+# tables are external-content indexes kept in sync with their source table by
+# the triggers below (installed by migrations.add_search_indexes).
+FTS_INDEXES = {
+    "user_fts": {
+        "source": "user",
+        "columns": ["username", "first_name", "last_name", "email"],
+    },
+    "question_fts": {
+        "source": "question",
+        "columns": ["question_text", "explanation"],
+    },
+}
+
+
+def fts_update_trigger(name: str) -> str:
+    # Only edits to indexed columns touch the index; bumping a counter or a
+    # login timestamp on the source row must not rewrite its FTS entry
+    source = FTS_INDEXES[name]["source"]
+    columns = FTS_INDEXES[name]["columns"]
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{c}" for c in columns)
+    old_values = ", ".join(f"old.{c}" for c in columns)
+    return (
+        f'CREATE TRIGGER IF NOT EXISTS {name}_au AFTER UPDATE OF {column_list} ON "{source}" BEGIN '
+        f"INSERT INTO {name} ({name}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {name} (rowid, {column_list}) VALUES (new.id, {new_values}); END"
+    )
+
+
+def fts_ddl(name: str) -> list:
+    source = FTS_INDEXES[name]["source"]
+    columns = FTS_INDEXES[name]["columns"]
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{c}" for c in columns)
+    old_values = ", ".join(f"old.{c}" for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5("
+        f"{column_list}, content='{source}', content_rowid='id', prefix='2 3')",
+        f'CREATE TRIGGER IF NOT EXISTS {name}_ai AFTER INSERT ON "{source}" BEGIN '
+        f"INSERT INTO {name} (rowid, {column_list}) VALUES (new.id, {new_values}); END",
+        f'CREATE TRIGGER IF NOT EXISTS {name}_ad AFTER DELETE ON "{source}" BEGIN '
+        f"INSERT INTO {name} ({name}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END",
+        fts_update_trigger(name),
+        f"INSERT INTO {name} ({name}) VALUES ('rebuild')",
+    ]
+
+
+def fts_query(text: str) -> Optional[str]:
+    """Turn free text into an FTS5 query where every word must match as a prefix.
+
+    Each word is quoted, so FTS5 operators in user input are treated as text.
+    """
+    terms = [term.replace('"', '""') for term in re.findall(r"\S+", text or "")]
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def fts_matches(name: str, query: str) -> Select:
+    """Select (rowid, rank) of the index rows matching ``query``; lower rank is better."""
+    fts = table(name, column("rowid"), column("rank"))
+    return select(fts.c.rowid, fts.c.rank).where(literal_column(name).op("MATCH")(query))
+
+
+def fts_rowids(name: str, query: str) -> Select:
+    """Select only the rowids matching ``query``, for use in ``column.in_(...)``."""
+    matches = fts_matches(name, query).subquery()
+    return select(matches.c.rowid)
@@ -0,0 +1,135 @@
+# testquest/security.py
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from sqlalchemy import event, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+
+from models import TokenRevocation, User
+
+# Set TESTQUEST_SECRET_KEY in production; a random key invalidates tokens on every restart
+SECRET_KEY = (os.getenv("TESTQUEST_SECRET_KEY") or secrets.token_urlsafe(32)).encode()
+TOKEN_TTL_SECONDS = int(os.getenv("TESTQUEST_TOKEN_TTL_SECONDS", str(12 * 60 * 60)))
+
+# Generation number given to users whose tokens must never verify again
+REVOKED = 2 ** 62
+
+
+class TokenClaims(NamedTuple):
+    user_id: int
+    role: str
+    expires_at: int
+    generation: int
+
+
+# user_id -> oldest token generation still accepted; an in-memory copy of the
+# TokenRevocation table. Only users whose generation was bumped (by
+# edit_user/delete_user) ever appear here, and entries only ever increase.
+# Loaded at startup and updated as revocations commit; the app runs as a
+# single worker (database.acquire_worker_lock), so nothing else changes it.
+_min_generations: Dict[int, int] = {}
+_generations_lock = threading.Lock()
+# Session.info key for revocations waiting for their transaction to commit
+_PENDING_REVOCATIONS = "pending_token_revocations"
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(body: str) -> str:
+    return _b64encode(hmac.new(SECRET_KEY, body.encode(), hashlib.sha256).digest())
+
+
+def issue_token(user: User) -> Tuple[str, TokenClaims]:
+    claims = TokenClaims(
+        user_id=user.id,
+        role=user.role,
+        expires_at=int(time.time()) + TOKEN_TTL_SECONDS,
+        generation=user.token_generation or 0,
+    )
+    body = _b64encode(":".join(map(str, claims)).encode())
+    return f"{body}.{_sign(body)}", claims
+
+
+def verify_token(token: str) -> Optional[TokenClaims]:
+    """Return the token's claims, or None if it is forged, malformed, expired or revoked."""
+    body, _, signature = token.partition(".")
+    try:
+        # Compared as bytes: compare_digest rejects non-ASCII str with TypeError
+        if not body or not hmac.compare_digest(signature.encode(), _sign(body).encode()):
+            return None
+    except UnicodeError:
+        return None
+    try:
+        user_id, role, expires_at, generation = _b64decode(body).decode().split(":")
+        claims = TokenClaims(int(user_id), role, int(expires_at), int(generation))
+    except ValueError:
+        return None
+
+    if claims.expires_at < time.time():
+        return None
+    if claims.generation < _min_generations.get(claims.user_id, 0):
+        return None
+    return claims
+
+
+def _raise_min_generations(generations: Dict[int, int]) -> None:
+    with _generations_lock:
+        for user_id, generation in generations.items():
+            if generation > _min_generations.get(user_id, 0):
+                _min_generations[user_id] = generation
+
+
+def revoke_tokens(session: Session, user: User, deleted: bool = False) -> None:
+    """Invalidate every token issued to the user so far (caller commits).
+
+    The new minimum generation is stored in TokenRevocation, which outlives
+    the user row, and only takes effect in memory once the transaction
+    commits.
+    """
+    user.token_generation = session.execute(
+        update(User)
+        .where(User.id == user.id)
+        .values(token_generation=User.token_generation + 1)
+        .returning(User.token_generation)
+    ).scalar_one()
+    min_generation = REVOKED if deleted else user.token_generation
+
+    statement = sqlite_insert(TokenRevocation).values(user_id=user.id, min_generation=min_generation)
+    session.execute(statement.on_conflict_do_update(
+        index_elements=[TokenRevocation.user_id],
+        set_={"min_generation": statement.excluded.min_generation},
+        where=TokenRevocation.min_generation < statement.excluded.min_generation,
+    ))
+    session.info.setdefault(_PENDING_REVOCATIONS, {})[user.id] = min_generation
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending_revocations(session) -> None:
+    pending = session.info.pop(_PENDING_REVOCATIONS, None)
+    if pending:
+        _raise_min_generations(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending_revocations(session) -> None:
+    session.info.pop(_PENDING_REVOCATIONS, None)
+
+
+def load_token_generations(session: Session) -> None:
+    """Merge the persisted revocations into memory, e.g. at startup."""
+    _raise_min_generations(dict(session.exec(
+        select(TokenRevocation.user_id, TokenRevocation.min_generation)
+    ).all()))
@@ -0,0 +1,53 @@
+# testquest/serialization.py
+"""Opt-in fast JSON path for large, trusted responses.
+
+By default FastAPI runs a route's return value through ``jsonable_encoder``
+and re-validates it against ``response_model`` before encoding it with the
+stdlib ``json``. For rows we just read from our own database that is pure
+overhead. Routes that opt in return ``fast_json(content, response)``: the
+content is encoded directly with orjson, and ``response_model`` is still
+used for the OpenAPI schema but not for validation.
+
+Set TESTQUEST_FAST_JSON=0 to fall back to the default path everywhere.
+"""
+from typing import Any, Optional
+
+import orjson
+from fastapi import Response
+from sqlmodel import SQLModel
+
+from database import env_flag
+
+FAST_JSON = env_flag("TESTQUEST_FAST_JSON", True)
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, SQLModel):
+        return value.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def fast_json(content: Any, response: Optional[Response] = None) -> Any:
+    """Encode ``content`` with orjson, skipping response_model validation.
+
+    Only pass data the route built itself (rows, dicts of column values) and
+    that already has the documented shape. Headers set on the injected
+    ``response`` (e.g. pagination cursors) are carried over.
+    """
+    if not FAST_JSON:
+        return content
+    headers = dict(response.headers) if response is not None else None
+    if headers:
+        headers.pop("content-length", None)
+    return FastJSONResponse(content, headers=headers)
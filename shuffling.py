@@ -0,0 +1,54 @@
+# testquest/shuffling.py
+"""Per-attempt question and choice order derived from a seed.
+
+Only the seed is stored (on Attempt); the permutation is recomputed
+whenever it is needed, so rendering, grading review and re-rendering after
+a reload always agree.
+
+Seeds are keyed by a random secret stored in the database rather than by
+the session signing key, which is random per process unless configured, so
+the order previewed for an attempt is the same after a restart.
+"""
+import hashlib
+import hmac
+import random
+import secrets
+from typing import List, Optional, Sequence, TypeVar, Union
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlmodel import Session
+
+T = TypeVar("T")
+
+SHUFFLE_SECRET_NAME = "shuffle_seed"
+
+_shuffle_key: Optional[bytes] = None
+
+
+def load_shuffle_key(session: Union[Session, Connection]) -> None:
+    """Load the database's shuffle secret, creating it on first use (caller commits)."""
+    global _shuffle_key
+    session.execute(
+        text("INSERT OR IGNORE INTO serversecret (name, value) VALUES (:name, :value)"),
+        {"name": SHUFFLE_SECRET_NAME, "value": secrets.token_urlsafe(32)},
+    )
+    _shuffle_key = session.execute(
+        text("SELECT value FROM serversecret WHERE name = :name"), {"name": SHUFFLE_SECRET_NAME}
+    ).scalar_one().encode()
+
+
+def attempt_seed(student_id: int, test_id: int, attempt_number: int) -> int:
+    """Seed for one student's attempt; not guessable without the database's shuffle secret."""
+    if _shuffle_key is None:
+        raise RuntimeError("load_shuffle_key must run before seeds are derived")
+    message = f"{student_id}:{test_id}:{attempt_number}".encode()
+    # 63 bits so it fits a signed SQLite INTEGER
+    return int.from_bytes(hmac.new(_shuffle_key, message, hashlib.sha256).digest()[:8], "big") >> 1
+
+
+def shuffled(items: Sequence[T], seed: int, salt: int = 0) -> List[T]:
+    """Deterministic shuffle of ``items``; ``salt`` gives independent orders from one seed."""
+    items = list(items)
+    random.Random(f"{seed}:{salt}").shuffle(items)
+    return items
@@ -0,0 +1,166 @@
+# testquest/storage.py
+"""Content-addressed storage for uploaded question images.
+
+Each file is stored once under the SHA-256 of its bytes
+(``<root>/ab/abcdef....png``), so identical uploads share one file and a
+stored file never changes; its URL can be cached forever.
+"""
+import hashlib
+import os
+import tempfile
+from typing import AsyncIterator, BinaryIO, NamedTuple, Optional
+
+from fastapi import HTTPException, Request
+from starlette.datastructures import UploadFile as StarletteUploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+UPLOAD_DIR = os.path.abspath(os.getenv("TESTQUEST_UPLOAD_DIR", "uploaded_images"))
+UPLOAD_URL_PREFIX = "/uploaded_images"
+MAX_UPLOAD_BYTES = int(os.getenv("TESTQUEST_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Room for the multipart boundaries and part headers around the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# Leading bytes of each accepted format -> stored extension
+IMAGE_SIGNATURES = {
+    b"\x89PNG\r\n\x1a\n": ".png",
+    b"\xff\xd8\xff": ".jpg",
+    b"GIF87a": ".gif",
+    b"GIF89a": ".gif",
+}
+
+
+class StoredFile(NamedTuple):
+    digest: str
+    path: str
+    url: str
+    size: int
+    created: bool  # False when an identical file was already stored
+
+
+def ensure_upload_dir() -> None:
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+
+def sniff_image_extension(head: bytes) -> Optional[str]:
+    """Extension for the image format ``head`` starts with; the client's content type is never trusted."""
+    for signature, extension in IMAGE_SIGNATURES.items():
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+async def _limited(stream: AsyncIterator[bytes], max_bytes: int) -> AsyncIterator[bytes]:
+    # The body may carry a file of max_bytes plus its multipart framing
+    limit = max_bytes + MULTIPART_OVERHEAD_BYTES
+    received = 0
+    async for chunk in stream:
+        received += len(chunk)
+        if received > limit:
+            raise HTTPException(status_code=413, detail=f"File exceeds the {max_bytes} byte upload limit")
+        yield chunk
+
+
+async def receive_upload(
+    request: Request, field: str = "file", max_bytes: int = MAX_UPLOAD_BYTES
+) -> StarletteUploadFile:
+    """Parse a multipart upload straight from the socket, stopping as soon as it is too large.
+
+    FastAPI's ``File()`` parameters spool the whole body before the endpoint
+    runs, so the limit is enforced here instead: on Content-Length up front
+    and on the bytes actually received.
+    """
+    limit = max_bytes + MULTIPART_OVERHEAD_BYTES
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > limit:
+        raise HTTPException(status_code=413, detail=f"File exceeds the {max_bytes} byte upload limit")
+
+    try:
+        form = await MultiPartParser(request.headers, _limited(request.stream(), max_bytes), max_files=1).parse()
+    except MultiPartException as exc:
+        raise HTTPException(status_code=400, detail=exc.message)
+    upload = form.get(field)
+    if not isinstance(upload, StarletteUploadFile):
+        raise HTTPException(status_code=422, detail=f"Missing file field '{field}'")
+    return upload
+
+
+def stored_path(name: str) -> str:
+    # Two-character fan-out keeps directories small
+    return os.path.join(UPLOAD_DIR, name[:2], name)
+
+
+def stored_url(name: str) -> str:
+    return f"{UPLOAD_URL_PREFIX}/{name[:2]}/{name}"
+
+
+def legacy_path(name: str) -> Optional[str]:
+    """Where an upload from before content addressing was kept, if ``name`` is a plain file name.
+
+    Those were saved flat under the upload root with the client's file name
+    and linked as ``/uploaded_images/<name>``.
+    """
+    if not name or name.startswith(".") or os.path.basename(name) != name:
+        return None
+    return os.path.join(UPLOAD_DIR, name)
+
+
+def store_upload(upload: StarletteUploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> StoredFile:
+    """Stream ``upload`` to disk in chunks, hashing as it goes, and store it under its digest.
+
+    Uploads over ``max_bytes`` are rejected with 413 as soon as the limit is
+    crossed, and anything that is not a PNG, JPEG, GIF or WebP by its magic
+    bytes with 415; nothing is kept on disk for them.
+    """
+    return _store_stream(upload.file, max_bytes)
+
+
+def store_legacy_file(path: str) -> Optional[StoredFile]:
+    """Copy a pre-existing upload into content-addressed storage; None if it is not an image.
+
+    The original file is left in place for links that were never migrated.
+    """
+    with open(path, "rb") as handle:
+        try:
+            return _store_stream(handle, os.fstat(handle.fileno()).st_size)
+        except HTTPException:
+            return None
+
+
+def _store_stream(stream: BinaryIO, max_bytes: int) -> StoredFile:
+    extension = None
+    digest = hashlib.sha256()
+    size = 0
+
+    # Written next to its final location so the rename below is atomic
+    handle = tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, prefix=".upload-", delete=False)
+    try:
+        with handle:
+            while chunk := stream.read(UPLOAD_CHUNK_SIZE):
+                if extension is None:
+                    extension = sniff_image_extension(chunk)
+                    if extension is None:
+                        raise HTTPException(status_code=415, detail="Upload a PNG, JPEG, GIF or WebP image")
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=413, detail=f"File exceeds the {max_bytes} byte upload limit"
+                    )
+                digest.update(chunk)
+                handle.write(chunk)
+        if not size:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty")
+
+        name = digest.hexdigest() + extension
+        path = stored_path(name)
+        created = not os.path.exists(path)
+        if created:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(handle.name, path)
+    finally:
+        if os.path.exists(handle.name):
+            os.unlink(handle.name)
+
+    return StoredFile(digest.hexdigest(), path, stored_url(name), size, created)
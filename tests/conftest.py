@@ -0,0 +1,93 @@
+# testquest/tests/conftest.py
+import io
+import itertools
+import os
+import sys
+import tempfile
+
+# The engines are created at import time, so point them at a scratch
+# database before any testquest module is imported
+WORKDIR = tempfile.mkdtemp(prefix="testquest-tests-")
+os.environ["TESTQUEST_DATABASE_URL"] = f"sqlite:///{WORKDIR}/test.db"
+os.environ["TESTQUEST_UPLOAD_DIR"] = os.path.join(WORKDIR, "uploads")
+os.environ.setdefault("TESTQUEST_ATTEMPT_GRACE_SECONDS", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlmodel import Session, select  # noqa: E402
+
+from database import engine  # noqa: E402
+from main import app  # noqa: E402
+from models import Question, Test, User  # noqa: E402
+
+_names = itertools.count()
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def session(client):
+    # The app's lifespan creates and migrates the schema
+    with Session(engine) as session:
+        yield session
+
+
+def login(client: TestClient, username: str, password: str = "pw") -> dict:
+    response = client.post("/auth/login", json={"username": username, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['token']}"}
+
+
+def png_bytes() -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (4, 4), "red").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def upload_image(client: TestClient, headers: dict, content: bytes, filename: str = "image.png",
+                 content_type: str = "image/png"):
+    return client.post("/upload-question-image", headers=headers, files={"file": (filename, content, content_type)})
+
+
+def question_ids(session: Session, test: Test) -> list:
+    return session.exec(select(Question.id).where(Question.test_id == test.id).order_by(Question.order)).all()
+
+
+@pytest.fixture
+def make_user(session):
+    def make_user(role: str = "student") -> User:
+        user = User(username=f"{role}-{next(_names)}", password="pw", role=role)
+        session.add(user)
+        session.commit()
+        session.refresh(user)
+        return user
+    return make_user
+
+
+@pytest.fixture
+def make_test(session, make_user):
+    def make_test(questions: int = 3, **fields) -> Test:
+        test = Test(name=f"Test {next(_names)}", created_by=make_user("teacher").id, is_published=True, **fields)
+        session.add(test)
+        session.commit()
+        session.add_all([
+            Question(test_id=test.id, order=i, question_text=f"Q{i}", choices='{"A": "1", "B": "2", "C": "3"}',
+                     correct_choice="B", explanation="")
+            for i in range(questions)
+        ])
+        session.commit()
+        session.refresh(test)
+        return test
+    return make_test
+
+
+@pytest.fixture
+def teacher_headers(client, make_user):
+    return login(client, make_user("teacher").username)
@@ -0,0 +1,49 @@
+# testquest/tests/test_analytics.py
+from datetime import datetime
+
+import numpy as np
+
+from conftest import login, question_ids
+from models import TestResult, User
+
+
+def test_item_analysis_matches_reference_and_flags_unlinked_results(client, session, make_user, make_test):
+    test = make_test(questions=3, max_attempts=3)
+    qids = question_ids(session, test)
+    picks = [["B", "B", "A"], ["A", "B", "C"], ["B", "A", "A"]]
+    for choices in picks:
+        headers = login(client, make_user().username)
+        answers = [{"question_id": qid, "selected_choice": choice} for qid, choice in zip(qids, choices)]
+        assert client.post("/student/submit", json={"test_id": test.id, "answers": answers}, headers=headers).status_code == 200
+    # An attempt submitted without answers scores 0 and counts as all incorrect
+    headers = login(client, make_user().username)
+    attempt = client.post("/student/attempts", json={"test_id": test.id}, headers=headers).json()
+    assert client.post(f"/student/attempts/{attempt['id']}/submit", headers=headers).json()["score"] == 0
+    # A legacy result, from before answers were linked to results, whose answers were never placed
+    session.add(TestResult(student_id=make_user().id, test_id=test.id, score=0, completed_at=datetime(2000, 1, 1),
+                           attempt_number=1))
+    session.commit()
+
+    teacher = login(client, session.get(User, test.created_by).username)
+    report = client.get(f"/teacher/tests/{test.id}/item-analysis", headers=teacher).json()
+
+    scores = np.array([[choice == "B" for choice in choices] for choices in picks + [["", "", ""]]], dtype=float)
+    totals = scores.sum(axis=1)
+    p_values = scores.mean(axis=0)
+    kr20 = 3 / 2 * (1 - (p_values * (1 - p_values)).sum() / totals.var())
+    assert report["students"] == 4
+    assert report["unlinked_results"] == 1
+    assert report["kr20"] == round(kr20, 4)
+    assert [item["p_value"] for item in report["items"]] == [round(p, 4) for p in p_values]
+
+    first = report["items"][0]
+    assert first["discrimination"] == round(np.corrcoef(scores[:, 0], totals - scores[:, 0])[0, 1], 4)
+    assert {c["label"]: c["count"] for c in first["choices"]} == {"A": 1, "B": 2, "C": 0}
+
+
+def test_item_analysis_requires_access_to_the_test(client, make_user, make_test):
+    test = make_test()
+    assert client.get(f"/teacher/tests/{test.id}/item-analysis",
+                      headers=login(client, make_user("teacher").username)).status_code == 403
+    assert client.get(f"/teacher/tests/{test.id}/item-analysis",
+                      headers=login(client, make_user().username)).status_code == 403
@@ -0,0 +1,115 @@
+# testquest/tests/test_attempt_numbers.py
+import threading
+
+import pytest
+from fastapi import HTTPException
+from sqlmodel import Session, select
+
+import attempts
+from attempts import start_attempt
+from conftest import login, question_ids
+from database import engine
+from grading import allocate_attempt_number
+import models
+from models import Attempt, AttemptCounter
+
+
+def allocate_concurrently(test, student_id, workers):
+    numbers, rejected = [], []
+    barrier = threading.Barrier(workers)
+
+    def allocate():
+        with Session(engine) as session:
+            barrier.wait()
+            try:
+                numbers.append(allocate_attempt_number(session, student_id, test))
+                session.commit()
+            except HTTPException as exc:
+                rejected.append(exc.status_code)
+
+    threads = [threading.Thread(target=allocate) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return numbers, rejected
+
+
+def test_concurrent_allocation_stops_at_max_attempts(session, make_user, make_test):
+    test, student = make_test(max_attempts=3), make_user()
+
+    numbers, rejected = allocate_concurrently(test, student.id, workers=8)
+    assert sorted(numbers) == [1, 2, 3]
+    assert rejected == [403] * 5
+    assert session.get(AttemptCounter, (student.id, test.id)).last_attempt == 3
+
+
+def test_concurrent_attempts_never_share_a_number(make_user, make_test):
+    test, student = make_test(max_attempts=100), make_user()
+
+    numbers, rejected = allocate_concurrently(test, student.id, workers=8)
+    assert sorted(numbers) == list(range(1, 9))
+    assert rejected == []
+
+
+def test_concurrent_starts_share_one_open_attempt(session, make_user, make_test):
+    test, student = make_test(max_attempts=3), make_user()
+    workers = 6
+    attempt_ids = []
+    barrier = threading.Barrier(workers)
+
+    def start():
+        with Session(engine) as worker_session:
+            barrier.wait()
+            attempt = start_attempt(worker_session, student.id, worker_session.get(models.Test, test.id))
+            worker_session.commit()
+            attempt_ids.append(attempt.id)
+
+    threads = [threading.Thread(target=start) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(attempt_ids) == workers
+    assert len(set(attempt_ids)) == 1
+    assert len(session.exec(select(Attempt).where(Attempt.student_id == student.id)).all()) == 1
+    # The losing starts never used up an attempt
+    assert session.get(AttemptCounter, (student.id, test.id)).last_attempt == 1
+
+
+def test_start_losing_to_a_closed_attempt_is_rejected(monkeypatch, session, make_user, make_test):
+    test, student = make_test(max_attempts=3), make_user()
+    session.add(Attempt(student_id=student.id, test_id=test.id, attempt_number=1, seed=0))
+    session.add(AttemptCounter(student_id=student.id, test_id=test.id, last_attempt=1))
+    session.commit()
+    # The concurrent start's attempt is gone again by the time it is looked up
+    monkeypatch.setattr(attempts, "open_attempt", lambda *args: None)
+
+    with Session(engine) as other:
+        with pytest.raises(HTTPException) as exc_info:
+            start_attempt(other, student.id, other.get(models.Test, test.id))
+    assert exc_info.value.status_code == 409
+    session.expire_all()
+    assert session.get(AttemptCounter, (student.id, test.id)).last_attempt == 1
+
+
+def test_submit_over_max_attempts_is_rejected_before_grading(client, session, make_user, make_test):
+    test = make_test(max_attempts=1)
+    student = make_user()
+    headers = login(client, student.username)
+    answers = [{"question_id": qid, "selected_choice": "B"} for qid in question_ids(session, test)]
+
+    assert client.post("/student/submit", json={"test_id": test.id, "answers": answers}, headers=headers).status_code == 200
+    assert client.post("/student/submit", json={"test_id": test.id, "answers": answers}, headers=headers).status_code == 403
+    assert client.post("/student/attempts", json={"test_id": test.id}, headers=headers).status_code == 403
+    assert client.get(f"/student/tests/attempts/{test.id}", headers=headers).json() == {"attempt_count": 1}
+
+
+def test_attempt_count_includes_open_attempts(client, make_user, make_test):
+    test = make_test(max_attempts=2)
+    headers = login(client, make_user().username)
+
+    assert client.post("/student/attempts", json={"test_id": test.id}, headers=headers).status_code == 200
+    # Not submitted yet, but it already uses one of the two attempts
+    assert client.get(f"/student/tests/attempts/{test.id}", headers=headers).json() == {"attempt_count": 1}
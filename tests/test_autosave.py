@@ -0,0 +1,44 @@
+# testquest/tests/test_autosave.py
+import os
+import subprocess
+import sys
+
+from sqlmodel import select
+
+from autosave import autosave_buffer
+from conftest import WORKDIR, login, question_ids
+from models import AttemptAnswer
+
+
+def test_answer_buffered_after_submit_is_not_written(client, session, make_user, make_test):
+    test = make_test(questions=2)
+    headers = login(client, make_user().username)
+    attempt = client.post("/student/attempts", json={"test_id": test.id}, headers=headers).json()
+    first, second = question_ids(session, test)
+
+    client.put(f"/student/attempts/{attempt['id']}/answers",
+               json={"answers": [{"question_id": first, "selected_choice": "B"}]}, headers=headers)
+    assert client.post(f"/student/attempts/{attempt['id']}/submit", headers=headers).json()["score"] == 50
+
+    # A save that passed its status check just before the submit claimed the attempt
+    autosave_buffer.record(attempt["id"], [(second, "B")])
+    autosave_buffer.flush()
+
+    saved = session.exec(select(AttemptAnswer.question_id).where(AttemptAnswer.attempt_id == attempt["id"])).all()
+    assert saved == [first]
+    reviewed = client.get(f"/student/attempts/{attempt['id']}", headers=headers).json()
+    assert reviewed["answers"] == [{"question_id": first, "selected_choice": "B"}]
+
+
+def test_second_worker_refuses_to_start(client):
+    # The session's app already holds the lock for the test database
+    code = "import database; database.acquire_worker_lock()"
+    worker = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env={**os.environ, "TESTQUEST_DATABASE_URL": f"sqlite:///{WORKDIR}/test.db"},
+        capture_output=True,
+        text=True,
+    )
+    assert worker.returncode != 0
+    assert "single worker" in worker.stderr
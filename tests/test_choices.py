@@ -0,0 +1,97 @@
+# testquest/tests/test_choices.py
+import json
+
+import pytest
+from sqlalchemy import text
+from sqlmodel import select
+
+from conftest import login
+from models import Question, QuestionChoice, User
+
+
+def stored_choices(session, question_id):
+    session.expire_all()
+    return session.exec(
+        select(QuestionChoice.label, QuestionChoice.text)
+        .where(QuestionChoice.question_id == question_id)
+        .order_by(QuestionChoice.position)
+    ).all()
+
+
+@pytest.fixture
+def owner(client, session):
+    def owner(test):
+        return login(client, session.get(User, test.created_by).username)
+    return owner
+
+
+def test_choice_rows_follow_inserts_updates_and_deletes(session, make_test):
+    test = make_test(questions=0)
+    question = Question(test_id=test.id, order=1, question_text="Q", choices='{"B": "two", "A": "one"}',
+                        correct_choice="A", explanation="")
+    session.add(question)
+    session.commit()
+    # Authored order, not label order
+    assert stored_choices(session, question.id) == [("B", "two"), ("A", "one")]
+
+    question.choices = '{"A": "uno", "C": 3}'
+    session.add(question)
+    session.commit()
+    assert stored_choices(session, question.id) == [("A", "uno"), ("C", "3")]
+
+    question.question_text = "Edited"
+    session.add(question)
+    session.commit()
+    assert stored_choices(session, question.id) == [("A", "uno"), ("C", "3")]
+
+    question_id = question.id
+    session.delete(question)
+    session.commit()
+    assert stored_choices(session, question_id) == []
+
+
+@pytest.mark.parametrize("choices", ["not json", "[1, 2]", '"A"'])
+def test_malformed_choices_written_directly_produce_no_rows(session, make_test, choices):
+    test = make_test(questions=0)
+    question_id = session.execute(text(
+        "INSERT INTO question (test_id, \"order\", question_text, choices, correct_choice, explanation, "
+        "requires_manual_grading) VALUES (:test_id, 1, 'Q', :choices, 'A', '', 0) RETURNING id"
+    ), {"test_id": test.id, "choices": choices}).scalar_one()
+    session.commit()
+    assert stored_choices(session, question_id) == []
+
+
+QUESTION = {"question_text": "Q", "choices": {"A": "1", "B": "2"}, "correct_choice": "Z"}
+
+
+def test_single_create_rejects_unknown_correct_choice(client, session, make_test, owner):
+    test = make_test(questions=0)
+    response = client.post(f"/tests/{test.id}/questions", headers=owner(test),
+                           json={**QUESTION, "choices": json.dumps(QUESTION["choices"])})
+    assert response.status_code == 400
+    assert "correct_choice 'Z'" in response.json()["detail"]
+
+
+def test_bulk_create_rejects_unknown_correct_choice(client, make_test, owner):
+    test = make_test(questions=0)
+    response = client.post(f"/tests/{test.id}/questions/bulk", headers=owner(test), json=[QUESTION])
+    assert response.status_code == 422
+    assert "correct_choice 'Z'" in response.text
+
+
+def test_import_rejects_unknown_correct_choice(client, make_test, owner):
+    test = make_test(questions=0)
+    content = json.dumps([QUESTION]).encode()
+    response = client.post(f"/tests/{test.id}/questions/import", headers=owner(test),
+                           files={"file": ("questions.json", content, "application/json")})
+    assert response.status_code == 400
+    assert "correct_choice 'Z'" in response.json()["detail"]["errors"][0]["error"]
+
+
+def test_manually_graded_questions_need_no_matching_choice(client, session, make_test, owner):
+    test = make_test(questions=0)
+    response = client.post(f"/tests/{test.id}/questions/bulk", headers=owner(test),
+                           json=[{**QUESTION, "requires_manual_grading": True}])
+    assert response.status_code == 200
+    question_id = session.exec(select(Question.id).where(Question.test_id == test.id)).one()
+    assert stored_choices(session, question_id) == [("A", "1"), ("B", "2")]
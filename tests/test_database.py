@@ -0,0 +1,89 @@
+# testquest/tests/test_database.py
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlmodel import select
+
+from conftest import login, question_ids
+from database import DB_BUSY_TIMEOUT_MS, engine, make_engine, read_engine
+from models import Classroom, ClassroomStudentLink, ClassroomTestAssignment
+
+
+def pragma(conn, name):
+    return conn.execute(text(f"PRAGMA {name}")).scalar()
+
+
+def test_read_pool_rejects_writes(client):
+    with read_engine.connect() as conn:
+        assert pragma(conn, "query_only") == 1
+        with pytest.raises(OperationalError, match="readonly"):
+            conn.execute(text("UPDATE user SET role = role"))
+        # Reads still work
+        assert conn.execute(text("SELECT count(*) FROM user")).scalar() >= 0
+
+
+def test_write_pool_is_writable_and_shares_the_profile(client):
+    with engine.connect() as writer, read_engine.connect() as reader:
+        assert pragma(writer, "query_only") == 0
+        for conn in (writer, reader):
+            assert pragma(conn, "journal_mode") == "wal"
+            assert pragma(conn, "busy_timeout") == DB_BUSY_TIMEOUT_MS
+            # NORMAL
+            assert pragma(conn, "synchronous") == 1
+
+
+def test_read_pool_sees_committed_writes(session, make_user):
+    user = make_user()
+    with read_engine.connect() as conn:
+        assert conn.execute(text("SELECT username FROM user WHERE id = :id"), {"id": user.id}).scalar() \
+            == user.username
+
+
+def test_async_read_pool_rejects_writes(client):
+    async def write():
+        async_engine = make_engine(1, 0, read_only=True, is_async=True)
+        try:
+            async with async_engine.connect() as conn:
+                assert (await conn.execute(text("PRAGMA query_only"))).scalar() == 1
+                await conn.execute(text("UPDATE user SET role = role"))
+        finally:
+            await async_engine.dispose()
+
+    with pytest.raises(OperationalError, match="readonly"):
+        asyncio.run(write())
+
+
+def test_async_reads_match_the_sync_paths(client, session, make_user, make_test):
+    student = make_user()
+    tests = [make_test(questions=2) for _ in range(4)]
+    classrooms = [Classroom(name="Async A"), Classroom(name="Async B")]
+    session.add_all(classrooms)
+    session.commit()
+    session.add_all([ClassroomStudentLink(classroom_id=c.id, student_id=student.id) for c in classrooms])
+    # The second test is assigned to both classrooms; the last one to neither
+    session.add_all([
+        ClassroomTestAssignment(classroom_id=classrooms[0].id, test_id=tests[0].id),
+        ClassroomTestAssignment(classroom_id=classrooms[0].id, test_id=tests[1].id),
+        ClassroomTestAssignment(classroom_id=classrooms[1].id, test_id=tests[1].id),
+        ClassroomTestAssignment(classroom_id=classrooms[1].id, test_id=tests[2].id),
+    ])
+    session.commit()
+    headers = login(client, student.username)
+
+    expected = session.exec(
+        select(ClassroomTestAssignment.test_id).distinct()
+        .join(ClassroomStudentLink, ClassroomStudentLink.classroom_id == ClassroomTestAssignment.classroom_id)
+        .where(ClassroomStudentLink.student_id == student.id)
+        .order_by(ClassroomTestAssignment.test_id)
+    ).all()
+    response = client.get("/student/tests", params={"include_total": True}, headers=headers)
+    assert [test["id"] for test in response.json()] == expected == [test.id for test in tests[:3]]
+    assert response.headers["x-total-count"] == "3"
+
+    for test in tests:
+        assert client.get(f"/student/test/{test.id}/meta").json() == client.get(f"/tests/{test.id}").json()
+        questions = client.get(f"/student/test/{test.id}", headers=headers).json()["questions"]
+        assert [q["id"] for q in questions] == question_ids(session, test)
+    assert client.get("/student/test/999999/meta").status_code == client.get("/tests/999999").status_code == 404
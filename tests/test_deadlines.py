@@ -0,0 +1,69 @@
+# testquest/tests/test_deadlines.py
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+from sqlmodel import select
+
+from conftest import login, question_ids
+import models
+from models import Attempt, AttemptCounter
+
+
+def legacy_submit(client, session, test, headers):
+    answers = [{"question_id": qid, "selected_choice": "B"} for qid in question_ids(session, test)]
+    return client.post("/student/submit", json={"test_id": test.id, "answers": answers}, headers=headers)
+
+
+WINDOWS = {
+    "not yet open": {"available_from": datetime.utcnow() + timedelta(days=1)},
+    "closed": {"available_until": datetime.utcnow() - timedelta(minutes=1)},
+}
+
+
+@pytest.mark.parametrize("window", WINDOWS.values(), ids=list(WINDOWS))
+def test_start_outside_window_is_rejected_before_allocation(client, session, make_user, make_test, window):
+    test, student = make_test(**window), make_user()
+    headers = login(client, student.username)
+
+    response = client.post("/student/attempts", json={"test_id": test.id}, headers=headers)
+    assert response.status_code == 409
+    assert session.get(AttemptCounter, (student.id, test.id)) is None
+    assert not session.exec(select(models.TestResult).where(models.TestResult.student_id == student.id)).all()
+
+
+@pytest.mark.parametrize("window", WINDOWS.values(), ids=list(WINDOWS))
+def test_legacy_submit_outside_window_is_rejected(client, session, make_user, make_test, window):
+    test, student = make_test(**window), make_user()
+    response = legacy_submit(client, session, test, login(client, student.username))
+    assert response.status_code == 409
+    assert session.get(AttemptCounter, (student.id, test.id)) is None
+
+
+def test_legacy_submit_of_timed_test_is_rejected(client, session, make_user, make_test):
+    test = make_test(is_timed=True, duration_minutes=30)
+    response = legacy_submit(client, session, test, login(client, make_user().username))
+    assert response.status_code == 409
+
+
+def test_late_attempt_submit_is_rejected(client, session, make_user, make_test):
+    test = make_test(is_timed=True, duration_minutes=30)
+    headers = login(client, make_user().username)
+    attempt = client.post("/student/attempts", json={"test_id": test.id}, headers=headers).json()
+
+    session.execute(
+        update(Attempt).where(Attempt.id == attempt["id"]).values(deadline=datetime.utcnow() - timedelta(seconds=1))
+    )
+    session.commit()
+    response = client.post(f"/student/attempts/{attempt['id']}/submit", headers=headers)
+    assert response.status_code == 409
+
+
+def test_open_window_submits_are_accepted(client, session, make_user, make_test):
+    test = make_test(available_until=datetime.utcnow() + timedelta(hours=1), max_attempts=2)
+    headers = login(client, make_user().username)
+    assert legacy_submit(client, session, test, headers).status_code == 200
+
+    attempt = client.post("/student/attempts", json={"test_id": test.id}, headers=headers).json()
+    assert attempt["deadline"] is not None
+    assert client.post(f"/student/attempts/{attempt['id']}/submit", headers=headers).status_code == 200
@@ -0,0 +1,36 @@
+# testquest/tests/test_images.py
+from concurrent.futures import Future
+
+from sqlmodel import select
+
+import images
+from conftest import png_bytes, upload_image
+from models import Question
+from payloads import student_payload_cache
+
+
+def test_variants_render_in_clean_worker_processes(client, teacher_headers):
+    url = upload_image(client, teacher_headers, png_bytes()).json()["url"]
+    assert images._executor is not None
+    assert images._executor._mp_context.get_start_method() in {"forkserver", "spawn"}
+
+    images.shutdown_image_workers()  # waits for the render to finish
+    assert set(images.image_variants(url)) == {"display", "thumb", "original"}
+
+
+def test_finished_variants_evict_only_payloads_using_the_image(session, make_test):
+    url = "/uploaded_images/ab/ab-evict-test.png"
+    using, other = make_test(), make_test()
+    question = session.exec(select(Question).where(Question.test_id == using.id)).first()
+    question.image_url = url
+    session.add(question)
+    session.commit()
+    for test in (using, other):
+        student_payload_cache.put((test.id, test.version), object())
+
+    done = Future()
+    done.set_result({})
+    images._variants_done(url, done)
+    assert student_payload_cache.get((using.id, using.version)) is None
+    assert student_payload_cache.get((other.id, other.version)) is not None
+
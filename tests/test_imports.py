@@ -0,0 +1,171 @@
+# testquest/tests/test_imports.py
+import csv
+import json
+from functools import partial
+
+import pytest
+from sqlmodel import select
+
+import importers
+from conftest import login, question_ids
+from models import Classroom, ClassroomStudentLink, ClassroomTeacherLink, Question, User
+from routers import admin as admin_router
+
+
+def ndjson(usernames) -> bytes:
+    return "\n".join(json.dumps({"username": name, "password": "pw", "role": "student"}) for name in usernames).encode()
+
+
+def import_users(client, headers, content: bytes, **params):
+    return client.post("/admin/users/import", params=params, headers=headers,
+                       files={"file": ("users.ndjson", content, "application/x-ndjson")})
+
+
+@pytest.fixture
+def admin(client, make_user):
+    return login(client, make_user("admin").username)
+
+
+@pytest.fixture
+def classroom(session):
+    classroom = Classroom(name="Imported")
+    session.add(classroom)
+    session.commit()
+    session.refresh(classroom)
+    return classroom
+
+
+def test_import_links_every_new_student(client, session, admin, classroom, monkeypatch):
+    monkeypatch.setattr(admin_router, "batched", partial(importers.batched, size=2))
+    names = [f"import-linked-{i}" for i in range(5)]
+
+    response = import_users(client, admin, ndjson(names), classroom_id=classroom.id)
+    assert response.status_code == 200
+    assert response.json()["created"] == 5
+    assert response.json()["linked_to_classroom"] == 5
+    linked = session.exec(
+        select(User.username).join(ClassroomStudentLink, ClassroomStudentLink.student_id == User.id)
+        .where(ClassroomStudentLink.classroom_id == classroom.id)
+    ).all()
+    assert sorted(linked) == names
+
+
+def test_failed_import_commits_no_batch(session, admin, classroom, monkeypatch):
+    from fastapi.testclient import TestClient
+    from main import app
+
+    def failing_batches(items):
+        batches = importers.batched(items, size=2)
+        yield next(batches)
+        raise RuntimeError("import interrupted")
+
+    monkeypatch.setattr(admin_router, "batched", failing_batches)
+    names = [f"import-failed-{i}" for i in range(4)]
+    with TestClient(app, raise_server_exceptions=False) as client:
+        assert import_users(client, admin, ndjson(names), classroom_id=classroom.id).status_code == 500
+
+    assert session.exec(select(User).where(User.username.in_(names))).all() == []
+    assert session.exec(select(ClassroomStudentLink).where(ClassroomStudentLink.classroom_id == classroom.id)).all() == []
+
+
+def test_teacher_imports_only_into_own_classroom(client, session, make_user, classroom):
+    teacher = make_user("teacher")
+    headers = login(client, teacher.username)
+
+    response = import_users(client, headers, ndjson(["import-foreign-0"]), classroom_id=classroom.id)
+    assert response.status_code == 403
+    assert session.exec(select(User).where(User.username == "import-foreign-0")).all() == []
+
+    session.add(ClassroomTeacherLink(classroom_id=classroom.id, teacher_id=teacher.id))
+    session.commit()
+    response = import_users(client, headers, ndjson(["import-own-0"]), classroom_id=classroom.id)
+    assert response.status_code == 200
+    assert response.json()["linked_to_classroom"] == 1
+
+
+@pytest.mark.parametrize("filename, content, detail", [
+    ("users.csv", b"\xff\xfeu\x00s\x00", "File is not valid UTF-8 text"),
+    ("users.ndjson", b'{"username": "ok"}\n\xff\xfe', "File is not valid UTF-8 text"),
+    ("users.json", b"\xff\xfe[]", "File is not valid UTF-8 text"),
+    ("users.csv", b"username,password,role\n" + b"x" * (csv.field_size_limit() + 1) + b",pw,student\n", "Invalid CSV"),
+])
+def test_undecodable_upload_is_rejected(client, session, admin, filename, content, detail):
+    response = client.post("/admin/users/import", headers=admin, files={"file": (filename, content, "text/plain")})
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith(detail)
+
+
+@pytest.fixture
+def owner(client, session):
+    def owner(test):
+        return login(client, session.get(User, test.created_by).username)
+    return owner
+
+
+def import_questions(client, headers, test, content: bytes, filename: str = "questions.csv"):
+    return client.post(f"/tests/{test.id}/questions/import", headers=headers,
+                       files={"file": (filename, content, "text/csv")})
+
+
+def question_texts(session, test):
+    session.expire_all()
+    return session.exec(select(Question.question_text).where(Question.test_id == test.id)
+                        .order_by(Question.order)).all()
+
+
+def test_question_import_is_all_or_nothing(client, session, make_test, owner):
+    test = make_test(questions=1)
+    content = (
+        b"question_text,choices,correct_choice\n"
+        b'New 1,"{""A"": ""x"", ""B"": ""y""}",A\n'
+        b'New 2,"{""A"": ""x"", ""B"": ""y""}",C\n'
+        b"New 3,not json,A\n"
+    )
+
+    response = import_questions(client, owner(test), test, content)
+    assert response.status_code == 400
+    assert response.json()["detail"]["errors"] == [
+        {"row": 3, "error": "Value error, correct_choice 'C' is not one of the choices: A, B"},
+        {"row": 4, "error": "choices: Value error, choices must be a JSON object"},
+    ]
+    assert question_texts(session, test) == ["Q0"]
+
+    response = import_questions(client, owner(test), test, content.rsplit(b"\n", 3)[0] + b"\n")
+    assert response.json() == {"test_id": test.id, "created": 1}
+    assert question_texts(session, test) == ["Q0", "New 1"]
+
+
+def test_undecodable_question_import_is_rejected(client, session, make_test, owner):
+    test = make_test(questions=1)
+    response = import_questions(client, owner(test), test, b"question_text\n\xff\xfe\n")
+    assert response.status_code == 400
+    assert question_texts(session, test) == ["Q0"]
+
+
+def test_bulk_create_is_all_or_nothing(client, session, make_test, owner):
+    test = make_test(questions=1)
+    questions = [
+        {"question_text": "New 1", "choices": {"A": "x"}, "correct_choice": "A"},
+        {"question_text": "New 2", "choices": {"A": "x"}, "correct_choice": "Z"},
+    ]
+
+    response = client.post(f"/tests/{test.id}/questions/bulk", headers=owner(test), json=questions)
+    assert response.status_code == 422
+    assert question_texts(session, test) == ["Q0"]
+
+    response = client.post(f"/tests/{test.id}/questions/bulk", headers=owner(test), json=questions[:1])
+    assert response.json() == {"test_id": test.id, "created": 1}
+    assert question_texts(session, test) == ["Q0", "New 1"]
+
+
+def test_reorder_is_all_or_nothing(client, session, make_test, owner):
+    test = make_test(questions=3)
+    ids = question_ids(session, test)
+    url = f"/tests/{test.id}/questions/order"
+
+    for partial_ids in (ids[:2], ids + [ids[0]], ids[:2] + [10 ** 9]):
+        assert client.put(url, headers=owner(test), json=partial_ids).status_code == 400
+        assert question_texts(session, test) == ["Q0", "Q1", "Q2"]
+
+    assert client.put(url, headers=owner(test), json=ids[::-1]).status_code == 200
+    assert question_texts(session, test) == ["Q2", "Q1", "Q0"]
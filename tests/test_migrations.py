@@ -0,0 +1,141 @@
+# testquest/tests/test_migrations.py
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select, text
+from sqlmodel import SQLModel, create_engine
+
+import models
+from migrations import add_model_columns, add_search_indexes, add_shuffle_columns, backfill_answer_results, check_query_plans, \
+    full_scans, narrow_search_update_triggers
+from shuffling import attempt_seed
+
+
+def test_backfill_links_legacy_answers_to_their_results(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/legacy.db")
+    SQLModel.metadata.create_all(engine)
+    first, second = datetime(2024, 1, 1, 10), datetime(2024, 1, 2, 10)
+    just_before = timedelta(milliseconds=5)
+
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [{"id": 1, "username": "s", "password": "pw", "role": "student",
+                                            "token_generation": 0, "created_at": first}])
+        conn.execute(insert(models.Test), [{"id": test_id, "name": f"T{test_id}", "created_by": 1, "version": 1,
+                                            "is_timed": False, "is_published": True, "created_at": first,
+                                            "show_results_immediately": True, "allow_back_navigation": True,
+                                            "shuffle_questions": False, "shuffle_choices": False,
+                                            "graded_by": "auto"} for test_id in (1, 2)])
+        conn.execute(insert(models.Question), [{"id": qid, "test_id": test_id, "order": qid, "question_text": "Q",
+                                                "choices": "{}", "correct_choice": "A", "explanation": "",
+                                                "requires_manual_grading": False}
+                                               for qid, test_id in ((1, 1), (2, 1), (3, 2))])
+        conn.execute(insert(models.TestResult), [
+            {"id": 10, "student_id": 1, "test_id": 1, "score": 50, "completed_at": first, "attempt_number": 1},
+            {"id": 11, "student_id": 1, "test_id": 1, "score": 100, "completed_at": second, "attempt_number": 2},
+            {"id": 12, "student_id": 1, "test_id": 2, "score": 0, "completed_at": first, "attempt_number": 1},
+        ])
+        answers = [(1, first), (2, first), (1, second), (2, second), (3, first), (99, first)]
+        conn.execute(insert(models.StudentAnswer), [
+            {"id": i, "student_id": 1, "question_id": qid, "selected_choice": "A", "is_correct": True,
+             "submitted_at": at - just_before}
+            for i, (qid, at) in enumerate(answers, start=1)
+        ])
+
+        backfill_answer_results(conn)
+        linked = conn.execute(
+            select(models.StudentAnswer.id, models.StudentAnswer.result_id).order_by(models.StudentAnswer.id)
+        ).all()
+
+    # The answer to the deleted question 99 cannot be placed
+    assert [result_id for _, result_id in linked] == [10, 10, 11, 11, 12, None]
+
+
+def test_search_update_triggers_only_fire_on_indexed_columns(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/search.db")
+    SQLModel.metadata.create_all(engine)
+
+    with engine.begin() as conn:
+        add_search_indexes(conn)
+        # The trigger as installed by earlier releases
+        conn.execute(text("DROP TRIGGER question_fts_au"))
+        conn.execute(text(
+            'CREATE TRIGGER question_fts_au AFTER UPDATE ON "question" BEGIN '
+            "INSERT INTO question_fts (question_fts, rowid, question_text, explanation) "
+            "VALUES ('delete', old.id, old.question_text, old.explanation); "
+            "INSERT INTO question_fts (rowid, question_text, explanation) "
+            "VALUES (new.id, new.question_text, new.explanation); END"
+        ))
+        narrow_search_update_triggers(conn)
+
+        triggers = dict(conn.execute(text(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%_fts_au'"
+        )).all())
+        assert "AFTER UPDATE OF question_text, explanation ON" in triggers["question_fts_au"]
+        assert "AFTER UPDATE OF username, first_name, last_name, email ON" in triggers["user_fts_au"]
+
+        conn.execute(insert(models.Question), [{"id": 1, "test_id": 1, "order": 1, "question_text": "photosynthesis",
+                                                "choices": "{}", "correct_choice": "A", "explanation": "",
+                                                "requires_manual_grading": False}])
+        conn.execute(text('UPDATE question SET "order" = 2 WHERE id = 1'))
+        conn.execute(text("UPDATE question SET question_text = 'mitochondria' WHERE id = 1"))
+
+        def matches(word):
+            return conn.execute(
+                text("SELECT rowid FROM question_fts WHERE question_fts MATCH :word"), {"word": word}
+            ).scalars().all()
+
+        assert matches("mitochondria") == [1]
+        assert matches("photosynthesis") == []
+
+
+def test_index_walks_count_as_full_scans(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/plans.db")
+    SQLModel.metadata.create_all(engine)
+
+    with engine.connect() as conn:
+        # The username index covers the query but a suffix match cannot search it
+        suffix = """SELECT username FROM "user" WHERE username LIKE '%son'"""
+        scans = full_scans(conn, suffix)
+        assert len(scans) == 1 and "COVERING INDEX" in scans[0]
+        assert full_scans(conn, suffix, allowed=("user",)) == []
+        assert full_scans(conn, """SELECT username FROM "user" WHERE username = 'son'""") == []
+
+
+def test_hot_queries_search_indexes(session):
+    # The app's lifespan has migrated the shared test database
+    assert check_query_plans(session.get_bind()) == []
+
+
+def test_shuffle_migration_seeds_open_attempts(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/seeds.db")
+    SQLModel.metadata.create_all(engine)
+    started = datetime(2024, 1, 1, 10)
+
+    with engine.begin() as conn:
+        # The attempt table as it was before per-attempt seeds
+        conn.execute(text("ALTER TABLE attempt DROP COLUMN seed"))
+        conn.execute(text("ALTER TABLE test DROP COLUMN shuffle_choices"))
+        conn.execute(text(
+            "INSERT INTO attempt (id, student_id, test_id, attempt_number, status, started_at) "
+            "VALUES (1, 7, 3, 2, 'in_progress', :started)"
+        ), {"started": started})
+        add_shuffle_columns(conn)
+        seed = conn.execute(text("SELECT seed FROM attempt WHERE id = 1")).scalar()
+
+    assert seed == attempt_seed(7, 3, 2)
+
+
+def test_answers_table_from_before_result_id_is_migrated(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/baseline.db")
+    with engine.begin() as conn:
+        # studentanswer as created by releases before answers were linked to results
+        conn.execute(text(
+            "CREATE TABLE studentanswer (id INTEGER NOT NULL, student_id INTEGER NOT NULL, "
+            "question_id INTEGER NOT NULL, selected_choice VARCHAR NOT NULL, is_correct BOOLEAN NOT NULL, "
+            "submitted_at DATETIME NOT NULL, manual_score FLOAT, feedback VARCHAR, PRIMARY KEY (id), "
+            "FOREIGN KEY(student_id) REFERENCES user (id), FOREIGN KEY(question_id) REFERENCES question (id))"
+        ))
+    SQLModel.metadata.create_all(engine)
+
+    with engine.begin() as conn:
+        add_model_columns(conn)
+        assert conn.execute(select(models.StudentAnswer.result_id)).all() == []
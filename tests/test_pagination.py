@@ -0,0 +1,39 @@
+# testquest/tests/test_pagination.py
+import pytest
+
+from conftest import login
+from pagination import encode_cursor
+
+
+@pytest.fixture
+def admin(client, make_user):
+    return login(client, make_user("admin").username)
+
+
+def test_cursor_pages_cover_every_test_once(client, admin, make_test):
+    created = {make_test(questions=0).id for _ in range(5)}
+
+    seen, params = [], {"limit": 2, "include_total": "true"}
+    while True:
+        response = client.get("/tests", params=params, headers=admin)
+        assert response.status_code == 200
+        assert len(response.json()) <= 2
+        seen += [test["id"] for test in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params = {"limit": 2, "cursor": response.headers["X-Next-Cursor"]}
+
+    assert seen == sorted(set(seen))
+    assert created <= set(seen)
+    assert int(client.get("/tests", params={"include_total": "true"}, headers=admin).headers["X-Total-Count"]) >= len(seen)
+
+
+@pytest.mark.parametrize("cursor", ["W1tdXQ", encode_cursor([{"id": 1}]), encode_cursor([1, 2]), "not-base64!", ""])
+def test_malformed_cursor_is_rejected(client, admin, cursor):
+    response = client.get("/tests", params={"cursor": cursor}, headers=admin)
+    if cursor:
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Invalid cursor"
+    else:
+        # An empty cursor means the first page
+        assert response.status_code == 200
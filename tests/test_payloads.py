@@ -0,0 +1,56 @@
+# testquest/tests/test_payloads.py
+import asyncio
+
+import pytest
+from sqlalchemy import update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import payloads
+from conftest import login
+from database import make_engine
+from models import Question
+from payloads import HIDDEN_QUESTION_FIELDS, get_student_payload, student_payload_cache
+
+
+@pytest.mark.parametrize("shuffle", [False, True])
+def test_student_payload_never_contains_answers(client, session, make_user, make_test, shuffle):
+    test = make_test(shuffle_questions=shuffle, shuffle_choices=shuffle)
+    session.execute(update(Question).where(Question.test_id == test.id).values(explanation="because B"))
+    session.commit()
+
+    response = client.get(f"/student/test/{test.id}", headers=login(client, make_user().username))
+    assert response.status_code == 200
+    for question in response.json()["questions"]:
+        assert not HIDDEN_QUESTION_FIELDS & question.keys()
+    assert b"because B" not in response.content
+
+
+def test_concurrent_cold_reads_build_the_payload_once(monkeypatch, make_test):
+    test = make_test()
+    student_payload_cache.pop((test.id, test.version))
+    builds = []
+    build = payloads.build_student_payload
+
+    async def counting_build(session, test):
+        builds.append(test.id)
+        # Keep the build in flight while the other readers arrive
+        await asyncio.sleep(0.05)
+        return await build(session, test)
+
+    monkeypatch.setattr(payloads, "build_student_payload", counting_build)
+
+    async def read_concurrently(readers):
+        engine = make_engine(readers, 0, read_only=True, is_async=True)
+
+        async def read():
+            async with AsyncSession(engine) as session:
+                return await get_student_payload(session, test)
+
+        try:
+            return await asyncio.gather(*(read() for _ in range(readers)))
+        finally:
+            await engine.dispose()
+
+    bodies = asyncio.run(read_concurrently(8))
+    assert builds == [test.id]
+    assert len(set(bodies)) == 1
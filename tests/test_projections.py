@@ -0,0 +1,30 @@
+# testquest/tests/test_projections.py
+import pytest
+
+from conftest import login
+
+
+@pytest.fixture
+def admin(client, make_user):
+    return login(client, make_user("admin").username)
+
+
+def test_fields_narrow_the_response(client, admin, make_test):
+    make_test(questions=0)
+
+    tests = client.get("/tests", params={"fields": "name"}, headers=admin).json()
+    assert tests and all(set(test) == {"id", "name"} for test in tests)
+    summary = client.get("/tests", params={"view": "summary"}, headers=admin).json()
+    assert all(set(test) == {"id", "name", "is_published"} for test in summary)
+    assert "description" in client.get("/tests", headers=admin).json()[0]
+
+
+@pytest.mark.parametrize("params", [{"fields": "name,secret"}, {"view": "everything"}])
+def test_unknown_fields_are_rejected(client, admin, params):
+    assert client.get("/tests", params=params, headers=admin).status_code == 400
+
+
+def test_user_fields_never_include_hidden_columns(client, admin):
+    assert client.get("/admin/users/all", params={"fields": "password"}, headers=admin).status_code == 400
+    users = client.get("/admin/users/all", headers=admin).json()
+    assert users and all("password" not in user and "token_generation" not in user for user in users)
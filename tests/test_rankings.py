@@ -0,0 +1,55 @@
+# testquest/tests/test_rankings.py
+from sqlmodel import select
+
+from conftest import login, question_ids
+from grading import rebuild_score_summaries
+from models import Classroom, ClassroomStudentLink, StudentScoreSummary
+
+
+def submit(client, session, headers, test, correct: int):
+    qids = question_ids(session, test)
+    answers = [{"question_id": qid, "selected_choice": "B" if i < correct else "A"} for i, qid in enumerate(qids)]
+    assert client.post("/student/submit", json={"test_id": test.id, "answers": answers}, headers=headers).status_code == 200
+
+
+def test_rankings_order_students_by_overall_average(client, session, make_user, make_test):
+    first_test, second_test = make_test(questions=4, max_attempts=5), make_test(questions=4, max_attempts=5)
+    classroom = Classroom(name="Ranked")
+    session.add(classroom)
+    session.commit()
+    students = [make_user() for _ in range(3)]
+    session.add_all([ClassroomStudentLink(classroom_id=classroom.id, student_id=s.id) for s in students])
+    session.commit()
+
+    # Averages: 50, 62.5 and 75
+    for student, scores in zip(students, [(1, 3), (2, 3), (3, 3)]):
+        headers = login(client, student.username)
+        submit(client, session, headers, first_test, scores[0])
+        submit(client, session, headers, second_test, scores[1])
+
+    admin = login(client, make_user("admin").username)
+    ranked = client.get(f"/classroom/{classroom.id}/rankings", params={"limit": 2}, headers=admin)
+    assert [(row["student_id"], row["average_score"], row["attempt_count"]) for row in ranked.json()] == [
+        (students[2].id, 75, 2), (students[1].id, 62.5, 2),
+    ]
+    next_page = client.get(f"/classroom/{classroom.id}/rankings", headers=admin,
+                           params={"limit": 2, "cursor": ranked.headers["X-Next-Cursor"]})
+    assert [row["student_id"] for row in next_page.json()] == [students[0].id]
+
+    top = client.get("/admin/rankings/top", headers=admin).json()
+    averages = [row["average_score"] for row in top]
+    assert averages == sorted(averages, reverse=True)
+
+    # The incrementally maintained aggregate matches a rebuild from TestResult
+    def overall():
+        session.expire_all()
+        return session.exec(
+            select(StudentScoreSummary)
+            .where(StudentScoreSummary.student_id.in_([s.id for s in students]))
+            .order_by(StudentScoreSummary.student_id)
+        ).all()
+
+    incremental = [summary.model_dump() for summary in overall()]
+    rebuild_score_summaries(session)
+    session.commit()
+    assert [summary.model_dump() for summary in overall()] == incremental
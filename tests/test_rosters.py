@@ -0,0 +1,88 @@
+# testquest/tests/test_rosters.py
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from conftest import login
+from database import read_engine
+from models import Classroom, ClassroomStudentLink, ClassroomTeacherLink
+from pagination import encode_cursor
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(read_engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(read_engine, "before_cursor_execute", record)
+
+
+def make_classrooms(session, make_user, teacher, classrooms, students):
+    created = []
+    for i in range(classrooms):
+        classroom = Classroom(name=f"Roster {i}")
+        session.add(classroom)
+        session.commit()
+        members = [make_user() for _ in range(students)]
+        session.add(ClassroomTeacherLink(classroom_id=classroom.id, teacher_id=teacher.id))
+        session.add_all([ClassroomStudentLink(classroom_id=classroom.id, student_id=s.id) for s in members])
+        session.commit()
+        created.append((classroom, members))
+    return created
+
+
+def roster_queries(client, session, make_user, classrooms, students):
+    teacher = make_user("teacher")
+    created = make_classrooms(session, make_user, teacher, classrooms, students)
+    headers = login(client, teacher.username)
+    admin = login(client, make_user("admin").username)
+    after_previous = {"cursor": encode_cursor([created[0][0].id - 1]), "limit": classrooms}
+
+    counts = {}
+    for name, url, params, who in [
+        ("classrooms", "/classrooms", {}, headers),
+        ("teacher students", "/teacher/students", {}, headers),
+        ("classrooms with users", "/classrooms-with-users", after_previous, admin),
+    ]:
+        with count_queries() as statements:
+            response = client.get(url, params=params, headers=who)
+        assert response.status_code == 200
+        counts[name] = len(statements)
+    return counts
+
+
+def test_roster_queries_do_not_grow_with_classrooms(client, session, make_user):
+    small = roster_queries(client, session, make_user, 1, 1)
+    assert small == roster_queries(client, session, make_user, 4, 7)
+    assert small == {"classrooms": 3, "teacher students": 2, "classrooms with users": 4}
+
+
+def test_rosters_list_every_member(client, session, make_user):
+    teacher = make_user("teacher")
+    created = make_classrooms(session, make_user, teacher, 2, 7)
+    headers = login(client, teacher.username)
+
+    listed = client.get("/classrooms", headers=headers).json()
+    assert [entry["classroom"]["id"] for entry in listed] == [classroom.id for classroom, _ in created]
+    for entry, (classroom, members) in zip(listed, created):
+        assert entry["teachers"] == [{"id": teacher.id, "username": teacher.username}]
+        assert entry["students"] == [{"id": s.id, "username": s.username} for s in members]
+
+    rosters = client.get("/teacher/students", headers=headers).json()
+    assert {r["classroom_id"]: sorted(s["id"] for s in r["students"]) for r in rosters} == {
+        classroom.id: [s.id for s in members] for classroom, members in created
+    }
+
+    admin = login(client, make_user("admin").username)
+    params = {"cursor": encode_cursor([created[0][0].id - 1]), "limit": 2}
+    previews = client.get("/classrooms-with-users", params=params, headers=admin).json()
+    for preview, (classroom, members) in zip(previews, created):
+        assert preview["id"] == classroom.id
+        assert preview["students"] == [{"id": s.id, "username": s.username} for s in members[:5]]
+        assert preview["total_students"] == 7
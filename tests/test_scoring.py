@@ -0,0 +1,54 @@
+# testquest/tests/test_scoring.py
+from autosave import autosave_buffer
+from conftest import login, question_ids
+
+
+def test_attempt_counts_unanswered_questions_as_wrong(client, session, make_user, make_test):
+    test = make_test(questions=2)
+    headers = login(client, make_user().username)
+    attempt = client.post("/student/attempts", json={"test_id": test.id}, headers=headers).json()
+    first = question_ids(session, test)[0]
+
+    client.put(f"/student/attempts/{attempt['id']}/answers",
+               json={"answers": [{"question_id": first, "selected_choice": "B"}]}, headers=headers)
+    result = client.post(f"/student/attempts/{attempt['id']}/submit", headers=headers).json()
+    assert result["score"] == 50
+
+
+def test_cleared_answer_counts_as_wrong(client, session, make_user, make_test):
+    test = make_test(questions=2)
+    headers = login(client, make_user().username)
+    attempt = client.post("/student/attempts", json={"test_id": test.id}, headers=headers).json()
+    first, second = question_ids(session, test)
+
+    answers_url = f"/student/attempts/{attempt['id']}/answers"
+    client.put(answers_url, json={"answers": [{"question_id": first, "selected_choice": "B"},
+                                              {"question_id": second, "selected_choice": "B"}]}, headers=headers)
+    autosave_buffer.flush()
+    client.put(answers_url, json={"answers": [{"question_id": second, "selected_choice": None}]}, headers=headers)
+    result = client.post(f"/student/attempts/{attempt['id']}/submit", headers=headers).json()
+    assert result["score"] == 50
+
+
+def test_legacy_submit_counts_unanswered_questions_as_wrong(client, session, make_user, make_test):
+    test = make_test(questions=4)
+    headers = login(client, make_user().username)
+    first = question_ids(session, test)[0]
+
+    response = client.post("/student/submit", headers=headers, json={
+        "test_id": test.id, "answers": [{"question_id": first, "selected_choice": "B"}],
+    })
+    assert response.json()["score"] == 25
+
+
+def test_legacy_submit_rejects_repeated_answers(client, session, make_user, make_test):
+    test = make_test(questions=4)
+    headers = login(client, make_user().username)
+    first = question_ids(session, test)[0]
+
+    response = client.post("/student/submit", headers=headers, json={
+        "test_id": test.id, "answers": [{"question_id": first, "selected_choice": "B"}] * 10,
+    })
+    assert response.status_code == 400
+    # Rejected before the attempt is recorded
+    assert client.get(f"/student/tests/attempts/{test.id}", headers=headers).json() == {"attempt_count": 0}
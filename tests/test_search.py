@@ -0,0 +1,123 @@
+# testquest/tests/test_search.py
+import pytest
+
+from conftest import login
+from models import Question, User
+from search import fts_query
+
+
+@pytest.fixture
+def admin(client, make_user):
+    return login(client, make_user("admin").username)
+
+
+def search_questions(client, headers, q, **params):
+    response = client.get("/questions/search", params={"q": q, **params}, headers=headers)
+    assert response.status_code == 200
+    return [row["id"] for row in response.json()]
+
+
+def search_users(client, headers, q, **params):
+    response = client.get("/admin/users/search", params={"q": q, **params}, headers=headers)
+    assert response.status_code == 200
+    return [row["id"] for row in response.json()]
+
+
+def add_question(session, test, text, explanation=""):
+    question = Question(test_id=test.id, order=99, question_text=text, choices='{"A": "1"}',
+                        correct_choice="A", explanation=explanation)
+    session.add(question)
+    session.commit()
+    session.refresh(question)
+    return question
+
+
+def test_fts_query_quotes_every_word():
+    assert fts_query('say "hi" OR (x*') == '"say"* """hi"""* "OR"* "(x*"*'
+    assert fts_query("   ") is None
+
+
+@pytest.mark.parametrize("q", ['"', "*", "OR AND NOT (", 'NEAR("a" "b")', "-", "a:b"])
+def test_operators_in_queries_are_plain_text(client, admin, q):
+    assert search_questions(client, admin, q) == []
+    assert search_users(client, admin, q) == []
+
+
+def test_question_index_follows_inserts_updates_and_deletes(client, session, admin, make_test):
+    test = make_test(questions=0)
+    question = add_question(session, test, "Describe quasarite formation", explanation="Mention zylophine")
+
+    assert search_questions(client, admin, "quasar") == [question.id]
+    assert search_questions(client, admin, "zylo") == [question.id]
+
+    question.question_text = "Describe plasmoidite formation"
+    session.add(question)
+    session.commit()
+    assert search_questions(client, admin, "quasarite") == []
+    assert search_questions(client, admin, "plasmoid") == [question.id]
+    # Edits to columns outside the index leave the entry intact
+    question.order = 100
+    session.add(question)
+    session.commit()
+    assert search_questions(client, admin, "plasmoid") == [question.id]
+
+    session.delete(question)
+    session.commit()
+    assert search_questions(client, admin, "plasmoid") == []
+
+
+def test_questions_rank_by_relevance_and_filter_by_test(client, session, admin, make_test):
+    test, other = make_test(questions=0), make_test(questions=0)
+    weak = add_question(session, test, "Which of these long and winding options mentions ferrovane once")
+    strong = add_question(session, test, "Ferrovane ferrovane", explanation="ferrovane")
+    elsewhere = add_question(session, other, "Ferrovane")
+
+    assert search_questions(client, admin, "ferrovane", test_id=test.id) == [strong.id, weak.id]
+    assert elsewhere.id in search_questions(client, admin, "ferrovane")
+    assert search_questions(client, admin, "ferrovane", test_id=test.id, limit=1) == [strong.id]
+
+
+def test_all_words_must_match(client, session, admin, make_test):
+    test = make_test(questions=0)
+    both = add_question(session, test, "Gravimetric titrolux analysis")
+    add_question(session, test, "Gravimetric methods")
+
+    assert search_questions(client, admin, "titrolux grav") == [both.id]
+
+
+def test_user_index_follows_inserts_updates_and_deletes(client, session, admin):
+    user = User(username="searchable-user", password="pw", role="student",
+                first_name="Oriane", last_name="Quillfeather", email="oq@example.test")
+    session.add(user)
+    session.commit()
+    session.refresh(user)
+
+    assert search_users(client, admin, "quill") == [user.id]
+    assert search_users(client, admin, "oriane quill", role="student") == [user.id]
+    assert search_users(client, admin, "quill", role="teacher") == []
+
+    user.last_name = "Brightwater"
+    session.add(user)
+    session.commit()
+    assert search_users(client, admin, "quill") == []
+    assert search_users(client, admin, "brightw") == [user.id]
+
+    session.delete(user)
+    session.commit()
+    assert search_users(client, admin, "brightw") == []
+
+
+def test_users_rank_by_relevance(client, session, admin):
+    exact = User(username="vantablue", password="pw", role="student", first_name="Vantablue")
+    partial = User(username="vantablue-fan-club-member", password="pw", role="student",
+                   email="someone.vantablue.lover@example.test")
+    session.add_all([partial, exact])
+    session.commit()
+
+    assert search_users(client, admin, "vantablue") == [exact.id, partial.id]
+
+
+def test_search_requires_staff(client, make_user):
+    student = login(client, make_user().username)
+    assert client.get("/questions/search", params={"q": "x"}, headers=student).status_code == 403
+    assert client.get("/admin/users/search", params={"q": "x"}, headers=student).status_code == 403
@@ -0,0 +1,42 @@
+# testquest/tests/test_serialization.py
+import json
+from datetime import datetime
+
+import pytest
+
+import serialization
+from conftest import login
+from models import Classroom
+from serialization import dumps
+
+
+@pytest.fixture
+def admin(client, make_user):
+    return login(client, make_user("admin").username)
+
+
+def test_dumps_encodes_models_datetimes_and_int_keys():
+    classroom = Classroom(id=1, name="Café", created_at=datetime(2024, 1, 2, 3, 4, 5, 6))
+    assert json.loads(dumps({1: classroom})) == {
+        "1": {"id": 1, "name": "Café", "created_at": "2024-01-02T03:04:05.000006"}
+    }
+    with pytest.raises(TypeError):
+        dumps({"value": object()})
+
+
+@pytest.mark.parametrize("params", [{}, {"fields": "name"}, {"limit": 2, "include_total": "true"}])
+def test_fast_path_matches_the_default_encoder(client, admin, make_test, monkeypatch, params):
+    for _ in range(3):
+        make_test(questions=0)
+
+    fast = client.get("/tests", params=params, headers=admin)
+    monkeypatch.setattr(serialization, "FAST_JSON", False)
+    default = client.get("/tests", params=params, headers=admin)
+
+    assert fast.status_code == default.status_code == 200
+    assert fast.json() == default.json()
+    assert fast.headers["content-type"] == default.headers["content-type"] == "application/json"
+    # Pagination headers set on the injected response survive the fast path
+    for header in ("x-next-cursor", "x-total-count"):
+        assert fast.headers.get(header) == default.headers.get(header)
+    assert int(fast.headers["content-length"]) == len(fast.content)
@@ -0,0 +1,64 @@
+# testquest/tests/test_shuffling.py
+import shuffling
+from conftest import login, question_ids
+from shuffling import attempt_seed, load_shuffle_key, shuffled
+
+
+def shown_questions(client, headers, test, attempt_id):
+    response = client.get(f"/student/test/{test.id}", params={"attempt_id": attempt_id}, headers=headers)
+    assert response.status_code == 200
+    return response.json()["questions"]
+
+
+def start_and_submit(client, headers, test):
+    attempt = client.post("/student/attempts", json={"test_id": test.id}, headers=headers).json()
+    questions = shown_questions(client, headers, test, attempt["id"])
+    assert client.post(f"/student/attempts/{attempt['id']}/submit", headers=headers).status_code == 200
+    return questions
+
+
+def test_shuffle_is_deterministic_per_seed():
+    items = list(range(20))
+    assert shuffled(items, 42) == shuffled(items, 42)
+    assert shuffled(items, 42, salt=1) == shuffled(items, 42, salt=1)
+    assert sorted(shuffled(items, 42)) == items
+    assert shuffled(items, 42) != shuffled(items, 43)
+
+
+def test_seeds_survive_reloading_the_key(session):
+    load_shuffle_key(session)
+    before = attempt_seed(1, 2, 3)
+
+    # A restart forgets the key and loads it back from the database
+    shuffling._shuffle_key = None
+    load_shuffle_key(session)
+    assert attempt_seed(1, 2, 3) == before
+    assert attempt_seed(1, 2, 4) != before
+
+
+def test_attempts_see_different_orders(client, session, make_user, make_test):
+    test = make_test(questions=12, max_attempts=5, shuffle_questions=True, shuffle_choices=True)
+    headers = login(client, make_user().username)
+
+    orders = [[q["id"] for q in start_and_submit(client, headers, test)] for _ in range(3)]
+    assert all(sorted(order) == question_ids(session, test) for order in orders)
+    assert len({tuple(order) for order in orders}) > 1
+
+
+def test_resuming_an_attempt_keeps_its_order(client, make_user, make_test):
+    test = make_test(questions=12, shuffle_questions=True, shuffle_choices=True)
+    headers = login(client, make_user().username)
+
+    attempt = client.post("/student/attempts", json={"test_id": test.id}, headers=headers).json()
+    preview = client.get(f"/student/test/{test.id}", headers=headers).json()["questions"]
+    assert shown_questions(client, headers, test, attempt["id"]) == preview
+    assert shown_questions(client, headers, test, attempt["id"]) == preview
+
+
+def test_shuffled_order_field_is_the_shown_position(client, session, make_user, make_test):
+    test = make_test(questions=12, shuffle_questions=True)
+    headers = login(client, make_user().username)
+
+    questions = client.get(f"/student/test/{test.id}", headers=headers).json()["questions"]
+    assert [q["id"] for q in questions] != question_ids(session, test)
+    assert [q["order"] for q in questions] == list(range(1, 13))
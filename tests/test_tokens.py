@@ -0,0 +1,88 @@
+# testquest/tests/test_tokens.py
+import pytest
+
+import security
+from conftest import login
+from models import User
+
+
+def whoami(client, headers):
+    return client.get("/student/tests/attempts/1", headers=headers).status_code
+
+
+def restart(session):
+    """Drop the in-memory revocations and reload them as a fresh worker would."""
+    security._min_generations.clear()
+    security.load_token_generations(session)
+
+
+@pytest.fixture
+def admin(client, make_user):
+    return login(client, make_user("admin").username)
+
+
+def test_edited_user_tokens_stay_revoked_after_reload(client, session, make_user, admin):
+    student = make_user()
+    old = login(client, student.username)
+
+    response = client.put(f"/admin/user/{student.id}", json={"password": "new"}, headers=admin)
+    assert response.status_code == 200
+    new = login(client, student.username, "new")
+    assert whoami(client, old) == 401
+    assert whoami(client, new) == 200
+
+    restart(session)
+    assert whoami(client, old) == 401
+    assert whoami(client, new) == 200
+
+
+def test_deleted_user_id_is_not_reused(client, session, make_user, admin):
+    student = make_user()
+    student_id, old = student.id, login(client, student.username)
+
+    assert client.delete(f"/admin/user/{student_id}", headers=admin).status_code == 204
+    assert whoami(client, old) == 401
+
+    newcomer = make_user()
+    assert newcomer.id > student_id
+    fresh = login(client, newcomer.username)
+    assert whoami(client, fresh) == 200
+
+    restart(session)
+    assert whoami(client, old) == 401
+    assert whoami(client, fresh) == 200
+
+
+def test_revocation_applies_only_after_commit(client, session, make_user):
+    student = make_user()
+    headers = login(client, student.username)
+
+    security.revoke_tokens(session, session.get(User, student.id))
+    assert whoami(client, headers) == 200
+    session.rollback()
+    assert whoami(client, headers) == 200
+    restart(session)
+    assert whoami(client, headers) == 200
+
+    security.revoke_tokens(session, session.get(User, student.id))
+    session.commit()
+    assert whoami(client, headers) == 401
+
+
+@pytest.mark.parametrize("token", [
+    "", ".", "abc", "abc.def", "abc.\xe9\xe9", "\xe9\xe9.\xe9", "abc.\ud800", "\ud800.abc", "a.b.c",
+])
+def test_malformed_tokens_are_rejected(token):
+    assert security.verify_token(token) is None
+
+
+@pytest.mark.parametrize("token", ["abc.def", "abc.\xe9\xe9", "\xe9.\xe9"])
+def test_malformed_bearer_tokens_get_401(client, token):
+    # Raw bytes, as a client would send them; the server decodes headers as latin-1
+    assert whoami(client, {"Authorization": f"Bearer {token}".encode("latin-1")}) == 401
+
+
+def test_forged_signature_is_rejected(client, make_user):
+    headers = login(client, make_user().username)
+    body = headers["Authorization"].removeprefix("Bearer ").partition(".")[0]
+    assert security.verify_token(f"{body}.{'A' * 43}") is None
@@ -0,0 +1,148 @@
+# testquest/tests/test_uploads.py
+import asyncio
+import hashlib
+import os
+
+import pytest
+from fastapi import HTTPException
+from sqlmodel import select
+
+import storage
+from conftest import login, png_bytes, upload_image as upload
+from database import engine
+from migrations import store_legacy_images
+from models import Question
+
+
+def test_image_type_comes_from_magic_bytes(client, teacher_headers):
+    response = upload(client, teacher_headers, png_bytes(), filename="photo.jpg", content_type="image/jpeg")
+    assert response.status_code == 200
+    assert response.json()["url"].endswith(".png")
+
+
+def test_non_image_with_image_content_type_is_rejected(client, teacher_headers):
+    assert upload(client, teacher_headers, b"<script>alert(1)</script>").status_code == 415
+
+
+def test_upload_requires_a_teacher(client, make_user):
+    assert upload(client, {}, png_bytes()).status_code == 401
+    assert upload(client, login(client, make_user().username), png_bytes()).status_code == 403
+
+
+def multipart_chunks(size: int):
+    yield b'--x\r\nContent-Disposition: form-data; name="file"; filename="big.png"\r\n\r\n\x89PNG\r\n\x1a\n'
+    for _ in range(size // storage.UPLOAD_CHUNK_SIZE + 1):
+        yield b"\0" * storage.UPLOAD_CHUNK_SIZE
+    yield b"\r\n--x--\r\n"
+
+
+MULTIPART = {"Content-Type": "multipart/form-data; boundary=x"}
+
+
+def test_oversized_content_length_is_rejected(client, teacher_headers):
+    body = b"".join(multipart_chunks(storage.MAX_UPLOAD_BYTES))
+    response = client.post("/upload-question-image", content=body, headers={**MULTIPART, **teacher_headers})
+    assert response.status_code == 413
+
+
+def test_oversized_chunked_upload_is_cut_off(client, teacher_headers):
+    response = client.post(
+        "/upload-question-image", content=multipart_chunks(storage.MAX_UPLOAD_BYTES),
+        headers={**MULTIPART, **teacher_headers},
+    )
+    assert response.status_code == 413
+
+
+def test_cut_off_reports_the_applied_limit():
+    async def body():
+        yield b"\0" * (100 + storage.MULTIPART_OVERHEAD_BYTES + 1)
+
+    async def receive():
+        async for _ in storage._limited(body(), max_bytes=100):
+            pass
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(receive())
+    assert exc.value.status_code == 413
+    assert exc.value.detail == "File exceeds the 100 byte upload limit"
+
+
+@pytest.mark.parametrize("head, extension", [
+    (b"\x89PNG\r\n\x1a\n....", ".png"),
+    (b"\xff\xd8\xff\xe0....", ".jpg"),
+    (b"GIF89a....", ".gif"),
+    (b"RIFF\x00\x00\x00\x00WEBPVP8 ", ".webp"),
+    (b"%PDF-1.7", None),
+])
+def test_sniff_image_extension(head, extension):
+    assert storage.sniff_image_extension(head) == extension
+
+
+def test_stored_images_are_immutable_and_revalidate_by_etag(client, teacher_headers):
+    url = upload(client, teacher_headers, png_bytes()).json()["url"]
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.content == png_bytes()
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    etag = response.headers["etag"]
+
+    not_modified = client.get(url, headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+
+def test_stored_images_serve_byte_ranges(client, teacher_headers):
+    url = upload(client, teacher_headers, png_bytes()).json()["url"]
+    size = len(png_bytes())
+
+    partial = client.get(url, headers={"Range": "bytes=0-7"})
+    assert partial.status_code == 206
+    assert partial.content == png_bytes()[:8]
+    assert partial.headers["content-range"] == f"bytes 0-7/{size}"
+
+    assert client.get(url, headers={"Range": "bytes=-4"}).content == png_bytes()[-4:]
+    assert client.get(url, headers={"Range": f"bytes={size}-"}).status_code == 416
+    # A stale If-Range gets the whole file
+    assert client.get(url, headers={"Range": "bytes=0-7", "If-Range": '"other"'}).status_code == 200
+
+
+def test_legacy_uploads_are_served_without_immutable_caching(client):
+    with open(os.path.join(storage.UPLOAD_DIR, "old diagram.png"), "wb") as handle:
+        handle.write(png_bytes())
+
+    response = client.get("/uploaded_images/old diagram.png")
+    assert response.status_code == 200
+    assert response.content == png_bytes()
+    assert response.headers["cache-control"] == "no-cache"
+    etag = response.headers["etag"]
+    assert client.get("/uploaded_images/old diagram.png", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/uploaded_images/old diagram.png", headers={"Range": "bytes=0-7"}).status_code == 206
+
+
+@pytest.mark.parametrize("name", ["missing.png", ".upload-abc", "notes.html", "..%2Fsecret.png"])
+def test_unknown_legacy_names_are_not_served(client, name):
+    with open(os.path.join(storage.UPLOAD_DIR, "notes.html"), "w") as handle:
+        handle.write("<script></script>")
+    assert client.get(f"/uploaded_images/{name}").status_code == 404
+
+
+def test_legacy_image_links_are_moved_to_stored_names(session, make_test):
+    test = make_test(questions=2)
+    questions = session.exec(select(Question).where(Question.test_id == test.id)).all()
+    with open(os.path.join(storage.UPLOAD_DIR, "legacy.png"), "wb") as handle:
+        handle.write(png_bytes())
+    questions[0].image_url = "/uploaded_images/legacy.png"
+    questions[1].image_url = "/uploaded_images/gone.png"
+    session.add_all(questions)
+    session.commit()
+
+    with engine.begin() as conn:
+        store_legacy_images(conn)
+    session.expire_all()
+
+    digest = hashlib.sha256(png_bytes()).hexdigest()
+    assert questions[0].image_url == f"/uploaded_images/{digest[:2]}/{digest}.png"
+    # Links whose file is gone are left for the legacy route to 404
+    assert questions[1].image_url == "/uploaded_images/gone.png"
+    assert os.path.exists(os.path.join(storage.UPLOAD_DIR, "legacy.png"))
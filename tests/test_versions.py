@@ -0,0 +1,60 @@
+# testquest/tests/test_versions.py
+import threading
+
+from sqlmodel import Session
+
+from conftest import login
+from database import engine
+from grading import answer_key_cache, bump_test_version, get_answer_key
+import models
+from models import User
+
+
+def test_concurrent_bumps_are_not_lost(session, make_test):
+    test = make_test()
+    start = test.version
+    barrier = threading.Barrier(6)
+
+    def bump():
+        with Session(engine) as worker:
+            barrier.wait()
+            bump_test_version(worker, worker.get(models.Test, test.id))
+            worker.commit()
+
+    threads = [threading.Thread(target=bump) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    session.refresh(test)
+    assert test.version == start + 6
+
+
+def test_old_version_is_evicted_only_after_commit(session, make_test):
+    test = make_test()
+    old_key = (test.id, test.version)
+    get_answer_key(session, test)
+    assert answer_key_cache.get(old_key) is not None
+
+    bump_test_version(session, test)
+    assert answer_key_cache.get(old_key) is not None
+    session.rollback()
+    assert answer_key_cache.get(old_key) is not None
+
+    bump_test_version(session, session.get(models.Test, test.id))
+    session.commit()
+    assert answer_key_cache.get(old_key) is None
+
+
+def test_added_question_is_graded_with_the_new_key(client, session, make_test):
+    test = make_test(questions=1)
+    teacher = login(client, session.get(User, test.created_by).username)
+    get_answer_key(session, test)
+
+    response = client.post(f"/tests/{test.id}/questions", headers=teacher, json={
+        "test_id": test.id, "question_text": "Q", "choices": '{"A": "1", "B": "2"}',
+        "correct_choice": "A", "explanation": "",
+    })
+    assert response.status_code == 200
+    session.refresh(test)
+    assert len(get_answer_key(session, test)) == 2